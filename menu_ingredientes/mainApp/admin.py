@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock
+from .models import (
+    CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, AlertaStock, MovimientoStock, Sucursal
+)
+
+@admin.register(Sucursal)
+class SucursalAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'activa']
+    list_filter = ['activa']
+    search_fields = ['nombre']
 
 @admin.register(CategoriaMenu)
 class CategoriaMenuAdmin(admin.ModelAdmin):
@@ -8,28 +16,47 @@ class CategoriaMenuAdmin(admin.ModelAdmin):
 
 @admin.register(Ingrediente)
 class IngredienteAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'unidad_medida', 'stock_minimo']
+    list_display = [
+        'nombre', 'unidad_medida', 'stock_minimo', 'costo_unitario', 'densidad', 'peso_unidad', 'fragmentos_stock'
+    ]
     list_filter = ['unidad_medida']
     search_fields = ['nombre']
 
 class RecetaInline(admin.TabularInline):
     model = Receta
     extra = 1
+    # Se calcula al guardar a partir de cantidad y unidad_medida
+    readonly_fields = ['cantidad_base']
 
 @admin.register(Plato)
 class PlatoAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'precio', 'categoria', 'activo']
-    list_filter = ['categoria', 'activo']
+    list_display = ['nombre', 'precio', 'costo', 'costo_completo', 'categoria', 'activo']
+    list_filter = ['categoria', 'activo', 'costo_completo']
     search_fields = ['nombre']
+    # Los calcula CostoService a partir de las recetas
+    readonly_fields = ['costo', 'costo_completo']
     inlines = [RecetaInline]
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
-    list_display = ['ingrediente', 'cantidad_disponible']
+    list_display = ['ingrediente', 'sucursal', 'cantidad_disponible', 'bajo_minimo']
+    list_filter = ['sucursal', 'bajo_minimo']
     search_fields = ['ingrediente__nombre']
 
 @admin.register(ReservaStock)
 class ReservaStockAdmin(admin.ModelAdmin):
-    list_display = ['plato', 'cantidad', 'estado', 'fecha_creacion', 'pedido_id']
-    list_filter = ['estado', 'fecha_creacion']
+    list_display = ['plato', 'sucursal', 'cantidad', 'estado', 'fecha_creacion', 'pedido_id']
+    list_filter = ['sucursal', 'estado', 'fecha_creacion']
     search_fields = ['plato__nombre', 'pedido_id']
+
+@admin.register(AlertaStock)
+class AlertaStockAdmin(admin.ModelAdmin):
+    list_display = ['ingrediente', 'sucursal', 'tipo', 'cantidad_disponible', 'stock_minimo', 'fecha_creacion']
+    list_filter = ['sucursal', 'tipo', 'fecha_creacion']
+    search_fields = ['ingrediente__nombre']
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ['ingrediente', 'sucursal', 'tipo', 'cantidad', 'referencia', 'fecha']
+    list_filter = ['sucursal', 'tipo', 'fecha']
+    search_fields = ['ingrediente__nombre', 'referencia']
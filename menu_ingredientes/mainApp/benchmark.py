@@ -0,0 +1,535 @@
+import json
+import math
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import matriz_recetas
+from .matriz_recetas import invalidar_recetas
+from .menu_cache import invalidar_menu, invalidar_stock
+from .models import CategoriaMenu, Ingrediente, MarcaProceso, Plato, Receta, ReservaStock, Stock, Sucursal
+from .pronostico import PROCESO, PronosticoService
+from .services import CostoService, ImportadorStock
+
+
+# CARGA SINTÉTICA
+# sembrar() crea un catálogo sintético (categorías, ingredientes con stock y
+# platos con recetas) con nombres que empiezan por un prefijo, así limpiar()
+# puede borrarlo sin tocar datos reales. ejecutar() corre un escenario contra
+# la API con N workers (un hilo, un Client y una conexión a la base por
+# worker) y mide latencia, consultas y espera en bloqueos de cada request.
+
+PREFIJO = 'Bench'
+
+
+def sembrar(platos=1000, ingredientes=500, recetas_por_plato=5, categorias=10,
+            stock=Decimal('1000000'), prefijo=PREFIJO, semilla=0, batch_size=2000):
+    """
+    Devuelve el catálogo creado: {'categorias': [ids], 'platos': [ids],
+    'ingredientes': [ids]}.
+    """
+    rng = random.Random(semilla)
+    lote = uuid.uuid4().hex[:6]
+
+    nuevas = CategoriaMenu.objects.bulk_create(
+        [CategoriaMenu(nombre=f'{prefijo} {lote} categoría {i}') for i in range(categorias)],
+        batch_size=batch_size
+    )
+    insumos = Ingrediente.objects.bulk_create(
+        [Ingrediente(nombre=f'{prefijo} {lote} ingrediente {i}', unidad_medida='un') for i in range(ingredientes)],
+        batch_size=batch_size
+    )
+    Stock.objects.bulk_create(
+        [Stock(ingrediente=ingrediente, cantidad_disponible=stock) for ingrediente in insumos],
+        batch_size=batch_size
+    )
+    menu = Plato.objects.bulk_create(
+        [
+            Plato(
+                nombre=f'{prefijo} {lote} plato {i}',
+                descripcion='',
+                precio=Decimal(rng.randint(500, 5000)) / 100,
+                categoria=nuevas[i % categorias]
+            )
+            for i in range(platos)
+        ],
+        batch_size=batch_size
+    )
+    por_plato = min(recetas_por_plato, ingredientes)
+    recetas = []
+    for plato in menu:
+        for ingrediente in rng.sample(insumos, por_plato):
+            # Recetas en la unidad del ingrediente: cantidad_base es la misma
+            cantidad = Decimal(rng.randint(1, 20)) / 10
+            recetas.append(Receta(plato=plato, ingrediente=ingrediente, cantidad=cantidad, cantidad_base=cantidad))
+    Receta.objects.bulk_create(recetas, batch_size=batch_size)
+
+    # bulk_create no dispara signals
+    invalidar_menu()
+    invalidar_stock()
+    invalidar_recetas([plato.pk for plato in menu])
+    CostoService().recalcular(plato_ids=[plato.pk for plato in menu])
+    return {
+        'categorias': [categoria.pk for categoria in nuevas],
+        'platos': [plato.pk for plato in menu],
+        'ingredientes': [ingrediente.pk for ingrediente in insumos],
+    }
+
+
+def limpiar(prefijo=PREFIJO):
+    """
+    Borra el catálogo sintético (y en cascada sus recetas, stock, reservas
+    y movimientos).
+    """
+    Plato.objects.filter(nombre__startswith=f'{prefijo} ').delete()
+    Ingrediente.objects.filter(nombre__startswith=f'{prefijo} ').delete()
+    CategoriaMenu.objects.filter(nombre__startswith=f'{prefijo} ').delete()
+    Sucursal.objects.filter(nombre__startswith=f'{prefijo} ').delete()
+
+
+# ESCENARIOS
+def _menu(cliente, rng, catalogo):
+    return cliente.get(reverse('plato-list'))
+
+
+def _menu_por_categoria(cliente, rng, catalogo):
+    return cliente.get(reverse('plato-list'), {'categoria': rng.choice(catalogo['categorias'])})
+
+
+def _disponibilidad(cliente, rng, catalogo):
+    return cliente.get(reverse('plato-disponibilidad'))
+
+
+def _reservar(cliente, rng, catalogo):
+    return cliente.post(
+        reverse('stock-validar-reservar'),
+        {
+            'plato_id': rng.choice(catalogo['platos']),
+            'cantidad': 1,
+            'pedido_id': f'{PREFIJO}-{uuid.uuid4().hex}'
+        },
+        content_type='application/json'
+    )
+
+
+def _pedido(cliente, rng, catalogo):
+    platos = rng.sample(catalogo['platos'], min(3, len(catalogo['platos'])))
+    return cliente.post(
+        reverse('stock-validar-reservar-pedido'),
+        {
+            'pedido_id': f'{PREFIJO}-{uuid.uuid4().hex}',
+            'lineas': [{'plato_id': plato_id, 'cantidad': 1} for plato_id in platos]
+        },
+        content_type='application/json'
+    )
+
+
+ESCENARIOS = {
+    'menu': _menu,
+    'menu_por_categoria': _menu_por_categoria,
+    'disponibilidad': _disponibilidad,
+    'reservar': _reservar,
+    'pedido': _pedido,
+}
+
+
+# EJECUCIÓN Y MÉTRICAS
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+
+def _correr_worker(escenario, catalogo, requests, semilla, hilo_propio):
+    """
+    Devuelve una muestra por request: (latencia_ms, consultas, espera_ms, status).
+    La espera en bloqueos es el tiempo de las consultas SELECT ... FOR UPDATE.
+    """
+    rng = random.Random(semilla)
+    cliente = Client(raise_request_exception=False, HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    muestras = []
+    try:
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                respuesta = ESCENARIOS[escenario](cliente, rng, catalogo)
+                latencia = (time.perf_counter() - inicio) * 1000
+            espera = sum(
+                float(consulta['time']) * 1000
+                for consulta in consultas.captured_queries if 'FOR UPDATE' in consulta['sql']
+            )
+            muestras.append((latencia, len(consultas), espera, respuesta.status_code))
+    finally:
+        if hilo_propio:
+            connection.close()
+    return muestras
+
+
+def ejecutar(escenario, catalogo, workers=1, requests=100, semilla=0):
+    """
+    Corre `requests` requests por worker del escenario y devuelve el
+    resumen de métricas. Con un solo worker corre en el hilo actual.
+    """
+    if escenario not in ESCENARIOS:
+        raise ValueError(f"Escenario desconocido: {escenario}")
+
+    inicio = time.perf_counter()
+    if workers == 1:
+        muestras = _correr_worker(escenario, catalogo, requests, semilla, hilo_propio=False)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futuros = [
+                executor.submit(_correr_worker, escenario, catalogo, requests, semilla + numero, True)
+                for numero in range(workers)
+            ]
+            muestras = [muestra for futuro in futuros for muestra in futuro.result()]
+    duracion = time.perf_counter() - inicio
+
+    latencias = sorted(muestra[0] for muestra in muestras)
+    consultas = [muestra[1] for muestra in muestras]
+    esperas = sorted(muestra[2] for muestra in muestras)
+    return {
+        'escenario': escenario,
+        'workers': workers,
+        'requests': len(muestras),
+        'duracion_s': round(duracion, 3),
+        'throughput': round(len(muestras) / duracion, 1) if duracion else None,
+        'errores': sum(1 for muestra in muestras if muestra[3] >= 500),
+        'rechazos': sum(1 for muestra in muestras if 400 <= muestra[3] < 500),
+        'latencia_ms': {
+            'p50': round(_percentil(latencias, 50), 2),
+            'p90': round(_percentil(latencias, 90), 2),
+            'p99': round(_percentil(latencias, 99), 2),
+            'max': round(latencias[-1], 2),
+            'media': round(sum(latencias) / len(latencias), 2),
+        },
+        'consultas': {
+            'media': round(sum(consultas) / len(consultas), 2),
+            'max': max(consultas),
+        },
+        'espera_bloqueos_ms': {
+            'total': round(sum(esperas), 2),
+            'p99': round(_percentil(esperas, 99), 2),
+        },
+    }
+
+
+# DEMANDA AGREGADA
+# comparar_demanda() calcula los ingredientes que necesitan `pedidos` pedidos
+# del catálogo recorriendo las recetas del ORM plato por plato y con la
+# matriz de recetas compilada, y mide las dos cosas.
+
+def _demanda_orm(lineas):
+    demanda = {}
+    for plato_id, porciones in lineas:
+        for receta in Receta.objects.filter(plato_id=plato_id):
+            demanda[receta.ingrediente_id] = demanda.get(receta.ingrediente_id, 0) + receta.cantidad_base * porciones
+    return demanda
+
+
+def _medir_ms(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, round(min(tiempos), 3)
+
+
+def comparar_demanda(catalogo, pedidos=40, platos_por_pedido=3, repeticiones=5, semilla=0):
+    """
+    Devuelve los tiempos (ms, el mejor de `repeticiones`) de compilar la
+    matriz, actualizarla tras cambiar un plato y calcular la demanda de los
+    pedidos con el ORM y con la matriz.
+    """
+    rng = random.Random(semilla)
+    lineas = [
+        (rng.choice(catalogo['platos']), rng.randint(1, 4))
+        for _ in range(pedidos * platos_por_pedido)
+    ]
+
+    matriz_recetas.reiniciar()
+    inicio = time.perf_counter()
+    matriz = matriz_recetas.matriz_vigente()
+    compilar = (time.perf_counter() - inicio) * 1000
+
+    invalidar_recetas([catalogo['platos'][0]])
+    inicio = time.perf_counter()
+    matriz_recetas.matriz_vigente()
+    actualizar = (time.perf_counter() - inicio) * 1000
+
+    por_orm, orm = _medir_ms(lambda: _demanda_orm(lineas), repeticiones)
+    por_matriz, con_matriz = _medir_ms(lambda: matriz_recetas.matriz_vigente().demanda(lineas), repeticiones)
+    return {
+        'platos': len(matriz.plato_ids),
+        'ingredientes': len(matriz.ingrediente_ids),
+        'recetas': len(matriz.datos),
+        'lineas': len(lineas),
+        'compilar_ms': round(compilar, 3),
+        'actualizar_ms': round(actualizar, 3),
+        'orm_ms': orm,
+        'matriz_ms': con_matriz,
+        'aceleracion': round(orm / con_matriz, 1) if con_matriz else None,
+        'coinciden': por_orm == por_matriz,
+    }
+
+
+# HISTORIAL DE RESERVAS
+# sembrar_historial() genera reservas pasadas del catálogo en sucursales
+# nuevas para medir el pronóstico: `reservas_por_dia` por sucursal, repartidas
+# en las primeras HORAS_SERVICIO horas de cada día, con un 5% liberadas.
+
+HORAS_SERVICIO = 12
+
+
+def sembrar_historial(catalogo, dias=365, reservas_por_dia=300, sucursales=3, hasta=None,
+                      prefijo=PREFIJO, semilla=0, sucursal_ids=None):
+    """
+    Crea las reservas de los `dias` días anteriores a `hasta` (por defecto,
+    ahora). Devuelve {'sucursales': [ids], 'reservas': total}.
+    """
+    rng = random.Random(semilla)
+    lote = uuid.uuid4().hex[:6]
+    if sucursal_ids is None:
+        sucursal_ids = [
+            sucursal.pk for sucursal in Sucursal.objects.bulk_create(
+                [Sucursal(nombre=f'{prefijo} {lote} sucursal {i}') for i in range(sucursales)]
+            )
+        ]
+    hasta = (hasta or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    total = 0
+    for dia in range(dias, 0, -1):
+        fecha = hasta - timedelta(days=dia)
+        por_hora = {hora: [] for hora in range(HORAS_SERVICIO)}
+        for sucursal_id in sucursal_ids:
+            for numero in range(reservas_por_dia):
+                por_hora[rng.randrange(HORAS_SERVICIO)].append(ReservaStock(
+                    sucursal_id=sucursal_id,
+                    plato_id=rng.choice(catalogo['platos']),
+                    cantidad=rng.randint(1, 3),
+                    estado='liberado' if rng.random() < 0.05 else 'confirmado',
+                    pedido_id=f'{prefijo}-{lote}-{dia}-{numero}'
+                ))
+        # fecha_creacion es auto_now_add: cada hora se inserta junta y se
+        # corrige con un UPDATE sobre su rango de pk
+        for hora, reservas in por_hora.items():
+            if not reservas:
+                continue
+            creadas = ReservaStock.objects.bulk_create(reservas)
+            ReservaStock.objects.filter(pk__gte=creadas[0].pk, pk__lte=creadas[-1].pk).update(
+                fecha_creacion=fecha + timedelta(hours=hora)
+            )
+            total += len(creadas)
+    return {'sucursales': sucursal_ids, 'reservas': total}
+
+
+def medir_pronostico(catalogo, dias=365, reservas_por_dia=300, sucursales=3, semilla=0):
+    """
+    Siembra `dias` días de historial, lo resume entero (la primera corrida),
+    agrega un día más y lo resume de nuevo (una corrida nocturna) y calcula
+    las sugerencias de reposición de cada sucursal. Necesita una base sin
+    marca de agua del pronóstico. Devuelve los tiempos en segundos.
+    """
+    if MarcaProceso.objects.filter(proceso=PROCESO).exists():
+        raise ValueError("La base ya tiene una marca de agua del pronóstico: usar una base de prueba")
+
+    ayer = timezone.now() - timedelta(days=1)
+    inicio = time.perf_counter()
+    historial = sembrar_historial(
+        catalogo, dias=dias, reservas_por_dia=reservas_por_dia, sucursales=sucursales, hasta=ayer, semilla=semilla
+    )
+    sembrar = time.perf_counter() - inicio
+
+    service = PronosticoService()
+    try:
+        inicio = time.perf_counter()
+        completo = service.actualizar(hasta=ayer)
+        inicial = time.perf_counter() - inicio
+
+        nuevo = sembrar_historial(
+            catalogo, dias=1, reservas_por_dia=reservas_por_dia, sucursal_ids=historial['sucursales'],
+            semilla=semilla + 1
+        )
+        inicio = time.perf_counter()
+        incremental = service.actualizar()
+        nocturna = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        sugerencias = [service.sugerencias(sucursal_id) for sucursal_id in historial['sucursales']]
+        reposicion = time.perf_counter() - inicio
+    finally:
+        MarcaProceso.objects.filter(proceso=PROCESO).delete()
+
+    return {
+        'reservas': historial['reservas'] + nuevo['reservas'],
+        'sucursales': len(historial['sucursales']),
+        'sembrar_s': round(sembrar, 2),
+        'filas_iniciales': completo['filas'],
+        'inicial_s': round(inicial, 2),
+        'filas_nocturna': incremental['filas'],
+        'nocturna_s': round(nocturna, 2),
+        'sugerencias': sum(len(resultado['sugerencias']) for resultado in sugerencias),
+        'reposicion_s': round(reposicion, 2),
+    }
+
+
+# COSTOS
+def medir_costos(catalogo, cambios=300, semilla=0):
+    """
+    Importa costo_unitario para todos los ingredientes del catálogo (la
+    carga inicial recalcula todos los platos) y después una actualización
+    diaria de precios de `cambios` ingredientes y el cambio de precio de un
+    solo ingrediente (Ingrediente.save()), que sólo recalculan los platos que
+    los usan. Compara con recalcular el costo de todo el menú. Devuelve los
+    tiempos en ms.
+    """
+    rng = random.Random(semilla)
+    ingredientes = list(
+        Ingrediente.objects.filter(pk__in=catalogo['ingredientes']).order_by('pk').values_list('pk', 'nombre')
+    )
+
+    def importar(nombres):
+        lineas = [
+            json.dumps({'nombre': nombre, 'costo_unitario': str(Decimal(rng.randint(10, 5000)) / 100)})
+            for nombre in nombres
+        ]
+        inicio = time.perf_counter()
+        ImportadorStock().importar(lineas, formato='jsonl')
+        return round((time.perf_counter() - inicio) * 1000, 3)
+
+    carga = importar([nombre for _, nombre in ingredientes])
+    cambiados = rng.sample(ingredientes, min(cambios, len(ingredientes)))
+    service = CostoService()
+    afectados = len(service.platos_con([pk for pk, _ in cambiados]))
+    actualizacion = importar([nombre for _, nombre in cambiados])
+
+    ingrediente = Ingrediente.objects.get(pk=cambiados[0][0])
+    ingrediente.costo_unitario += 1
+    inicio = time.perf_counter()
+    ingrediente.save()
+    un_cambio = round((time.perf_counter() - inicio) * 1000, 3)
+
+    inicio = time.perf_counter()
+    # Nada quedó desactualizado: el recálculo completo no cambia ningún plato
+    pendientes = service.recalcular(plato_ids=catalogo['platos'])
+    todo = round((time.perf_counter() - inicio) * 1000, 3)
+    return {
+        'platos': len(catalogo['platos']),
+        'ingredientes': len(ingredientes),
+        'cambios': len(cambiados),
+        'platos_recalculados': afectados,
+        'carga_ms': carga,
+        'actualizacion_ms': actualizacion,
+        'platos_un_cambio': len(service.platos_con([ingrediente.pk])),
+        'un_cambio_ms': un_cambio,
+        'recalcular_todo_ms': todo,
+        'coinciden': pendientes == 0,
+    }
+
+
+# CARGA HTTP
+# Para comparar servidores (gunicorn sync contra workers de uvicorn) la carga
+# tiene que pasar por la red: ejecutar_http() pega contra un servidor ya
+# levantado con `concurrencia` requests en vuelo a la vez.
+
+ENDPOINTS_HTTP = {
+    # escenario: (ruta WSGI, ruta ASGI)
+    'menu': ('/api/platos/', '/api/async/platos/'),
+    'disponibilidad': ('/api/platos/disponibilidad/', '/api/async/platos/disponibilidad/'),
+    'reservar': ('/api/stock/validar_reservar/', '/api/async/stock/validar_reservar/'),
+}
+
+
+def _request_http(url, catalogo, rng):
+    cuerpo = None
+    if url.endswith('/validar_reservar/'):
+        cuerpo = json.dumps({
+            'plato_id': rng.choice(catalogo['platos']),
+            'cantidad': 1,
+            'pedido_id': f'{PREFIJO}-{uuid.uuid4().hex}'
+        }).encode()
+    pedido = urllib.request.Request(url, data=cuerpo, headers={'Content-Type': 'application/json'})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=60) as respuesta:
+            respuesta.read()
+            estado = respuesta.status
+    except urllib.error.HTTPError as error:
+        estado = error.code
+    except OSError:
+        estado = 599
+    return (time.perf_counter() - inicio) * 1000, estado
+
+
+def ejecutar_http(url_base, servidor, escenario, catalogo, concurrencia=16, requests=500, semilla=0):
+    """
+    servidor es 'wsgi' o 'asgi' y elige la ruta del escenario. Devuelve
+    throughput, latencia p50/p99 y errores (5xx y fallas de conexión).
+    """
+    rutas = ENDPOINTS_HTTP[escenario]
+    url = url_base.rstrip('/') + rutas[servidor == 'asgi']
+    rng = random.Random(semilla)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        muestras = list(executor.map(lambda _: _request_http(url, catalogo, rng), range(requests)))
+    duracion = time.perf_counter() - inicio
+
+    latencias = sorted(muestra[0] for muestra in muestras)
+    return {
+        'servidor': servidor,
+        'escenario': escenario,
+        'concurrencia': concurrencia,
+        'requests': len(muestras),
+        'throughput': round(len(muestras) / duracion, 1) if duracion else None,
+        'errores': sum(1 for muestra in muestras if muestra[1] >= 500),
+        'latencia_ms': {
+            'p50': round(_percentil(latencias, 50), 2),
+            'p99': round(_percentil(latencias, 99), 2),
+        },
+    }
+
+
+def memoria_rss(pid):
+    """
+    RSS en MB del proceso y sus hijos (los workers de gunicorn), leído de
+    /proc. Devuelve None fuera de Linux.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    hijos = {}
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as archivo:
+                ppid = int(archivo.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        hijos.setdefault(ppid, []).append(int(entrada))
+
+    total, pendientes = 0, [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        pendientes += hijos.get(actual, [])
+        try:
+            with open(f'/proc/{actual}/status') as archivo:
+                for linea in archivo:
+                    if linea.startswith('VmRSS:'):
+                        total += int(linea.split()[1])
+        except OSError:
+            continue
+    return round(total / 1024, 1)
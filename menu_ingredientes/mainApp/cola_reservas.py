@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+# COLA DE RESERVAS (GROUP COMMIT)
+# Con RESERVA_MODO = 'cola' las reservas no abren una transacción cada una:
+# se encolan y un hilo del proceso las junta en lotes (hasta `lote_maximo`
+# solicitudes o `ventana` segundos desde la primera) y resuelve cada lote en
+# una sola transacción con StockService.reservar_lote. Quien reservó espera
+# el resultado de su solicitud, que llega después del commit del lote.
+#
+# La política decide en qué orden se atienden las solicitudes de un lote,
+# que importa cuando el stock no alcanza para todas:
+# - 'fifo': por orden de llegada.
+# - 'pedidos_chicos': primero los pedidos con menos porciones; con stock
+#   escaso atiende más pedidos, a costa de rechazar antes los grandes.
+# El orden sólo cambia dentro de un lote: una solicitud nunca espera más
+# de un lote.
+#
+# La cola agrupa solicitudes de un mismo proceso, así que sólo sirve con
+# workers que atienden varios requests a la vez (gunicorn con --threads o
+# workers gthread, o ASGI). Con workers sync cada proceso atiende un request
+# por vez: los lotes son de una solicitud y cada reserva espera la ventana
+# entera sin juntar nada; ahí corresponde RESERVA_MODO = 'directo'.
+
+def _porciones(solicitud):
+    return sum(cantidad for _, cantidad in solicitud.lineas)
+
+
+POLITICAS = {
+    'fifo': lambda solicitudes: solicitudes,
+    'pedidos_chicos': lambda solicitudes: sorted(solicitudes, key=_porciones),
+}
+
+
+class _Solicitud:
+    __slots__ = ('lineas', 'pedido_id', 'sucursal_id', 'futuro')
+
+    def __init__(self, lineas, pedido_id, sucursal_id):
+        self.lineas = lineas
+        self.pedido_id = pedido_id
+        self.sucursal_id = sucursal_id
+        self.futuro = Future()
+
+
+class ColaReservas:
+    """
+    procesar: función que recibe una lista de (lineas, pedido_id,
+    sucursal_id) y devuelve, en el mismo orden, el resultado o la excepción
+    de cada una.
+    """
+
+    def __init__(self, procesar, ventana=0.02, lote_maximo=200, politica='fifo', timeout=10):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de cola desconocida: {politica}")
+        self.procesar = procesar
+        self.ventana = ventana
+        self.lote_maximo = lote_maximo
+        self.ordenar = POLITICAS[politica]
+        self.timeout = timeout
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def encolar(self, lineas, pedido_id, sucursal_id=None):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._trabajar, name='cola-reservas', daemon=True)
+                self._hilo.start()
+        solicitud = _Solicitud(lineas, pedido_id, sucursal_id)
+        self._cola.put(solicitud)
+        return solicitud.futuro
+
+    def reservar(self, lineas, pedido_id, sucursal_id=None):
+        futuro = self.encolar(lineas, pedido_id, sucursal_id)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            # Puede confirmarse después: el reintento con el mismo pedido_id
+            # devuelve la reserva sin duplicarla
+            raise ValidationError("La reserva sigue en cola; reintentar con el mismo pedido_id")
+
+    def _siguiente_lote(self):
+        lote = [self._cola.get()]
+        limite = time.monotonic() + self.ventana
+        while len(lote) < self.lote_maximo:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _trabajar(self):
+        while True:
+            lote = self.ordenar(self._siguiente_lote())
+            try:
+                resultados = self.procesar([
+                    (solicitud.lineas, solicitud.pedido_id, solicitud.sucursal_id) for solicitud in lote
+                ])
+            except Exception as error:
+                logger.exception("Falló un lote de %s reservas", len(lote))
+                resultados = [error] * len(lote)
+                # El hilo vive lo que el proceso: la conexión se renueva
+                # después de un error en lugar de al final de cada request
+                connection.close()
+            for solicitud, resultado in zip(lote, resultados):
+                if isinstance(resultado, Exception):
+                    solicitud.futuro.set_exception(resultado)
+                else:
+                    solicitud.futuro.set_result(resultado)
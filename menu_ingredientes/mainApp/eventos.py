@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+# NOVEDADES DE STOCK Y MENÚ
+# Canal de eventos para pantallas de cocina y carteles de menú: en lugar de
+# pedir los listados completos, los clientes reciben sólo lo que cambió
+# (stock de los ingredientes tocados y disponibilidad de sus platos). Cada
+# evento tiene un id creciente; un cliente que se reconecta pide los eventos
+# posteriores al último que vio. Si ese id ya salió de la ventana retenida
+# (o el broker se reinició) recibe un evento 'reset' y debe recargar los
+# listados completos.
+#
+# EVENTOS_BROKER elige dónde viven los eventos:
+# - 'memoria': en el proceso. Con varios workers cada uno ve sólo lo que
+#   publicó él mismo.
+# - 'cache': en el cache de Django, compartido entre workers si el backend
+#   lo es (Redis, Memcached o base de datos). Los lectores consultan el cache
+#   cada INTERVALO_CACHE segundos.
+
+RETENCION_CACHE_SEGUNDOS = 600
+INTERVALO_CACHE = 0.5
+
+
+class BrokerMemoria:
+    def __init__(self, retencion):
+        self._eventos = deque(maxlen=retencion)
+        self._ultimo = 0
+        self._lock = threading.Lock()
+        # Lectores async esperando novedades: (loop, asyncio.Event)
+        self._esperando = set()
+
+    def ultimo(self):
+        return self._ultimo
+
+    def publicar(self, tipo, datos):
+        with self._lock:
+            self._ultimo += 1
+            self._eventos.append((self._ultimo, tipo, datos))
+            esperando = list(self._esperando)
+            evento_id = self._ultimo
+        for loop, aviso in esperando:
+            loop.call_soon_threadsafe(aviso.set)
+        return evento_id
+
+    def leer(self, desde):
+        """
+        Devuelve (ultimo_id, eventos posteriores a `desde`). eventos es None
+        si `desde` ya no se puede continuar (reset).
+        """
+        with self._lock:
+            if desde > self._ultimo or (self._eventos and desde < self._eventos[0][0] - 1):
+                return self._ultimo, None
+            return self._ultimo, [evento for evento in self._eventos if evento[0] > desde]
+
+    async def esperar(self, desde, timeout):
+        aviso = asyncio.Event()
+        clave = (asyncio.get_running_loop(), aviso)
+        with self._lock:
+            self._esperando.add(clave)
+        try:
+            ultimo, eventos = self.leer(desde)
+            if eventos == []:
+                try:
+                    await asyncio.wait_for(aviso.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                ultimo, eventos = self.leer(desde)
+            return ultimo, eventos
+        finally:
+            with self._lock:
+                self._esperando.discard(clave)
+
+
+class BrokerCache:
+    CLAVE_ULTIMO = 'eventos:ultimo'
+
+    def __init__(self, retencion):
+        self.retencion = retencion
+
+    def _clave(self, evento_id):
+        return f'eventos:{evento_id}'
+
+    def ultimo(self):
+        return cache.get(self.CLAVE_ULTIMO, 0)
+
+    def publicar(self, tipo, datos):
+        cache.add(self.CLAVE_ULTIMO, 0, None)
+        # incr es atómico en Redis y Memcached; en backends donde no lo es,
+        # add() garantiza que dos procesos no escriban el mismo id
+        while True:
+            evento_id = cache.incr(self.CLAVE_ULTIMO)
+            if cache.add(self._clave(evento_id), (tipo, datos), RETENCION_CACHE_SEGUNDOS):
+                return evento_id
+
+    def leer(self, desde):
+        ultimo = self.ultimo()
+        if desde > ultimo or ultimo - desde > self.retencion:
+            return ultimo, None
+        ids = range(desde + 1, ultimo + 1)
+        encontrados = cache.get_many([self._clave(evento_id) for evento_id in ids])
+        eventos = []
+        for evento_id in ids:
+            evento = encontrados.get(self._clave(evento_id))
+            if evento is None:
+                # Un hueco al final es un evento que todavía se está
+                # escribiendo; antes de eso, uno vencido
+                if not eventos and (encontrados or evento_id < ultimo):
+                    return ultimo, None
+                break
+            eventos.append((evento_id, *evento))
+        return (eventos[-1][0] if eventos else desde), eventos
+
+    async def esperar(self, desde, timeout):
+        limite = time.monotonic() + timeout
+        while True:
+            ultimo, eventos = await sync_to_async(self.leer)(desde)
+            restante = limite - time.monotonic()
+            if eventos != [] or restante <= 0:
+                return ultimo, eventos
+            await asyncio.sleep(min(INTERVALO_CACHE, restante))
+
+
+BROKERS = {
+    'memoria': BrokerMemoria,
+    'cache': BrokerCache,
+}
+
+_brokers = {}
+_lock_brokers = threading.Lock()
+
+
+def broker():
+    nombre = settings.EVENTOS_BROKER
+    with _lock_brokers:
+        if nombre not in _brokers:
+            _brokers[nombre] = BROKERS[nombre](settings.EVENTOS_RETENCION)
+        return _brokers[nombre]
+
+
+def publicar(tipo, datos):
+    """
+    datos tiene que ser serializable a JSON tal cual.
+    """
+    return broker().publicar(tipo, datos)
+
+
+def reiniciar():
+    with _lock_brokers:
+        _brokers.clear()
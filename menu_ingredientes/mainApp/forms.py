@@ -1,5 +1,7 @@
 from django import forms
 from .models import Plato, Receta, Ingrediente, Stock, CategoriaMenu
+from .services import ConversionService
+from .unidades import UNIDADES, ConversionImposible, a_unidad_de_stock
 
 
 class PlatoForm(forms.ModelForm):
@@ -11,13 +13,38 @@ class PlatoForm(forms.ModelForm):
 class RecetaInlineForm(forms.ModelForm):
     class Meta:
         model = Receta
-        fields = ['ingrediente', 'cantidad']
+        fields = ['ingrediente', 'cantidad', 'unidad_medida']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        ingrediente, cantidad = cleaned_data.get('ingrediente'), cleaned_data.get('cantidad')
+        if ingrediente and cantidad:
+            try:
+                a_unidad_de_stock(cantidad, cleaned_data.get('unidad_medida'), ingrediente)
+            except ConversionImposible as error:
+                self.add_error('unidad_medida', error.message)
+        return cleaned_data
 
 
 class StockForm(forms.ModelForm):
+    unidad = forms.ChoiceField(
+        choices=[('', 'La del ingrediente')] + UNIDADES, required=False,
+        help_text='Unidad en la que se contó; se guarda convertida a la del ingrediente'
+    )
+
     class Meta:
         model = Stock
-        fields = ['ingrediente', 'cantidad_disponible']
+        fields = ['sucursal', 'ingrediente', 'cantidad_disponible']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        ingrediente, cantidad = cleaned_data.get('ingrediente'), cleaned_data.get('cantidad_disponible')
+        if ingrediente and cantidad is not None and cleaned_data.get('unidad'):
+            try:
+                cleaned_data['cantidad_disponible'] = a_unidad_de_stock(cantidad, cleaned_data['unidad'], ingrediente)
+            except ConversionImposible as error:
+                self.add_error('unidad', error.message)
+        return cleaned_data
 
 
 class CategoriaForm(forms.ModelForm):
@@ -29,4 +56,21 @@ class CategoriaForm(forms.ModelForm):
 class IngredienteForm(forms.ModelForm):
     class Meta:
         model = Ingrediente
-        fields = ['nombre', 'unidad_medida', 'stock_minimo']
+        fields = ['nombre', 'unidad_medida', 'stock_minimo', 'costo_unitario', 'densidad', 'peso_unidad']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk and cleaned_data.get('unidad_medida'):
+            # Las recetas existentes tienen que poder convertirse con los datos nuevos
+            ingrediente = Ingrediente(
+                pk=self.instance.pk,
+                nombre=cleaned_data.get('nombre') or self.instance.nombre,
+                unidad_medida=cleaned_data['unidad_medida'],
+                densidad=cleaned_data.get('densidad'),
+                peso_unidad=cleaned_data.get('peso_unidad')
+            )
+            try:
+                ConversionService().validar_ingrediente(ingrediente)
+            except ConversionImposible as error:
+                self.add_error('unidad_medida', error.message)
+        return cleaned_data
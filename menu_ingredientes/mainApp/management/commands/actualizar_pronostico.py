@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mainApp.pronostico import PronosticoService
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume en DemandaHoraria las reservas nuevas desde la última corrida "
+        "(pensado para correr cada noche). Sólo procesa lo posterior a la marca "
+        "de agua, así que una corrida diaria lee un día de reservas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias-por-lote', type=int, default=7,
+            help='Días de reservas procesados en cada transacción'
+        )
+
+    def handle(self, *args, **options):
+        service = PronosticoService(dias_por_lote=options['dias_por_lote'])
+
+        def progreso(resumen):
+            self.stdout.write(f"Procesado hasta {resumen['hasta']:%Y-%m-%d %H:%M}: {resumen['filas']} filas")
+
+        inicio = time.perf_counter()
+        resumen = service.actualizar(progreso=progreso if options['verbosity'] > 1 else None)
+        duracion = time.perf_counter() - inicio
+        if resumen['hasta'] is None:
+            self.stdout.write("No hay reservas para procesar")
+            return
+        self.stdout.write(
+            f"Demanda horaria desde {resumen['desde']:%Y-%m-%d %H:%M} hasta {resumen['hasta']:%Y-%m-%d %H:%M}: "
+            f"{resumen['filas']} filas en {duracion:.1f} s"
+        )
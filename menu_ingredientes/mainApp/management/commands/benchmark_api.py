@@ -0,0 +1,98 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from mainApp.benchmark import ESCENARIOS, ejecutar, limpiar, sembrar
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo sintético, corre escenarios contra la API con "
+        "distintas cantidades de workers y reporta latencia p50/p99, throughput, "
+        "consultas y espera en bloqueos por escenario. Usa la base configurada "
+        "(DATABASE_URL): SQLite o PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escenarios', default=','.join(ESCENARIOS),
+            help=f"Escenarios separados por coma ({', '.join(ESCENARIOS)})"
+        )
+        parser.add_argument(
+            '--workers', default='1,4,16',
+            help='Cantidades de workers concurrentes, separadas por coma'
+        )
+        parser.add_argument('--requests', type=int, default=100, help='Requests por worker')
+        parser.add_argument('--platos', type=int, default=1000)
+        parser.add_argument('--ingredientes', type=int, default=500)
+        parser.add_argument('--recetas', type=int, default=5, help='Ingredientes por plato')
+        parser.add_argument('--categorias', type=int, default=10)
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument(
+            '--conservar', action='store_true',
+            help='No borrar el catálogo sintético al terminar'
+        )
+
+    def handle(self, *args, **options):
+        escenarios = [nombre.strip() for nombre in options['escenarios'].split(',') if nombre.strip()]
+        desconocidos = [nombre for nombre in escenarios if nombre not in ESCENARIOS]
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+        try:
+            workers = [int(valor) for valor in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers debe ser una lista de enteros')
+
+        configuracion = {
+            clave: options[clave]
+            for clave in ('requests', 'platos', 'ingredientes', 'recetas', 'categorias', 'semilla')
+        }
+        self.stdout.write(f"Sembrando catálogo: {configuracion}")
+        catalogo = sembrar(
+            platos=options['platos'],
+            ingredientes=options['ingredientes'],
+            recetas_por_plato=options['recetas'],
+            categorias=options['categorias'],
+            semilla=options['semilla']
+        )
+
+        # Los 500 (p. ej. 'database is locked' en SQLite) se cuentan como
+        # errores; no hace falta el traceback de cada uno
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        resultados = []
+        try:
+            self.stdout.write(
+                f"{'escenario':<20}{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+                f"{'consultas':>11}{'bloqueo ms':>12}{'errores':>9}"
+            )
+            for escenario in escenarios:
+                for cantidad in workers:
+                    resultado = ejecutar(
+                        escenario, catalogo, workers=cantidad,
+                        requests=options['requests'], semilla=options['semilla']
+                    )
+                    resultados.append(resultado)
+                    self.stdout.write(
+                        f"{escenario:<20}{cantidad:>8}{resultado['throughput']:>10}"
+                        f"{resultado['latencia_ms']['p50']:>10}{resultado['latencia_ms']['p99']:>10}"
+                        f"{resultado['consultas']['media']:>11}{resultado['espera_bloqueos_ms']['total']:>12}"
+                        f"{resultado['errores']:>9}"
+                    )
+        finally:
+            if not options['conservar']:
+                limpiar()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'base': connection.vendor,
+                    'configuracion': configuracion,
+                    'resultados': resultados,
+                }, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from mainApp.benchmark import limpiar, medir_costos, sembrar
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo sintético, importa el costo de todos sus "
+        "ingredientes y mide una actualización diaria de precios de algunos "
+        "cientos de ingredientes (sólo se recalculan los platos que los usan) "
+        "contra recalcular el costo del menú entero."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platos', type=int, default=5000)
+        parser.add_argument('--ingredientes', type=int, default=2000)
+        parser.add_argument('--recetas', type=int, default=8, help='Ingredientes por plato')
+        parser.add_argument('--cambios', type=int, default=300, help='Ingredientes con precio nuevo')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument(
+            '--conservar', action='store_true',
+            help='No borrar el catálogo sintético al terminar'
+        )
+
+    def handle(self, *args, **options):
+        catalogo = sembrar(
+            platos=options['platos'],
+            ingredientes=options['ingredientes'],
+            recetas_por_plato=options['recetas'],
+            semilla=options['semilla']
+        )
+        try:
+            resultado = medir_costos(catalogo, cambios=options['cambios'], semilla=options['semilla'])
+        finally:
+            if not options['conservar']:
+                limpiar()
+
+        self.stdout.write(
+            f"Carga inicial: {resultado['ingredientes']} costos, {resultado['platos']} platos "
+            f"en {resultado['carga_ms']} ms"
+        )
+        self.stdout.write(
+            f"Actualización diaria: {resultado['cambios']} costos, {resultado['platos_recalculados']} platos "
+            f"recalculados en {resultado['actualizacion_ms']} ms"
+        )
+        self.stdout.write(
+            f"Cambio de un costo: {resultado['platos_un_cambio']} platos recalculados "
+            f"en {resultado['un_cambio_ms']} ms"
+        )
+        self.stdout.write(
+            f"Recalcular todo el menú: {resultado['recalcular_todo_ms']} ms "
+            f"(coinciden: {resultado['coinciden']})"
+        )
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'base': connection.vendor,
+                    'resultado': resultado,
+                }, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from mainApp.benchmark import comparar_demanda, limpiar, sembrar
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo sintético (por defecto 5000 platos y 2000 "
+        "ingredientes) y compara la demanda de ingredientes de muchos pedidos "
+        "calculada recorriendo recetas del ORM contra la matriz de recetas "
+        "compilada. Reporta también lo que tarda compilar la matriz y "
+        "actualizarla tras el cambio de un plato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platos', type=int, default=5000)
+        parser.add_argument('--ingredientes', type=int, default=2000)
+        parser.add_argument('--recetas', type=int, default=8, help='Ingredientes por plato')
+        parser.add_argument(
+            '--pedidos', default='1,40,1000',
+            help='Cantidades de pedidos a medir, separadas por coma'
+        )
+        parser.add_argument('--platos-por-pedido', type=int, default=3)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument(
+            '--conservar', action='store_true',
+            help='No borrar el catálogo sintético al terminar'
+        )
+
+    def handle(self, *args, **options):
+        pedidos = [int(valor) for valor in options['pedidos'].split(',')]
+        self.stdout.write(
+            f"Sembrando {options['platos']} platos × {options['ingredientes']} ingredientes "
+            f"({options['recetas']} por plato)"
+        )
+        catalogo = sembrar(
+            platos=options['platos'],
+            ingredientes=options['ingredientes'],
+            recetas_por_plato=options['recetas'],
+            semilla=options['semilla']
+        )
+
+        resultados = []
+        try:
+            self.stdout.write(
+                f"{'pedidos':>8}{'líneas':>8}{'ORM ms':>12}{'matriz ms':>12}{'x':>8}"
+                f"{'compilar ms':>13}{'actualizar ms':>15}{'coinciden':>11}"
+            )
+            for cantidad in pedidos:
+                resultado = comparar_demanda(
+                    catalogo, pedidos=cantidad, platos_por_pedido=options['platos_por_pedido'],
+                    repeticiones=options['repeticiones'], semilla=options['semilla']
+                )
+                resultados.append({'pedidos': cantidad, **resultado})
+                self.stdout.write(
+                    f"{cantidad:>8}{resultado['lineas']:>8}{resultado['orm_ms']:>12}{resultado['matriz_ms']:>12}"
+                    f"{str(resultado['aceleracion']):>8}{resultado['compilar_ms']:>13}"
+                    f"{resultado['actualizar_ms']:>15}{str(resultado['coinciden']):>11}"
+                )
+        finally:
+            if not options['conservar']:
+                limpiar()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'base': connection.vendor,
+                    'resultados': resultados,
+                }, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from mainApp.benchmark import limpiar, medir_pronostico, sembrar
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un catálogo sintético y un año de reservas en varias "
+        "sucursales, y mide la primera corrida de actualizar_pronostico (todo "
+        "el historial), una corrida nocturna (un día nuevo) y el cálculo de "
+        "sugerencias de reposición. Usar una base de prueba (DATABASE_URL) sin "
+        "corridas previas del pronóstico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platos', type=int, default=500)
+        parser.add_argument('--ingredientes', type=int, default=300)
+        parser.add_argument('--recetas', type=int, default=6, help='Ingredientes por plato')
+        parser.add_argument('--dias', type=int, default=365)
+        parser.add_argument('--reservas-por-dia', type=int, default=300, help='Por sucursal')
+        parser.add_argument('--sucursales', type=int, default=3)
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument(
+            '--conservar', action='store_true',
+            help='No borrar los datos sintéticos al terminar'
+        )
+
+    def handle(self, *args, **options):
+        catalogo = sembrar(
+            platos=options['platos'],
+            ingredientes=options['ingredientes'],
+            recetas_por_plato=options['recetas'],
+            semilla=options['semilla']
+        )
+        try:
+            resultado = medir_pronostico(
+                catalogo, dias=options['dias'], reservas_por_dia=options['reservas_por_dia'],
+                sucursales=options['sucursales'], semilla=options['semilla']
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        finally:
+            if not options['conservar']:
+                limpiar()
+
+        self.stdout.write(
+            f"{resultado['reservas']} reservas en {resultado['sucursales']} sucursales "
+            f"(sembradas en {resultado['sembrar_s']} s)"
+        )
+        self.stdout.write(
+            f"Primera corrida: {resultado['filas_iniciales']} filas de demanda horaria en {resultado['inicial_s']} s"
+        )
+        self.stdout.write(f"Corrida nocturna: {resultado['filas_nocturna']} filas en {resultado['nocturna_s']} s")
+        self.stdout.write(
+            f"Sugerencias de reposición: {resultado['sugerencias']} en {resultado['reposicion_s']} s"
+        )
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'base': connection.vendor,
+                    'resultado': resultado,
+                }, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from mainApp.cola_reservas import POLITICAS, ColaReservas
+from mainApp.models import CategoriaMenu, Ingrediente, Plato, Receta, Stock
+from mainApp.services import StockService
+
+
+MODOS = ('normal', 'fragmentado', 'cola')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide reservas por segundo sobre un único ingrediente compartido, con "
+        "distinta cantidad de workers concurrentes, en modo normal (una "
+        "transacción por reserva), fragmentado y en cola (lotes con una "
+        "transacción por lote). Crea sus propios datos en la base configurada y los borra "
+        "al terminar. Con SQLite las escrituras se serializan: medir contra PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,2,4,8',
+            help='Cantidades de workers a probar, separadas por coma'
+        )
+        parser.add_argument(
+            '--reservas', type=int, default=200,
+            help='Reservas que hace cada worker'
+        )
+        parser.add_argument(
+            '--fragmentos', type=int, default=8,
+            help='Fragmentos del ingrediente en modo fragmentado'
+        )
+        parser.add_argument(
+            '--modos', default=','.join(MODOS),
+            help=f"Modos separados por coma ({', '.join(MODOS)})"
+        )
+        parser.add_argument('--ventana-ms', type=int, default=20, help='Ventana de la cola en milisegundos')
+        parser.add_argument('--lote', type=int, default=200, help='Tamaño máximo de lote de la cola')
+        parser.add_argument('--politica', default='fifo', choices=list(POLITICAS))
+
+    def handle(self, *args, **options):
+        try:
+            workers = [int(valor) for valor in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers debe ser una lista de enteros')
+        modos = [modo.strip() for modo in options['modos'].split(',') if modo.strip()]
+        desconocidos = [modo for modo in modos if modo not in MODOS]
+        if desconocidos:
+            raise CommandError(f"Modos desconocidos: {', '.join(desconocidos)}")
+
+        sufijo = uuid.uuid4().hex[:8]
+        categoria = CategoriaMenu.objects.create(nombre=f'Benchmark {sufijo}')
+        ingrediente = Ingrediente.objects.create(nombre=f'Benchmark {sufijo}', unidad_medida='un')
+        try:
+            plato = Plato.objects.create(nombre=f'Benchmark {sufijo}', descripcion='', precio=1, categoria=categoria)
+            Receta.objects.create(plato=plato, ingrediente=ingrediente, cantidad=1)
+            total = max(workers) * options['reservas']
+            stock = Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=total)
+
+            self.stdout.write(f"{'modo':<14}{'workers':>8}{'reservas/s':>12}{'errores':>9}")
+            for modo in modos:
+                fragmentos = options['fragmentos'] if modo == 'fragmentado' else 0
+                if modo == 'cola':
+                    cola = ColaReservas(
+                        StockService().reservar_lote,
+                        ventana=options['ventana_ms'] / 1000,
+                        lote_maximo=options['lote'],
+                        politica=options['politica']
+                    )
+                    reservar = cola.reservar
+                else:
+                    reservar = StockService()._reservar_idempotente
+                for cantidad in workers:
+                    # Cada corrida parte del stock completo
+                    ingrediente.fragmentos_stock = fragmentos
+                    ingrediente.save()
+                    stock.cantidad_disponible = total
+                    stock.save()
+
+                    por_segundo, errores = self._medir(reservar, plato.id, cantidad, options['reservas'])
+                    self.stdout.write(f"{modo:<14}{cantidad:>8}{por_segundo:>12.1f}{errores:>9}")
+        finally:
+            ingrediente.delete()
+            categoria.delete()
+
+    def _medir(self, reservar, plato_id, workers, reservas):
+        errores = []
+        # Pedidos nuevos en cada corrida: un pedido_id repetido se contesta
+        # por idempotencia sin reservar
+        corrida = uuid.uuid4().hex[:8]
+
+        def worker(numero):
+            fallidas = 0
+            try:
+                for orden in range(reservas):
+                    try:
+                        reservar([(plato_id, 1)], f'BENCH-{corrida}-{numero}-{orden}')
+                    except (OperationalError, ValidationError):
+                        fallidas += 1
+            finally:
+                connection.close()
+            errores.append(fallidas)
+
+        hilos = [threading.Thread(target=worker, args=(numero,)) for numero in range(workers)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        fallidas = sum(errores)
+        return (workers * reservas - fallidas) / duracion, fallidas
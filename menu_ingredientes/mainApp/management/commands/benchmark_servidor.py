@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from mainApp.benchmark import ENDPOINTS_HTTP, ejecutar_http, limpiar, memoria_rss, sembrar
+
+
+SERVIDORES = {
+    'wsgi': ['menu_ingredientes.wsgi'],
+    'asgi': ['menu_ingredientes.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Levanta gunicorn sync (WSGI) y gunicorn con workers de uvicorn (ASGI) "
+        "con la misma cantidad de procesos, corre los escenarios por HTTP con "
+        "distintas concurrencias y reporta req/s, latencia p50/p99 y memoria "
+        "RSS de cada servidor. Usa la base configurada (DATABASE_URL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servidores', default=','.join(SERVIDORES),
+            help=f"Servidores separados por coma ({', '.join(SERVIDORES)})"
+        )
+        parser.add_argument(
+            '--escenarios', default=','.join(ENDPOINTS_HTTP),
+            help=f"Escenarios separados por coma ({', '.join(ENDPOINTS_HTTP)})"
+        )
+        parser.add_argument('--procesos', type=int, default=2, help='Workers de gunicorn por servidor')
+        parser.add_argument(
+            '--concurrencia', default='8,64',
+            help='Requests en vuelo a la vez, separadas por coma'
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Requests por medición')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--platos', type=int, default=200)
+        parser.add_argument('--ingredientes', type=int, default=100)
+        parser.add_argument('--recetas', type=int, default=5, help='Ingredientes por plato')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument(
+            '--conservar', action='store_true',
+            help='No borrar el catálogo sintético al terminar'
+        )
+
+    def handle(self, *args, **options):
+        servidores = [nombre.strip() for nombre in options['servidores'].split(',') if nombre.strip()]
+        escenarios = [nombre.strip() for nombre in options['escenarios'].split(',') if nombre.strip()]
+        desconocidos = [nombre for nombre in servidores if nombre not in SERVIDORES]
+        desconocidos += [nombre for nombre in escenarios if nombre not in ENDPOINTS_HTTP]
+        if desconocidos:
+            raise CommandError(f"Valores desconocidos: {', '.join(desconocidos)}")
+        try:
+            concurrencias = [int(valor) for valor in options['concurrencia'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrencia debe ser una lista de enteros')
+
+        catalogo = sembrar(
+            platos=options['platos'],
+            ingredientes=options['ingredientes'],
+            recetas_por_plato=options['recetas'],
+            semilla=options['semilla']
+        )
+        # Los servidores abren sus propias conexiones
+        connection.close()
+
+        resultados = []
+        try:
+            self.stdout.write(
+                f"{'servidor':<10}{'escenario':<16}{'conc.':>7}{'req/s':>10}"
+                f"{'p50 ms':>10}{'p99 ms':>10}{'errores':>9}{'RSS MB':>9}"
+            )
+            for servidor in servidores:
+                proceso, url_base = self._levantar(servidor, options['procesos'], options['puerto'])
+                try:
+                    for escenario in escenarios:
+                        for concurrencia in concurrencias:
+                            resultado = ejecutar_http(
+                                url_base, servidor, escenario, catalogo, concurrencia=concurrencia,
+                                requests=options['requests'], semilla=options['semilla']
+                            )
+                            resultado['memoria_mb'] = memoria_rss(proceso.pid)
+                            resultados.append(resultado)
+                            self.stdout.write(
+                                f"{servidor:<10}{escenario:<16}{concurrencia:>7}{resultado['throughput']:>10}"
+                                f"{resultado['latencia_ms']['p50']:>10}{resultado['latencia_ms']['p99']:>10}"
+                                f"{resultado['errores']:>9}{str(resultado['memoria_mb']):>9}"
+                            )
+                finally:
+                    proceso.terminate()
+                    proceso.wait(timeout=30)
+        finally:
+            if not options['conservar']:
+                limpiar()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'base': connection.vendor,
+                    'procesos': options['procesos'],
+                    'resultados': resultados,
+                }, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+
+    def _levantar(self, servidor, procesos, puerto):
+        comando = [
+            sys.executable, '-m', 'gunicorn', *SERVIDORES[servidor],
+            '--workers', str(procesos), '--bind', f'127.0.0.1:{puerto}',
+            '--log-level', 'warning',
+        ]
+        entorno = {**os.environ, 'METRICAS_MUESTREO': '0'}
+        proceso = subprocess.Popen(comando, cwd=settings.BASE_DIR, env=entorno)
+        url_base = f'http://127.0.0.1:{puerto}'
+
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                raise CommandError(f"gunicorn ({servidor}) terminó con código {proceso.returncode}")
+            try:
+                urllib.request.urlopen(f'{url_base}/api/', timeout=1).read()
+                return proceso, url_base
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        proceso.terminate()
+        raise CommandError(f"gunicorn ({servidor}) no respondió en 30 segundos")
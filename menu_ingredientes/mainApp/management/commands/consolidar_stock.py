@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mainApp.services import FragmentoStockService
+
+
+class Command(BaseCommand):
+    help = "Descuenta de Stock lo reservado en fragmentos y reparte de nuevo los cupos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Si es mayor a 0, repite la consolidación cada N segundos'
+        )
+
+    def handle(self, *args, **options):
+        service = FragmentoStockService()
+
+        while True:
+            total = service.consolidar()
+            self.stdout.write(f"Stocks consolidados: {total}")
+            if options['intervalo'] <= 0:
+                break
+            time.sleep(options['intervalo'])
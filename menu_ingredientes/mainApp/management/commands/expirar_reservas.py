@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainApp.services import StockService
+
+
+class Command(BaseCommand):
+    help = "Libera las reservas en estado 'reservado' más antiguas que el TTL y devuelve su stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=settings.RESERVA_TTL_MINUTOS,
+            help='Minutos de vida de una reserva (por defecto RESERVA_TTL_MINUTOS)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Reservas liberadas por transacción'
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Si es mayor a 0, repite el barrido cada N segundos'
+        )
+
+    def handle(self, *args, **options):
+        service = StockService()
+        ttl = timedelta(minutes=options['ttl'])
+
+        while True:
+            liberadas = service.expirar_reservas(ttl, batch_size=options['batch_size'])
+            self.stdout.write(f"Reservas liberadas: {liberadas}")
+            if options['intervalo'] <= 0:
+                break
+            time.sleep(options['intervalo'])
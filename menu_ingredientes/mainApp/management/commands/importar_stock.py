@@ -0,0 +1,59 @@
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.models import Sucursal
+from mainApp.services import ImportadorStock
+
+
+class Command(BaseCommand):
+    help = "Importa ingredientes y conteos de stock desde un archivo CSV o JSON-lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo a importar')
+        parser.add_argument(
+            '--formato', choices=ImportadorStock.FORMATOS,
+            help='csv o jsonl (por defecto según la extensión del archivo)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Filas aplicadas por transacción'
+        )
+        parser.add_argument(
+            '--sucursal', type=int,
+            help='Sucursal cuyos conteos trae el archivo (por defecto la predeterminada)'
+        )
+
+    def handle(self, *args, **options):
+        archivo = options['archivo']
+        formato = options['formato'] or ('jsonl' if os.path.splitext(archivo)[1] in ('.jsonl', '.ndjson') else 'csv')
+
+        def progreso(resumen):
+            self.stdout.write(
+                f"Procesadas: {resumen['procesadas']} - Rechazadas: {resumen['rechazadas']}"
+            )
+
+        sucursal_id = options['sucursal']
+        if sucursal_id is not None and not Sucursal.objects.filter(pk=sucursal_id).exists():
+            raise CommandError(f"No existe la sucursal {sucursal_id}")
+
+        importador = ImportadorStock(
+            batch_size=options['batch_size'], progreso=progreso, sucursal_id=sucursal_id
+        )
+        try:
+            with open(archivo, newline='', encoding='utf-8-sig') as lineas:
+                resumen = importador.importar(lineas, formato)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {archivo}: {e}")
+        except ValidationError as e:
+            raise CommandError(e.message)
+
+        for rechazo in resumen['rechazos']:
+            self.stderr.write(f"Línea {rechazo['linea']}: {rechazo['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Importación terminada: {resumen['procesadas']} filas, "
+            f"{resumen['ingredientes_creados']} ingredientes nuevos, "
+            f"{resumen['ingredientes_actualizados']} actualizados, "
+            f"{resumen['stocks']} stocks, {resumen['rechazadas']} rechazadas"
+        ))
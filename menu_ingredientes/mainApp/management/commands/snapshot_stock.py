@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mainApp.services import MovimientoService
+
+
+class Command(BaseCommand):
+    help = "Guarda un snapshot del stock actual de cada ingrediente"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Filas insertadas por bulk_create'
+        )
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Si es mayor a 0, repite el snapshot cada N segundos'
+        )
+
+    def handle(self, *args, **options):
+        service = MovimientoService()
+
+        while True:
+            total = service.tomar_snapshot(batch_size=options['batch_size'])
+            self.stdout.write(f"Snapshots guardados: {total}")
+            if options['intervalo'] <= 0:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,198 @@
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import Receta
+
+
+# MATRIZ DE RECETAS
+# Las preguntas agregadas ("cuánto de cada ingrediente necesitan estos 40
+# pedidos", "qué consumió cada día del último año") se resuelven con una
+# matriz dispersa plato × ingrediente compilada en el proceso: la demanda de
+# muchos pedidos es un producto matriz-vector en NumPy en lugar de recorrer
+# recetas del ORM plato por plato.
+#
+# La matriz está en formato CSR: la fila de un plato son sus recetas
+# (columnas = ingredientes) con cantidad_base en milésimas enteras, así las
+# sumas son exactas. Es para lecturas: las reservas leen las recetas en la
+# misma consulta que bloquea el stock y nunca dependen de esta copia.
+#
+# Invalidación: cada cambio de recetas confirmado incrementa una versión en
+# el cache y deja ahí la lista de platos tocados. Un proceso con una versión
+# anterior relee sólo esos platos; si falta algún cambio intermedio (venció,
+# o el cache se reinició) recompila la matriz entera.
+
+CLAVE_VERSION = 'recetas:version'
+RETENCION_CAMBIOS = 60 * 60
+# Más cambios pendientes que esto: recompilar sale más barato que leerlos
+MAXIMO_CAMBIOS = 500
+ESCALA = 1000
+
+
+def _clave_cambios(version):
+    return f'recetas:cambios:{version}'
+
+
+def version_recetas():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Igual que menu_cache: arrancar desde un timestamp evita reutilizar
+        # la versión de una matriz compilada antes de que se perdiera la clave
+        cache.add(CLAVE_VERSION, int(time.time() * 1000), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_recetas(plato_ids=None):
+    """
+    Registra que cambiaron las recetas de `plato_ids` (None: todas). Se llama
+    después de confirmar la transacción, para que quien relea vea el cambio.
+    """
+    version_recetas()
+    try:
+        version = cache.incr(CLAVE_VERSION)
+    except ValueError:
+        version = version_recetas()
+    if plato_ids is not None:
+        cache.set(_clave_cambios(version), sorted(set(plato_ids)), RETENCION_CAMBIOS)
+
+
+def _leer_filas(plato_ids=None):
+    """
+    {plato_id: (ingrediente_ids, milésimas)} desde la base, todos los platos
+    o sólo `plato_ids` (los que no tienen recetas quedan con filas vacías).
+    """
+    recetas = Receta.objects.order_by('plato_id', 'ingrediente_id')
+    if plato_ids is not None:
+        recetas = recetas.filter(plato_id__in=list(plato_ids))
+    valores = np.array(recetas.values_list('plato_id', 'ingrediente_id', 'cantidad_base'), dtype=object)
+    filas = {plato_id: (np.empty(0, np.int64), np.empty(0, np.int64)) for plato_id in plato_ids or ()}
+    if not len(valores):
+        return filas
+    platos = valores[:, 0].astype(np.int64)
+    ingredientes = valores[:, 1].astype(np.int64)
+    milesimas = np.array([int(cantidad * ESCALA) for cantidad in valores[:, 2]], dtype=np.int64)
+    unicos, inicios = np.unique(platos, return_index=True)
+    for plato_id, desde, hasta in zip(unicos, inicios, [*inicios[1:], len(platos)]):
+        filas[int(plato_id)] = (ingredientes[desde:hasta], milesimas[desde:hasta])
+    return filas
+
+
+class MatrizRecetas:
+    """
+    filas: {plato_id: (ingrediente_ids, milésimas)}, se conserva para
+    recompilar sólo los platos que cambian.
+    """
+
+    def __init__(self, filas, version=None):
+        self.version = version
+        self.filas = {plato_id: fila for plato_id, fila in filas.items() if len(fila[0])}
+        self.plato_ids = np.array(sorted(self.filas), dtype=np.int64)
+        largos = np.array([len(self.filas[plato_id][0]) for plato_id in self.plato_ids.tolist()], dtype=np.int64)
+        self.indptr = np.zeros(len(self.plato_ids) + 1, dtype=np.int64)
+        np.cumsum(largos, out=self.indptr[1:])
+        if len(self.plato_ids):
+            columnas = np.concatenate([self.filas[plato_id][0] for plato_id in self.plato_ids.tolist()])
+            self.datos = np.concatenate([self.filas[plato_id][1] for plato_id in self.plato_ids.tolist()])
+        else:
+            columnas = self.datos = np.empty(0, np.int64)
+        self.ingrediente_ids, self.indices = np.unique(columnas, return_inverse=True)
+
+    def actualizar(self, filas, version=None):
+        """
+        Nueva matriz con las filas de `filas` reemplazadas; la actual no se
+        modifica (otros hilos pueden estar leyéndola).
+        """
+        return MatrizRecetas({**self.filas, **filas}, version)
+
+    def _posiciones(self, plato_ids):
+        plato_ids = np.asarray(plato_ids, dtype=np.int64)
+        posiciones = np.searchsorted(self.plato_ids, plato_ids)
+        posiciones[posiciones == len(self.plato_ids)] = 0
+        # Platos sin recetas (o inexistentes) no demandan nada
+        validos = (self.plato_ids[posiciones] == plato_ids) if len(self.plato_ids) else np.zeros(len(plato_ids), bool)
+        return posiciones, validos
+
+    def demanda_por_grupo(self, grupos, plato_ids, porciones):
+        """
+        Demanda de ingredientes de muchas líneas (grupo, plato, porciones) en
+        un solo paso vectorizado. grupos: enteros (un pedido, un día, ...).
+        Devuelve arrays alineados (grupo, ingrediente_id, milésimas) con una
+        entrada por par grupo-ingrediente con demanda.
+        """
+        grupos = np.asarray(grupos, dtype=np.int64)
+        porciones = np.asarray(porciones, dtype=np.int64)
+        posiciones, validos = self._posiciones(plato_ids)
+        grupos, porciones, posiciones = grupos[validos], porciones[validos], posiciones[validos]
+
+        # Expandir cada línea a las entradas de su fila
+        inicios = self.indptr[posiciones]
+        largos = self.indptr[posiciones + 1] - inicios
+        total = int(largos.sum())
+        if not total:
+            vacio = np.empty(0, np.int64)
+            return vacio, vacio, vacio
+        desplazamiento = np.arange(total) - np.repeat(np.cumsum(largos) - largos, largos)
+        entradas = np.repeat(inicios, largos) + desplazamiento
+        columnas = self.indices[entradas]
+        valores = self.datos[entradas] * np.repeat(porciones, largos)
+
+        claves = np.repeat(grupos, largos) * len(self.ingrediente_ids) + columnas
+        unicas, inversa = np.unique(claves, return_inverse=True)
+        sumas = np.zeros(len(unicas), dtype=np.int64)
+        np.add.at(sumas, inversa, valores)
+        grupo, columna = np.divmod(unicas, len(self.ingrediente_ids))
+        return grupo, self.ingrediente_ids[columna], sumas
+
+    def demanda(self, lineas):
+        """
+        lineas: [(plato_id, porciones)]. Devuelve {ingrediente_id: cantidad}
+        (Decimal con tres decimales, en la unidad del stock).
+        """
+        if not lineas:
+            return {}
+        plato_ids, porciones = zip(*lineas)
+        _, ingredientes, milesimas = self.demanda_por_grupo(np.zeros(len(lineas)), plato_ids, porciones)
+        return {
+            int(ingrediente_id): Decimal(int(cantidad)).scaleb(-3)
+            for ingrediente_id, cantidad in zip(ingredientes, milesimas)
+        }
+
+
+_lock = threading.Lock()
+_matriz = None
+
+
+def matriz_vigente():
+    """
+    La matriz vigente del proceso, compilada o actualizada si hace falta.
+    """
+    global _matriz
+    version = version_recetas()
+    actual = _matriz
+    if actual is not None and actual.version == version:
+        return actual
+    with _lock:
+        actual = _matriz
+        if actual is not None and actual.version == version:
+            return actual
+        plato_ids = None
+        if actual is not None and actual.version is not None and 0 < version - actual.version <= MAXIMO_CAMBIOS:
+            claves = [_clave_cambios(numero) for numero in range(actual.version + 1, version + 1)]
+            cambios = cache.get_many(claves)
+            if len(cambios) == len(claves):
+                plato_ids = {plato_id for ids in cambios.values() for plato_id in ids}
+        if plato_ids is None:
+            _matriz = MatrizRecetas(_leer_filas(), version)
+        else:
+            _matriz = actual.actualizar(_leer_filas(plato_ids), version)
+        return _matriz
+
+
+def reiniciar():
+    global _matriz
+    with _lock:
+        _matriz = None
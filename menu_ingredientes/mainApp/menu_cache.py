@@ -0,0 +1,107 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+# SNAPSHOTS EN CACHE
+# Los datos derivados (menú serializado, disponibilidad de platos) se guardan
+# en el cache bajo claves que incluyen contadores de versión. Los signals de
+# signals.py y los servicios que escriben en bloque incrementan la versión
+# correspondiente, así que nunca hace falta borrar snapshots: los viejos
+# simplemente dejan de leerse.
+
+CLAVE_VERSION = 'menu:version'
+CLAVE_VERSION_STOCK = 'stock:version'
+TIMEOUT_SNAPSHOT = 60 * 60 * 24
+
+
+def _version(clave):
+    version = cache.get(clave)
+    if version is None:
+        # Se arranca desde un timestamp para que, si el cache pierde la clave,
+        # la nueva versión no coincida con la de un snapshot anterior
+        cache.add(clave, int(time.time() * 1000), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def _invalidar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        _version(clave)
+
+
+def version_menu():
+    return _version(CLAVE_VERSION)
+
+
+def invalidar_menu():
+    _invalidar(CLAVE_VERSION)
+
+
+def version_stock():
+    return _version(CLAVE_VERSION_STOCK)
+
+
+def invalidar_stock():
+    _invalidar(CLAVE_VERSION_STOCK)
+
+
+def snapshot_menu(construir):
+    """
+    Devuelve (etag, datos) del menú actual. `construir` sólo se llama cuando
+    no hay snapshot para la versión vigente.
+    """
+    clave = f'menu:snapshot:{version_menu()}'
+    snapshot = cache.get(clave)
+    if snapshot is None:
+        datos = construir()
+        contenido = json.dumps(datos, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        etag = f'"{hashlib.sha256(contenido).hexdigest()[:32]}"'
+        snapshot = (etag, datos)
+        cache.set(clave, snapshot, TIMEOUT_SNAPSHOT)
+    return snapshot
+
+
+def snapshot_disponibilidad(construir, timeout, sucursal_id):
+    """
+    Disponibilidad de platos de una sucursal en cache; depende del menú y del
+    stock, así que cambia con cualquiera de las dos versiones.
+    """
+    clave = f'disponibilidad:{sucursal_id}:{version_menu()}:{version_stock()}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = construir(sucursal_id=sucursal_id)
+        cache.set(clave, datos, timeout)
+    return datos
+
+
+def etag_coincide(request, etag):
+    cabecera = request.META.get('HTTP_IF_NONE_MATCH')
+    if not cabecera:
+        return False
+    etags = [valor.strip() for valor in cabecera.split(',')]
+    return '*' in etags or etag in etags
+
+
+# RESPUESTAS DE RESERVA
+# Un reintento de reserva (mismo endpoint, sucursal, pedido_id y contenido) se contesta
+# desde el cache durante unos segundos sin llegar al motor de reservas. Pasado
+# ese tiempo lo resuelve la restricción única de ReservaStock.
+
+def _clave_reserva(tipo, sucursal_id, pedido_id, lineas):
+    contenido = json.dumps([tipo, sucursal_id, pedido_id, lineas], cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return f'reserva:{hashlib.sha256(contenido).hexdigest()}'
+
+
+def respuesta_reserva(tipo, sucursal_id, pedido_id, lineas):
+    return cache.get(_clave_reserva(tipo, sucursal_id, pedido_id, lineas))
+
+
+def guardar_respuesta_reserva(tipo, sucursal_id, pedido_id, lineas, respuesta, timeout):
+    if timeout > 0:
+        cache.set(_clave_reserva(tipo, sucursal_id, pedido_id, lineas), respuesta, timeout)
@@ -0,0 +1,115 @@
+import threading
+
+
+# MÉTRICAS EN PROCESO
+# MetricasMiddleware registra acá cada request muestreado. Se agregan en
+# histogramas por (vista, método) dentro del proceso y /metrics los expone en
+# el formato de texto de Prometheus. Con varios workers cada proceso tiene su
+# propio registro: Prometheus debe scrapear cada worker por separado.
+
+BUCKETS_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0
+        self.total = 0
+
+    def observar(self, valor):
+        for indice, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[indice] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {self.total}'
+        yield f'{nombre}_sum{{{etiquetas}}} {self.suma}'
+        yield f'{nombre}_count{{{etiquetas}}} {self.total}'
+
+
+class _Serie:
+    def __init__(self):
+        self.duracion = Histograma(BUCKETS_DURACION)
+        self.tiempo_db = Histograma(BUCKETS_DURACION)
+        self.consultas = Histograma(BUCKETS_CONSULTAS)
+        self.consultas_repetidas = 0
+        self.estados = {}
+
+
+_series = {}
+
+
+def registrar(vista, metodo, estado, duracion, consultas, tiempo_db, repetidas):
+    """
+    duracion y tiempo_db en segundos. repetidas indica que el request repitió
+    una misma consulta por encima del umbral (sospecha de N+1). consultas y
+    tiempo_db en None (requests ASGI) sólo registran la latencia.
+    """
+    with _lock:
+        serie = _series.get((vista, metodo))
+        if serie is None:
+            serie = _series[(vista, metodo)] = _Serie()
+        serie.duracion.observar(duracion)
+        if consultas is not None:
+            serie.tiempo_db.observar(tiempo_db)
+            serie.consultas.observar(consultas)
+        if repetidas:
+            serie.consultas_repetidas += 1
+        serie.estados[estado] = serie.estados.get(estado, 0) + 1
+
+
+def reiniciar():
+    with _lock:
+        _series.clear()
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exportar_prometheus():
+    """
+    Texto en formato de exposición de Prometheus (version 0.0.4).
+    """
+    metricas = [
+        ('menu_request_duracion_segundos', 'histogram', 'Latencia de la vista', 'duracion'),
+        ('menu_request_db_segundos', 'histogram', 'Tiempo en la base por request', 'tiempo_db'),
+        ('menu_request_consultas', 'histogram', 'Consultas ORM por request', 'consultas'),
+    ]
+    with _lock:
+        series = sorted(_series.items())
+        lineas = []
+        for nombre, tipo, ayuda, atributo in metricas:
+            lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+            for (vista, metodo), serie in series:
+                etiquetas = f'vista="{_escapar(vista)}",metodo="{metodo}"'
+                lineas += getattr(serie, atributo).lineas(nombre, etiquetas)
+
+        lineas += [
+            '# HELP menu_request_consultas_repetidas_total Requests con una misma consulta repetida (posible N+1)',
+            '# TYPE menu_request_consultas_repetidas_total counter',
+        ]
+        for (vista, metodo), serie in series:
+            lineas.append(
+                f'menu_request_consultas_repetidas_total{{vista="{_escapar(vista)}",metodo="{metodo}"}} '
+                f'{serie.consultas_repetidas}'
+            )
+
+        lineas += ['# HELP menu_requests_total Requests por código de respuesta', '# TYPE menu_requests_total counter']
+        for (vista, metodo), serie in series:
+            for estado, total in sorted(serie.estados.items()):
+                lineas.append(
+                    f'menu_requests_total{{vista="{_escapar(vista)}",metodo="{metodo}",estado="{estado}"}} {total}'
+                )
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,133 @@
+import logging
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metricas
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricasMiddleware:
+    """
+    Mide latencia, cantidad de consultas y tiempo en la base de cada request
+    muestreado (METRICAS_MUESTREO, entre 0 y 1) y lo agrega en mainApp.metricas.
+
+    Las consultas se cuentan con un execute_wrapper de la conexión, sin el
+    cursor de debug. Si un request repite la misma consulta (mismo SQL, sin
+    parámetros) METRICAS_UMBRAL_REPETIDAS veces o más se registra como posible
+    N+1 y se loguea el SQL. Con el muestreo en 0 el middleware no hace nada
+    más que leer el setting. Las respuestas en streaming se miden hasta que
+    la vista devuelve el response, sin el envío del cuerpo.
+
+    Bajo ASGI las consultas corren en otros hilos y el wrapper no las ve: en
+    ese modo sólo se registra la latencia.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _muestrear(self):
+        muestreo = settings.METRICAS_MUESTREO
+        return muestreo > 0 and (muestreo >= 1 or random.random() < muestreo)
+
+    def _vista(self, request):
+        match = request.resolver_match
+        if match is None or match.url_name == 'metricas':
+            return None
+        return match.view_name
+
+    async def __acall__(self, request):
+        if not self._muestrear():
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        vista = self._vista(request)
+        if vista is not None:
+            metricas.registrar(vista, request.method, response.status_code, duracion, None, None, False)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._muestrear():
+            return self.get_response(request)
+
+        consultas = Counter()
+        tiempo_db = 0
+
+        def medir(execute, sql, params, many, context):
+            nonlocal tiempo_db
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                tiempo_db += time.perf_counter() - inicio
+                consultas[sql] += 1
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(medir):
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        vista = self._vista(request)
+        if vista is None:
+            return response
+
+        repetida, veces = max(consultas.items(), key=lambda item: item[1], default=('', 0))
+        repetidas = veces >= settings.METRICAS_UMBRAL_REPETIDAS
+        if repetidas:
+            logger.warning("Posible N+1 en %s: %s consultas iguales: %s", vista, veces, repetida)
+
+        metricas.registrar(
+            vista, request.method, response.status_code, duracion,
+            sum(consultas.values()), tiempo_db, repetidas
+        )
+        return response
+
+
+class ArchivosEstaticosMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise con soporte async. El middleware original es sólo sync y bajo
+    ASGI obliga a Django a ocupar un hilo por request durante toda la vista;
+    acá sólo los archivos estáticos pasan por un hilo y el resto de los
+    requests sigue async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        archivo = None
+        if self.autorefresh:
+            if request.path_info.startswith(settings.STATIC_URL):
+                archivo = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            archivo = self.files.get(request.path_info)
+        if archivo is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(archivo, request)
+        return await self.get_response(request)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def marcar_bajo_minimo(apps, schema_editor):
+    Stock = apps.get_model('mainApp', 'Stock')
+    Stock.objects.filter(cantidad_disponible__lt=F('ingrediente__stock_minimo')).update(bajo_minimo=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='bajo_minimo',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='AlertaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('bajo_minimo', 'Bajo el mínimo'), ('repuesto', 'Repuesto')], max_length=20)),
+                ('cantidad_disponible', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock_minimo', models.IntegerField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='mainApp.ingrediente')),
+            ],
+        ),
+        migrations.RunPython(marcar_bajo_minimo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def snapshot_inicial(apps, schema_editor):
+    # El stock existente antes del libro de movimientos queda como punto de partida
+    Stock = apps.get_model('mainApp', 'Stock')
+    SnapshotStock = apps.get_model('mainApp', 'SnapshotStock')
+    ahora = timezone.now()
+    SnapshotStock.objects.bulk_create(
+        [
+            SnapshotStock(ingrediente_id=ingrediente_id, cantidad=cantidad, fecha=ahora)
+            for ingrediente_id, cantidad in Stock.objects.values_list('ingrediente_id', 'cantidad_disponible')
+        ],
+        batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0002_stock_bajo_minimo_alertastock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('reserva', 'Reserva'), ('liberacion', 'Liberación'), ('ajuste', 'Ajuste manual'), ('importacion', 'Importación')], max_length=20)),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('referencia', models.CharField(blank=True, max_length=100)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='mainApp.ingrediente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ingrediente', 'fecha'], name='mainApp_mov_ingredi_660fc9_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='mainApp.ingrediente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ingrediente', 'fecha'], name='mainApp_sna_ingredi_be15f3_idx')],
+            },
+        ),
+        migrations.RunPython(snapshot_inicial, migrations.RunPython.noop),
+    ]
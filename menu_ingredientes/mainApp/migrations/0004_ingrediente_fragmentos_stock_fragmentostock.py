@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0003_movimientostock_snapshotstock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingrediente',
+            name='fragmentos_stock',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FragmentoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.PositiveSmallIntegerField()),
+                ('cupo', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('consumido', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragmentos', to='mainApp.stock')),
+            ],
+            options={
+                'unique_together': {('stock', 'indice')},
+            },
+        ),
+    ]
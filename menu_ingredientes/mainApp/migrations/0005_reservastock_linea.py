@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+def numerar_lineas(apps, schema_editor):
+    # Las reservas existentes que comparten pedido_id pasan a ser líneas
+    # 0..n-1 de ese pedido, en orden de creación
+    ReservaStock = apps.get_model('mainApp', 'ReservaStock')
+    modificadas = []
+    anterior, linea = None, 0
+    for reserva in ReservaStock.objects.order_by('pedido_id', 'pk').only('pk', 'pedido_id').iterator():
+        linea = linea + 1 if reserva.pedido_id == anterior else 0
+        anterior = reserva.pedido_id
+        if linea:
+            reserva.linea = linea
+            modificadas.append(reserva)
+    ReservaStock.objects.bulk_update(modificadas, ['linea'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0004_ingrediente_fragmentos_stock_fragmentostock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservastock',
+            name='linea',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(numerar_lineas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reservastock',
+            constraint=models.UniqueConstraint(fields=('pedido_id', 'linea'), name='reserva_pedido_linea_unica'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0005_reservastock_linea'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stock',
+            name='bajo_minimo',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingrediente',
+            index=models.Index(fields=['nombre'], name='ingrediente_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plato',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'id'], name='plato_activo_categoria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['estado', 'fecha_creacion'], name='reserva_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(condition=models.Q(('estado', 'reservado')), fields=['id'], name='reserva_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['fecha_creacion'], name='reserva_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('bajo_minimo', True)), fields=['id'], name='stock_bajo_minimo_idx'),
+        ),
+    ]
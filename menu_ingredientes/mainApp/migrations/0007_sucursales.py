@@ -0,0 +1,113 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:32
+
+import django.db.models.deletion
+import mainApp.models
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def crear_sucursal_predeterminada(apps, schema_editor):
+    # El stock, las reservas y el libro que ya existen pasan a esta sucursal
+    # (es el default de los campos nuevos)
+    Sucursal = apps.get_model('mainApp', 'Sucursal')
+    Sucursal.objects.create(pk=settings.SUCURSAL_PREDETERMINADA, nombre='Principal')
+    # Con un pk explícito la secuencia de PostgreSQL no avanza sola
+    for sql in schema_editor.connection.ops.sequence_reset_sql(no_style(), [Sucursal]):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('activa', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name_plural': 'sucursales',
+            },
+        ),
+        migrations.RunPython(crear_sucursal_predeterminada, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='reservastock',
+            name='reserva_pedido_linea_unica',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimientostock',
+            name='mainApp_mov_ingredi_660fc9_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='snapshotstock',
+            name='mainApp_sna_ingredi_be15f3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stock',
+            name='stock_bajo_minimo_idx',
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='ingrediente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='mainApp.ingrediente'),
+        ),
+        migrations.AddField(
+            model_name='alertastock',
+            name='sucursal',
+            field=models.ForeignKey(default=mainApp.models.sucursal_predeterminada, on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='mainApp.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='sucursal',
+            field=models.ForeignKey(default=mainApp.models.sucursal_predeterminada, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='mainApp.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='reservastock',
+            name='sucursal',
+            field=models.ForeignKey(default=mainApp.models.sucursal_predeterminada, on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='mainApp.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='snapshotstock',
+            name='sucursal',
+            field=models.ForeignKey(default=mainApp.models.sucursal_predeterminada, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='mainApp.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='sucursal',
+            field=models.ForeignKey(default=mainApp.models.sucursal_predeterminada, on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='mainApp.sucursal'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientostock',
+            index=models.Index(fields=['sucursal', 'ingrediente', 'fecha'], name='movimiento_suc_ing_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['sucursal', 'fecha_creacion'], name='reserva_sucursal_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='snapshotstock',
+            index=models.Index(fields=['sucursal', 'ingrediente', 'fecha'], name='snapshot_suc_ing_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['sucursal', 'id'], name='stock_sucursal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('bajo_minimo', True)), fields=['sucursal', 'id'], name='stock_bajo_minimo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservastock',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'pedido_id', 'linea'), name='reserva_pedido_linea_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'ingrediente'), name='stock_sucursal_ingrediente_unico'),
+        ),
+    ]
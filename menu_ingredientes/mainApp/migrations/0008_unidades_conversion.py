@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def calcular_cantidad_base(apps, schema_editor):
+    # Las recetas existentes no tienen unidad propia: están escritas en la
+    # unidad del ingrediente
+    Receta = apps.get_model('mainApp', 'Receta')
+    Receta.objects.update(cantidad_base=F('cantidad'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0007_sucursales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingrediente',
+            name='densidad',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingrediente',
+            name='peso_unidad',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='receta',
+            name='cantidad_base',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='receta',
+            name='unidad_medida',
+            field=models.CharField(blank=True, choices=[('gr', 'Gramos'), ('kg', 'Kilogramos'), ('un', 'Unidades'), ('lt', 'Litros'), ('ml', 'Mililitros')], max_length=2),
+        ),
+        migrations.RunPython(calcular_cantidad_base, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='alertastock',
+            name='cantidad_disponible',
+            field=models.DecimalField(decimal_places=3, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='fragmentostock',
+            name='consumido',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='fragmentostock',
+            name='cupo',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='ingrediente',
+            name='unidad_medida',
+            field=models.CharField(choices=[('gr', 'Gramos'), ('kg', 'Kilogramos'), ('un', 'Unidades'), ('lt', 'Litros'), ('ml', 'Mililitros')], max_length=2),
+        ),
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='cantidad',
+            field=models.DecimalField(decimal_places=3, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='snapshotstock',
+            name='cantidad',
+            field=models.DecimalField(decimal_places=3, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='cantidad_disponible',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0008_unidades_conversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaProceso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proceso', models.CharField(max_length=50, unique=True)),
+                ('hasta', models.DateTimeField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DemandaHoraria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('porciones', models.IntegerField()),
+                ('plato', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demanda_horaria', to='mainApp.plato')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demanda_horaria', to='mainApp.sucursal')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sucursal', 'hora'], name='demanda_sucursal_hora_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sucursal', 'plato', 'hora'), name='demanda_suc_plato_hora_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+def marcar_costos_incompletos(apps, schema_editor):
+    # Ningún ingrediente tiene costo todavía: los platos con recetas quedan
+    # con costo 0 incompleto hasta que se carguen los costos
+    Plato = apps.get_model('mainApp', 'Plato')
+    Receta = apps.get_model('mainApp', 'Receta')
+    Plato.objects.filter(pk__in=Receta.objects.values('plato_id')).update(costo_completo=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0009_demanda_horaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingrediente',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='plato',
+            name='costo',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='plato',
+            name='costo_completo',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.RunPython(marcar_costos_incompletos, migrations.RunPython.noop),
+    ]
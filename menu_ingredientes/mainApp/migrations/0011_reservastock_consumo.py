@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:17
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def completar_consumo(apps, schema_editor):
+    # Las reservas todavía pendientes no guardaron lo que descontaron: lo más
+    # cercano que hay son sus recetas actuales
+    Receta = apps.get_model('mainApp', 'Receta')
+    ReservaStock = apps.get_model('mainApp', 'ReservaStock')
+    pendientes = ReservaStock.objects.filter(estado='reservado')
+    recetas = defaultdict(list)
+    filas = Receta.objects.filter(plato_id__in=pendientes.values('plato_id')).values_list(
+        'plato_id', 'ingrediente_id', 'cantidad_base'
+    )
+    for plato_id, ingrediente_id, cantidad_base in filas:
+        recetas[plato_id].append((ingrediente_id, cantidad_base))
+    reservas = list(pendientes.only('pk', 'plato_id', 'cantidad'))
+    for reserva in reservas:
+        reserva.consumo = {
+            str(ingrediente_id): str(cantidad_base * reserva.cantidad)
+            for ingrediente_id, cantidad_base in recetas[reserva.plato_id]
+        }
+    ReservaStock.objects.bulk_update(reservas, ['consumo'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0010_costos_platos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservastock',
+            name='consumo',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(completar_consumo, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,26 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+from .unidades import UNIDADES
+
+
+def sucursal_predeterminada():
+    # Stock, reservas y movimientos sin sucursal explícita son de la sucursal
+    # creada por la migración 0007 (SUCURSAL_PREDETERMINADA)
+    return settings.SUCURSAL_PREDETERMINADA
+
+class Sucursal(models.Model):
+    nombre = models.CharField(max_length=100, unique=True)
+    activa = models.BooleanField(default=True)
+    
+    class Meta:
+        verbose_name_plural = 'sucursales'
+    
+    def __str__(self):
+        return self.nombre
 
 class CategoriaMenu(models.Model):
     nombre = models.CharField(max_length=100)
@@ -8,16 +30,24 @@ class CategoriaMenu(models.Model):
         return self.nombre
 
 class Ingrediente(models.Model):
-    UNIDADES = [
-        ('gr', 'Gramos'),
-        ('kg', 'Kilogramos'),
-        ('un', 'Unidades'),
-        ('lt', 'Litros'),
-    ]
+    UNIDADES = UNIDADES
     
     nombre = models.CharField(max_length=100)
+    # Unidad en la que se cuenta el stock (y el stock_minimo) del ingrediente
     unidad_medida = models.CharField(max_length=2, choices=UNIDADES)
     stock_minimo = models.IntegerField(default=0)
+    # Para convertir entre magnitudes (ver unidades.py): g/ml y gramos por pieza
+    densidad = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    peso_unidad = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)
+    # Costo de una unidad_medida (la unidad del stock); vacío si no se conoce
+    costo_unitario = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    # 0: las reservas descuentan directo de Stock. N > 0: se reparten entre N
+    # FragmentoStock para no bloquear siempre la misma fila
+    fragmentos_stock = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        # Búsquedas por nombre exacto (importación) y listados ordenados por nombre
+        indexes = [models.Index(fields=['nombre'], name='ingrediente_nombre_idx')]
     
     def __str__(self):
         return f"{self.nombre} ({self.unidad_medida})"
@@ -28,24 +58,76 @@ class Plato(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     categoria = models.ForeignKey(CategoriaMenu, on_delete=models.CASCADE)
     activo = models.BooleanField(default=True)
+    # Costo de los ingredientes de una porción, materializado por CostoService
+    # al cambiar las recetas o el costo_unitario de un ingrediente.
+    # costo_completo es False si algún ingrediente no tiene costo_unitario
+    costo = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    costo_completo = models.BooleanField(default=True, editable=False)
+    
+    class Meta:
+        # Menú activo filtrado por categoría (API y vistas web)
+        indexes = [
+            models.Index(
+                fields=['categoria', 'id'], condition=models.Q(activo=True), name='plato_activo_categoria_idx'
+            )
+        ]
     
     def __str__(self):
         return self.nombre
+    
+    @property
+    def margen(self):
+        return self.precio - self.costo
+    
+    @property
+    def margen_porcentaje(self):
+        # Sobre el precio de venta
+        if not self.precio:
+            return None
+        return (self.margen * 100 / self.precio).quantize(Decimal('0.1'))
 
 class Receta(models.Model):
     plato = models.ForeignKey(Plato, on_delete=models.CASCADE, related_name='recetas')
     ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
     cantidad = models.DecimalField(max_digits=8, decimal_places=2)
+    # Unidad en que se escribió la receta; vacía es la del ingrediente
+    unidad_medida = models.CharField(max_length=2, choices=UNIDADES, blank=True)
+    # cantidad convertida a la unidad de stock del ingrediente al guardar,
+    # con la misma precisión que Stock: es lo que descuentan las reservas
+    cantidad_base = models.DecimalField(max_digits=12, decimal_places=3, default=0)
     
     class Meta:
         unique_together = ['plato', 'ingrediente']
 
 class Stock(models.Model):
-    ingrediente = models.OneToOneField(Ingrediente, on_delete=models.CASCADE, related_name='stock')
-    cantidad_disponible = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Una fila por ingrediente y sucursal. Todas las consultas calientes
+    # filtran por sucursal y entran por índices que la llevan primero
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='stocks', default=sucursal_predeterminada
+    )
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='stocks')
+    # En la unidad_medida del ingrediente. Tres decimales: un gramo de un
+    # ingrediente contado en kg no se pierde al redondear
+    cantidad_disponible = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    # Se mantiene al registrar cada cruce del stock_minimo (ver AlertaStockService)
+    bajo_minimo = models.BooleanField(default=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sucursal', 'ingrediente'], name='stock_sucursal_ingrediente_unico')
+        ]
+        indexes = [
+            # Listado de una sucursal paginado por id
+            models.Index(fields=['sucursal', 'id'], name='stock_sucursal_idx'),
+            # Índice parcial: el filtro booleano se compila como WHERE bajo_minimo
+            # y un índice común sobre la columna no se usa en SQLite
+            models.Index(
+                fields=['sucursal', 'id'], condition=models.Q(bajo_minimo=True), name='stock_bajo_minimo_idx'
+            ),
+        ]
     
     def __str__(self):
-        return f"Stock {self.ingrediente.nombre}: {self.cantidad_disponible}"
+        return f"Stock {self.ingrediente.nombre} ({self.sucursal_id}): {self.cantidad_disponible}"
 
 class ReservaStock(models.Model):
     ESTADOS = [
@@ -54,11 +136,139 @@ class ReservaStock(models.Model):
         ('liberado', 'Liberado'),
     ]
     
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='reservas', default=sucursal_predeterminada
+    )
     plato = models.ForeignKey(Plato, on_delete=models.CASCADE)
     cantidad = models.IntegerField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default='reservado')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     pedido_id = models.CharField(max_length=100)
+    # Posición dentro del pedido: (sucursal, pedido_id, linea) es única, un
+    # reintento no puede volver a insertar la reserva. Las reservas de un
+    # plato suelto toman la siguiente línea libre del pedido
+    linea = models.PositiveSmallIntegerField(default=0)
+    # Lo que descontó la reserva, {ingrediente_id: cantidad} en la unidad del
+    # stock: al liberarla se devuelve exactamente eso aunque la receta haya
+    # cambiado después
+    consumo = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sucursal', 'pedido_id', 'linea'], name='reserva_pedido_linea_unica')
+        ]
+        indexes = [
+            # Historial de una sucursal por fecha
+            models.Index(fields=['sucursal', 'fecha_creacion'], name='reserva_sucursal_fecha_idx'),
+            # Barrido de reservas vencidas (expirar_reservas) y filtro por estado del admin
+            models.Index(fields=['estado', 'fecha_creacion'], name='reserva_estado_fecha_idx'),
+            models.Index(fields=['id'], condition=models.Q(estado='reservado'), name='reserva_pendiente_idx'),
+            # Exportación por rango de fechas
+            models.Index(fields=['fecha_creacion'], name='reserva_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Reserva {self.plato.nombre} - {self.estado}"
+
+class AlertaStock(models.Model):
+    TIPOS = [
+        ('bajo_minimo', 'Bajo el mínimo'),
+        ('repuesto', 'Repuesto'),
+    ]
+    
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='alertas', default=sucursal_predeterminada
+    )
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='alertas')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    cantidad_disponible = models.DecimalField(max_digits=12, decimal_places=3)
+    stock_minimo = models.IntegerField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Alerta {self.ingrediente.nombre} - {self.tipo}"
+
+# Libro de movimientos de stock: sólo se agregan filas. cantidad es el delta
+# aplicado (negativo al reservar, positivo al liberar o reponer).
+class MovimientoStock(models.Model):
+    TIPOS = [
+        ('reserva', 'Reserva'),
+        ('liberacion', 'Liberación'),
+        ('ajuste', 'Ajuste manual'),
+        ('importacion', 'Importación'),
+    ]
+    
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='movimientos', default=sucursal_predeterminada
+    )
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='movimientos')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3)
+    referencia = models.CharField(max_length=100, blank=True)
+    fecha = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [models.Index(fields=['sucursal', 'ingrediente', 'fecha'], name='movimiento_suc_ing_fecha_idx')]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.ingrediente.nombre}: {self.cantidad}"
+
+# Foto periódica del stock: el stock en un momento dado es el snapshot
+# anterior más los movimientos posteriores.
+class SnapshotStock(models.Model):
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='snapshots', default=sucursal_predeterminada
+    )
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='snapshots')
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3)
+    fecha = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [models.Index(fields=['sucursal', 'ingrediente', 'fecha'], name='snapshot_suc_ing_fecha_idx')]
+    
+    def __str__(self):
+        return f"Snapshot {self.ingrediente.nombre} {self.fecha}: {self.cantidad}"
+
+# Cupo de stock de un ingrediente con contador fragmentado. Cada fragmento
+# tiene asignada una parte de Stock.cantidad_disponible (cupo) y acumula lo
+# reservado contra ella (consumido) hasta la próxima consolidación, que lo
+# descuenta de Stock y reparte los cupos de nuevo (ver FragmentoStockService).
+class FragmentoStock(models.Model):
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='fragmentos')
+    indice = models.PositiveSmallIntegerField()
+    cupo = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    consumido = models.DecimalField(max_digits=12, decimal_places=3, default=0)
+    
+    class Meta:
+        unique_together = ['stock', 'indice']
+    
+    def __str__(self):
+        return f"Fragmento {self.indice} de {self.stock_id}: {self.consumido}/{self.cupo}"
+
+# Porciones pedidas de cada plato por sucursal y hora, materializadas desde
+# ReservaStock para el pronóstico de consumo (ver pronostico.py). Sólo se
+# agregan horas nuevas: MarcaProceso recuerda hasta dónde se procesó.
+class DemandaHoraria(models.Model):
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='demanda_horaria')
+    plato = models.ForeignKey(Plato, on_delete=models.CASCADE, related_name='demanda_horaria')
+    hora = models.DateTimeField()
+    porciones = models.IntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sucursal', 'plato', 'hora'], name='demanda_suc_plato_hora_unica')
+        ]
+        indexes = [models.Index(fields=['sucursal', 'hora'], name='demanda_sucursal_hora_idx')]
+    
+    def __str__(self):
+        return f"{self.plato_id} {self.hora}: {self.porciones}"
+
+# Marca de agua de un proceso incremental: todo lo anterior a `hasta` ya
+# está procesado.
+class MarcaProceso(models.Model):
+    proceso = models.CharField(max_length=50, unique=True)
+    hasta = models.DateTimeField()
+    actualizado = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"Reserva {self.plato.nombre} - {self.estado}"
\ No newline at end of file
+        return f"{self.proceso} hasta {self.hasta}"
\ No newline at end of file
@@ -0,0 +1,231 @@
+import math
+from datetime import timedelta, timezone as dt_timezone
+from decimal import ROUND_CEILING, Decimal
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+from django.utils import timezone
+
+from .matriz_recetas import ESCALA, matriz_vigente, version_recetas
+from .models import DemandaHoraria, Ingrediente, MarcaProceso, ReservaStock
+from .services import CAMPO_CANTIDAD, _consumido_pendiente, _sucursal
+from .unidades import DECIMALES_BASE
+
+
+# PRONÓSTICO DE CONSUMO Y REPOSICIÓN
+# El historial de ReservaStock se resume en DemandaHoraria (porciones por
+# sucursal, plato y hora) con un GROUP BY en la base. Cada corrida procesa
+# sólo las horas posteriores a la marca de agua y hasta PRONOSTICO_MARGEN_HORAS
+# antes de ahora: para entonces las reservas ya se confirmaron o se
+# liberaron (las liberadas no cuentan como consumo) y las horas procesadas no
+# vuelven a cambiar, así que cada corrida sólo inserta.
+#
+# El consumo de ingredientes sale de multiplicar esas porciones por la matriz
+# de recetas (matriz_recetas.py) con las recetas vigentes: el pronóstico
+# anticipa lo que las recetas de hoy van a consumir, no lo que consumieron
+# las de entonces.
+
+PROCESO = 'demanda_horaria'
+TIMEOUT_ESTADISTICAS = 60 * 60 * 24
+
+
+class PronosticoService:
+    def __init__(self, dias_por_lote=7):
+        self.dias_por_lote = dias_por_lote
+
+    # MATERIALIZACIÓN INCREMENTAL
+    def _corte(self, hasta=None):
+        hasta = hasta or timezone.now() - timedelta(hours=settings.PRONOSTICO_MARGEN_HORAS)
+        return hasta.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    def marca(self):
+        return MarcaProceso.objects.filter(proceso=PROCESO).values_list('hasta', flat=True).first()
+
+    def actualizar(self, hasta=None, progreso=None):
+        """
+        Agrega a DemandaHoraria las reservas entre la marca de agua y `hasta`
+        (por defecto ahora menos PRONOSTICO_MARGEN_HORAS), en lotes de
+        `dias_por_lote` días con una transacción cada uno. Devuelve
+        {'desde', 'hasta', 'filas'}.
+        """
+        corte = self._corte(hasta)
+        marca = self.marca()
+        if marca is None:
+            primera = ReservaStock.objects.order_by('fecha_creacion').values_list('fecha_creacion', flat=True).first()
+            if primera is None:
+                return {'desde': None, 'hasta': None, 'filas': 0}
+            marca = self._corte(primera)
+            MarcaProceso.objects.get_or_create(proceso=PROCESO, defaults={'hasta': marca})
+
+        resumen = {'desde': marca, 'hasta': marca, 'filas': 0}
+        while marca < corte:
+            fin = min(marca + timedelta(days=self.dias_por_lote), corte)
+            filas = self._aplicar_lote(marca, fin)
+            if filas is None:
+                # Otra corrida avanzó la marca mientras tanto
+                break
+            resumen['hasta'] = marca = fin
+            resumen['filas'] += filas
+            if progreso:
+                progreso(resumen)
+        return resumen
+
+    @transaction.atomic
+    def _aplicar_lote(self, desde, hasta):
+        marca = MarcaProceso.objects.select_for_update().get(proceso=PROCESO)
+        if marca.hasta != desde:
+            return None
+        grupos = (
+            ReservaStock.objects.filter(fecha_creacion__gte=desde, fecha_creacion__lt=hasta)
+            .exclude(estado='liberado')
+            # En UTC, para que las horas coincidan con la marca
+            .annotate(hora=TruncHour('fecha_creacion', tzinfo=dt_timezone.utc))
+            .values('sucursal_id', 'plato_id', 'hora')
+            .annotate(porciones=Sum('cantidad'))
+            .order_by()
+        )
+        creadas = DemandaHoraria.objects.bulk_create(
+            [DemandaHoraria(**grupo) for grupo in grupos.iterator(chunk_size=5000)], batch_size=2000
+        )
+        marca.hasta = hasta
+        marca.save(update_fields=['hasta', 'actualizado'])
+        return len(creadas)
+
+    # CONSUMO
+    def _consumo(self, grupos, plato_ids, porciones):
+        """
+        Consumo por grupo e ingrediente de las líneas (grupo, plato,
+        porciones), como arrays alineados; cantidad en la unidad del stock.
+        """
+        grupo, ingrediente_id, milesimas = matriz_vigente().demanda_por_grupo(grupos, plato_ids, porciones)
+        return grupo, ingrediente_id, milesimas / ESCALA
+
+    def consumo(self, desde, hasta, sucursal_id=None, por='dia'):
+        """
+        Consumo de ingredientes de la sucursal entre `desde` y `hasta`
+        (horas ya materializadas) por día o por hora: DataFrame con columnas
+        periodo, ingrediente_id y cantidad.
+        """
+        if por not in ('dia', 'hora'):
+            raise ValueError(f"Período desconocido: {por}")
+        periodo = TruncDate('hora') if por == 'dia' else F('hora')
+        filas = (
+            DemandaHoraria.objects.filter(sucursal_id=_sucursal(sucursal_id), hora__gte=desde, hora__lt=hasta)
+            .annotate(periodo=periodo)
+            .values('periodo', 'plato_id')
+            .annotate(total=Sum('porciones'))
+            .order_by()
+            .values_list('periodo', 'plato_id', 'total')
+        )
+        porciones = pd.DataFrame.from_records(list(filas), columns=['periodo', 'plato_id', 'porciones'])
+        codigos, periodos = pd.factorize(porciones['periodo'], sort=True)
+        grupo, ingrediente_id, cantidad = self._consumo(
+            codigos, porciones['plato_id'].to_numpy(), porciones['porciones'].to_numpy()
+        )
+        return pd.DataFrame({
+            'periodo': np.asarray(periodos, dtype=object)[grupo] if len(grupo) else [],
+            'ingrediente_id': ingrediente_id,
+            'cantidad': cantidad,
+        }).sort_values(['periodo', 'ingrediente_id'], ignore_index=True)
+
+    def estadisticas(self, sucursal_id=None, dias=28):
+        """
+        Consumo diario medio y su desvío por ingrediente en los `dias` días
+        anteriores a la marca de agua (DataFrame indexado por
+        ingrediente_id). Los días sin consumo cuentan como cero. Se cachea
+        hasta que avance la marca o cambien las recetas.
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        hasta = self.marca()
+        vacio = pd.DataFrame({'media': [], 'desvio': []}, index=pd.Index([], name='ingrediente_id'))
+        if hasta is None:
+            return vacio
+        clave = f'pronostico:estadisticas:{sucursal_id}:{dias}:{hasta.timestamp()}:{version_recetas()}'
+        resultado = cache.get(clave)
+        if resultado is not None:
+            return resultado
+
+        desde = hasta - timedelta(days=dias)
+        filas = DemandaHoraria.objects.filter(
+            sucursal_id=sucursal_id, hora__gte=desde, hora__lt=hasta
+        ).values_list('hora', 'plato_id', 'porciones')
+        porciones = pd.DataFrame.from_records(list(filas), columns=['hora', 'plato_id', 'porciones'])
+        if porciones.empty:
+            cache.set(clave, vacio, TIMEOUT_ESTADISTICAS)
+            return vacio
+
+        # Días de 24 horas contados desde `desde`, no días calendario: la
+        # ventana son exactamente `dias` días completos
+        horas = pd.to_datetime(porciones['hora'], utc=True)
+        dia = ((horas - pd.Timestamp(desde)) // pd.Timedelta(days=1)).to_numpy()
+        grupo, ingrediente_id, cantidad = self._consumo(
+            dia, porciones['plato_id'].to_numpy(), porciones['porciones'].to_numpy()
+        )
+        ingredientes, fila = np.unique(ingrediente_id, return_inverse=True)
+        diario = np.zeros((len(ingredientes), dias))
+        np.add.at(diario, (fila, grupo), cantidad)
+        resultado = pd.DataFrame(
+            {'media': diario.mean(axis=1), 'desvio': diario.std(axis=1)},
+            index=pd.Index(ingredientes, name='ingrediente_id')
+        )
+        cache.set(clave, resultado, TIMEOUT_ESTADISTICAS)
+        return resultado
+
+    # REPOSICIÓN
+    def sugerencias(self, sucursal_id=None, dias=28, cobertura_dias=7, z=1.65):
+        """
+        Cuánto pedir de cada ingrediente para cubrir `cobertura_dias` días sin
+        bajar del stock_minimo: punto de pedido = stock_minimo + consumo medio
+        de la cobertura + stock de seguridad (z desvíos del consumo en la
+        cobertura). Sólo devuelve los ingredientes con algo para pedir.
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        estadisticas = self.estadisticas(sucursal_id, dias)
+        ingredientes = (
+            Ingrediente.objects
+            .annotate(stock_sucursal=FilteredRelation('stocks', condition=Q(stocks__sucursal_id=sucursal_id)))
+            .filter(Q(stock_sucursal__pk__isnull=False) | Q(pk__in=list(estadisticas.index)))
+            .annotate(disponible=Coalesce(
+                F('stock_sucursal__cantidad_disponible'), Value(Decimal('0'), output_field=CAMPO_CANTIDAD)
+            ) - _consumido_pendiente('stock_sucursal__pk'))
+            .values_list('pk', 'nombre', 'unidad_medida', 'stock_minimo', 'disponible')
+        )
+        tabla = pd.DataFrame.from_records(
+            list(ingredientes), columns=['ingrediente_id', 'ingrediente', 'unidad_medida', 'stock_minimo', 'disponible']
+        ).set_index('ingrediente_id').join(estadisticas)
+        tabla[['media', 'desvio']] = tabla[['media', 'desvio']].fillna(0.0)
+        tabla['disponible'] = tabla['disponible'].astype(float)
+        tabla['consumo_cobertura'] = tabla['media'] * cobertura_dias
+        tabla['seguridad'] = z * tabla['desvio'] * math.sqrt(cobertura_dias)
+        tabla['punto_pedido'] = tabla['stock_minimo'] + tabla['consumo_cobertura'] + tabla['seguridad']
+        tabla['sugerido'] = (tabla['punto_pedido'] - tabla['disponible']).clip(lower=0)
+        tabla = tabla[tabla['sugerido'] > 0].sort_index().sort_values('ingrediente', kind='stable')
+
+        def cantidad(valor, redondeo=None):
+            # Se descarta el ruido de punto flotante antes de redondear hacia arriba
+            return Decimal(str(round(valor, 6))).quantize(DECIMALES_BASE, rounding=redondeo)
+
+        return {
+            'hasta': self.marca(),
+            'dias': dias,
+            'cobertura_dias': cobertura_dias,
+            'sugerencias': [
+                {
+                    'ingrediente_id': int(ingrediente_id),
+                    'ingrediente': fila.ingrediente,
+                    'unidad_medida': fila.unidad_medida,
+                    'disponible': cantidad(fila.disponible),
+                    'stock_minimo': int(fila.stock_minimo),
+                    'consumo_diario': cantidad(fila.media),
+                    'punto_pedido': cantidad(fila.punto_pedido),
+                    # Se redondea hacia arriba: pedir de menos no cubre
+                    'sugerido': cantidad(fila.sugerido, ROUND_CEILING),
+                }
+                for ingrediente_id, fila in tabla.iterrows()
+            ],
+        }
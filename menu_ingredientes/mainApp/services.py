@@ -1 +1,1898 @@
-Hola
+import csv
+import json
+import logging
+import threading
+from collections import Counter, defaultdict
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, Count, DecimalField, Exists, F, FilteredRelation, Min, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Floor, NullIf
+from django.utils import timezone
+
+from . import eventos
+from .cola_reservas import ColaReservas
+from .matriz_recetas import invalidar_recetas, matriz_vigente
+from .menu_cache import invalidar_menu, invalidar_stock, snapshot_disponibilidad
+from .models import (
+    AlertaStock, CategoriaMenu, FragmentoStock, Ingrediente, MovimientoStock, Plato, Receta,
+    ReservaStock, SnapshotStock, Stock, Sucursal
+)
+from .unidades import DECIMALES_BASE, ConversionImposible, a_unidad_de_stock, factor
+
+
+logger = logging.getLogger(__name__)
+
+CAMPO_CANTIDAD = DecimalField(max_digits=12, decimal_places=3)
+# Precisión de Ingrediente.costo_unitario y de Plato.costo
+DECIMALES_COSTO = Decimal('0.0001')
+CENTAVOS = Decimal('0.01')
+# Reintentos de una reserva de plato suelto que choca con otro plato del
+# mismo pedido reservado al mismo tiempo
+INTENTOS_LINEA = 5
+
+
+def _case_cantidades(campo, cantidades):
+    """
+    Expresión CASE que devuelve, para cada fila, la cantidad asociada a su
+    valor de `campo` ({valor: cantidad}). Permite actualizar muchas filas
+    de Stock con un solo UPDATE.
+    """
+    return Case(
+        *[
+            When(**{campo: valor}, then=Value(cantidad, output_field=CAMPO_CANTIDAD))
+            for valor, cantidad in cantidades.items()
+        ],
+        default=Value(Decimal('0'), output_field=CAMPO_CANTIDAD),
+        output_field=CAMPO_CANTIDAD
+    )
+
+
+def _consumido_pendiente(stock_ref):
+    """
+    Lo reservado en los fragmentos de la fila de Stock `stock_ref` (una
+    referencia externa) y todavía no consolidado.
+    """
+    consumido = (
+        FragmentoStock.objects.filter(stock_id=OuterRef(stock_ref))
+        .values('stock_id')
+        .annotate(total=Sum('consumido'))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(consumido, output_field=CAMPO_CANTIDAD),
+        Value(Decimal('0'), output_field=CAMPO_CANTIDAD)
+    )
+
+
+# update(), bulk_create y bulk_update no disparan signals: los servicios que
+# escriben así invalidan los snapshots a mano (ya y al confirmar, igual que
+# signals.py)
+def _invalidar_menu_al_confirmar():
+    invalidar_menu()
+    transaction.on_commit(invalidar_menu)
+
+
+def _invalidar_stock_al_confirmar():
+    invalidar_stock()
+    transaction.on_commit(invalidar_stock)
+
+
+def _invalidar_recetas_al_confirmar(plato_ids):
+    # La matriz relee las recetas al ver el cambio: tiene que estar confirmado
+    ids = sorted(set(plato_ids))
+    transaction.on_commit(lambda: invalidar_recetas(ids))
+
+
+# Las novedades se publican sólo si la transacción se confirma; un error al
+# publicar se loguea sin afectar el request que ya guardó sus cambios.
+# Publicar stock no consulta la base: el evento lleva sólo ids y los datos
+# los arma quien lo lee (NovedadesService.expandir)
+def _publicar_stock_al_confirmar(ingrediente_ids, sucursal_id=None):
+    if settings.EVENTOS_HABILITADOS:
+        ids = sorted(set(ingrediente_ids))
+        sucursal_id = _sucursal(sucursal_id)
+        transaction.on_commit(lambda: NovedadesService().publicar_stock(ids, sucursal_id), robust=True)
+
+
+def _publicar_menu_al_confirmar(plato_ids):
+    if settings.EVENTOS_HABILITADOS:
+        ids = sorted(set(plato_ids))
+        transaction.on_commit(lambda: NovedadesService().publicar_menu(ids), robust=True)
+
+
+def _sucursal(sucursal_id):
+    """
+    Los servicios reciben sucursal_id opcional: sin sucursal trabajan sobre
+    SUCURSAL_PREDETERMINADA, como antes de que hubiera varias.
+    """
+    return int(sucursal_id) if sucursal_id else settings.SUCURSAL_PREDETERMINADA
+
+
+class ReservaDuplicada(ValidationError):
+    """
+    El pedido_id ya se usó para reservar otro contenido.
+    """
+
+
+class FragmentosSinCupo(Exception):
+    """
+    Una reserva no entró en ningún fragmento y sus filas de Stock
+    fragmentadas no estaban bloqueadas: consolidar ahora las bloquearía
+    después de las demás, fuera del orden por pk. La reserva se revierte y
+    se repite bloqueando todas juntas.
+    """
+
+
+# SERVICIO DE STOCK
+class StockService:
+    """
+    Motor de reservas de stock.
+
+    Cada reserva descuenta del stock de una sucursal (sucursal_id; sin ella,
+    la predeterminada). Un pedido se reserva una sola vez por sucursal; los
+    platos sueltos de un mismo pedido se identifican por (pedido_id, plato).
+    Todas las líneas de receta y sus filas de Stock se leen en una sola
+    consulta bloqueada (ordenada por pk para que dos pedidos concurrentes
+    bloqueen siempre en el mismo orden), se validan en memoria y los
+    descuentos se aplican con un único UPDATE condicional.
+
+    Los ingredientes con contador fragmentado no se bloquean acá: su parte
+    de la demanda la resuelve FragmentoStockService. Si un fragmento no
+    alcanza, la reserva se repite bloqueando todas sus filas de Stock en la
+    misma consulta ordenada por pk antes de consolidar.
+    """
+
+    def _cargar_platos(self, plato_ids):
+        platos = Plato.objects.filter(id__in=plato_ids, activo=True).annotate(
+            num_recetas=Count('recetas')
+        )
+        platos = {plato.id: plato for plato in platos}
+        for plato_id in plato_ids:
+            if plato_id not in platos:
+                raise ValidationError("Plato no encontrado o inactivo")
+        return platos
+
+    def _bloquear_stock(self, platos, sucursal_id, con_fragmentados=False):
+        """
+        Devuelve las filas de Stock (bloqueadas) de la sucursal para todos los
+        ingredientes de los platos, una fila por línea de receta, anotada con
+        el plato y la cantidad de la receta. Las de ingredientes fragmentados
+        se bloquean sólo con con_fragmentados, en la misma consulta.
+        """
+        consulta = Stock.objects.filter(
+            sucursal_id=sucursal_id, ingrediente__receta__plato_id__in=list(platos)
+        ).annotate(
+            plato_id=F('ingrediente__receta__plato_id'),
+            cantidad_receta=F('ingrediente__receta__cantidad_base'),
+            nombre_ingrediente=F('ingrediente__nombre'),
+            stock_minimo=F('ingrediente__stock_minimo'),
+            num_fragmentos=F('ingrediente__fragmentos_stock'),
+        )
+        if con_fragmentados:
+            filas = list(consulta.select_for_update(of=('self',)).order_by('pk'))
+        else:
+            filas = list(consulta.filter(num_fragmentos=0).select_for_update(of=('self',)).order_by('pk'))
+
+        def lineas_completas():
+            # Si una línea de receta no trae su fila de Stock el join la descarta
+            lineas_por_plato = Counter(fila.plato_id for fila in filas)
+            return all(
+                lineas_por_plato.get(plato.id, 0) == plato.num_recetas for plato in platos.values()
+            )
+
+        if not lineas_completas():
+            # Faltan líneas: o son de ingredientes fragmentados (se leen sin
+            # bloquear) o la configuración está incompleta
+            filas += consulta.filter(num_fragmentos__gt=0).order_by('pk')
+            if not lineas_completas():
+                raise ValidationError("Error en configuración de stock")
+        return filas
+
+    def _calcular_demanda(self, filas, cantidades):
+        """
+        Suma la cantidad necesaria por fila de Stock.
+        cantidades: {plato_id: porciones}
+        """
+        demanda = {}
+        for fila in filas:
+            necesario = fila.cantidad_receta * cantidades[fila.plato_id]
+            if fila.pk in demanda:
+                demanda[fila.pk]['necesario'] += necesario
+            else:
+                demanda[fila.pk] = {
+                    'stock': fila,
+                    'necesario': necesario,
+                }
+        return demanda
+
+    def _consumo_linea(self, filas, plato_id, cantidad):
+        """
+        Lo que descuenta una línea del pedido, para ReservaStock.consumo
+        ({ingrediente_id: cantidad}, como texto para no perder decimales).
+        """
+        return {
+            str(fila.ingrediente_id): str(fila.cantidad_receta * cantidad)
+            for fila in filas if fila.plato_id == plato_id
+        }
+
+    def _validar_demanda(self, demanda, disponible=None):
+        """
+        disponible: {stock_id: cantidad} para validar contra una vista en
+        memoria del stock (reservas en lote) en lugar de lo leído.
+        """
+        for stock_id, item in demanda.items():
+            stock = item['stock']
+            if stock.num_fragmentos:
+                # Sin bloqueo la cantidad leída no sirve: valida el fragmento
+                continue
+            cantidad = stock.cantidad_disponible if disponible is None else disponible[stock_id]
+            if cantidad < item['necesario']:
+                raise ValidationError(
+                    f"Stock insuficiente de {stock.nombre_ingrediente}. "
+                    f"Necesario: {item['necesario']}, Disponible: {cantidad}"
+                )
+
+    def _descontar_demanda(self, demanda, referencia='', movimientos=None, con_fragmentados=False):
+        """
+        Aplica todos los descuentos en un solo UPDATE. Cada fila sólo se
+        actualiza si todavía tiene stock suficiente; si alguna no cumple se
+        revierte la transacción completa. Los descuentos quedan registrados
+        en el libro de movimientos con `referencia` (el pedido), o según
+        `movimientos` ({referencia: {ingrediente_id: delta}}) si se pasa.
+        con_fragmentados: _bloquear_stock ya bloqueó las filas fragmentadas,
+        se pueden consolidar si un fragmento no alcanza.
+        """
+        if not demanda:
+            return
+
+        normales = {stock_id: item for stock_id, item in demanda.items() if not item['stock'].num_fragmentos}
+        if normales:
+            condicion = Q()
+            for stock_id, item in normales.items():
+                condicion |= Q(pk=stock_id, cantidad_disponible__gte=item['necesario'])
+
+            descuentos = {stock_id: item['necesario'] for stock_id, item in normales.items()}
+            actualizados = Stock.objects.filter(condicion).update(
+                cantidad_disponible=F('cantidad_disponible') - _case_cantidades('pk', descuentos)
+            )
+            if actualizados != len(normales):
+                raise ValidationError("Stock insuficiente: el stock cambió durante la reserva")
+        if len(normales) < len(demanda):
+            FragmentoStockService().reservar({
+                stock_id: item['necesario']
+                for stock_id, item in demanda.items() if stock_id not in normales
+            }, consolidar=con_fragmentados)
+        _invalidar_stock_al_confirmar()
+        if movimientos is None:
+            movimientos = {
+                referencia: {item['stock'].ingrediente_id: -item['necesario'] for item in demanda.values()}
+            }
+        # Toda la demanda es de una misma sucursal
+        sucursal_id = next(iter(demanda.values()))['stock'].sucursal_id
+        MovimientoService().registrar_lote(movimientos, 'reserva', sucursal_id)
+
+        # Las filas ya están en memoria: los cruces del mínimo se detectan sin
+        # volver a consultar (los fragmentados se revisan al consolidar)
+        cruces = []
+        for item in normales.values():
+            stock = item['stock']
+            restante = stock.cantidad_disponible - item['necesario']
+            if not stock.bajo_minimo and restante < stock.stock_minimo:
+                cruces.append({
+                    'stock_id': stock.pk,
+                    'sucursal_id': stock.sucursal_id,
+                    'ingrediente_id': stock.ingrediente_id,
+                    'cantidad_disponible': restante,
+                    'stock_minimo': stock.stock_minimo,
+                    'bajo_minimo': True,
+                })
+        AlertaStockService().registrar_cruces(cruces)
+
+    def validar_y_reservar_stock(self, plato_id, cantidad, pedido_id, sucursal_id=None):
+        """
+        Reserva un plato. Los platos de un mismo pedido se pueden reservar con
+        llamadas separadas que comparten pedido_id: la clave de idempotencia
+        es (pedido_id, plato) y cada plato nuevo toma la siguiente línea libre.
+        Repetir la llamada devuelve la reserva original; otra cantidad del
+        mismo plato lanza ReservaDuplicada.
+        """
+        try:
+            plato_id = int(plato_id)
+        except (TypeError, ValueError):
+            raise ValidationError("Plato no encontrado o inactivo")
+
+        sucursal_id = _sucursal(sucursal_id)
+        lineas = [(plato_id, cantidad)]
+        for _ in range(INTENTOS_LINEA):
+            reserva, linea = self._reserva_del_plato(plato_id, cantidad, pedido_id, sucursal_id)
+            if reserva is not None:
+                return reserva
+            try:
+                if linea == 0 and self._usar_cola():
+                    return _cola_reservas().reservar(lineas, pedido_id, sucursal_id)[0]
+                return self._reservar(lineas, pedido_id, sucursal_id, primera_linea=linea)[0]
+            except (IntegrityError, ReservaDuplicada):
+                # Otro plato del mismo pedido (o un reintento de este) tomó la
+                # línea al mismo tiempo: se vuelve a leer el pedido
+                continue
+        raise ReservaDuplicada(f"El pedido {pedido_id} se está reservando en paralelo, reintentar")
+
+    def _reserva_del_plato(self, plato_id, cantidad, pedido_id, sucursal_id):
+        """
+        (reserva, None) si el plato ya está reservado en el pedido, o (None,
+        siguiente línea libre). Con otra cantidad lanza ReservaDuplicada.
+        """
+        linea = 0
+        for reserva in ReservaStock.objects.filter(sucursal_id=sucursal_id, pedido_id=pedido_id).order_by('linea'):
+            if reserva.plato_id == plato_id:
+                if reserva.cantidad != cantidad:
+                    raise ReservaDuplicada(
+                        f"El plato {plato_id} del pedido {pedido_id} ya fue reservado con otra cantidad"
+                    )
+                return reserva, None
+            linea = reserva.linea + 1
+        return None, linea
+
+    def validar_y_reservar_pedido(self, lineas, pedido_id, sucursal_id=None):
+        """
+        Reserva todas las líneas de un pedido en una sola transacción.
+        lineas: lista de (plato_id, cantidad). La demanda de ingredientes
+        compartidos entre platos se suma antes de validar, así que el pedido
+        se reserva completo o no se reserva nada.
+        Devuelve una ReservaStock por línea, en el mismo orden.
+        """
+        if not lineas:
+            raise ValidationError("El pedido no tiene líneas")
+
+        return self._reservar_segun_modo(list(lineas), pedido_id, sucursal_id)
+
+    def _usar_cola(self):
+        # Dentro de una transacción del llamador la reserva tiene que ser
+        # parte de ella: no puede ir a la cola, que confirma por su cuenta
+        return settings.RESERVA_MODO == 'cola' and not transaction.get_connection().in_atomic_block
+
+    def _reservar_segun_modo(self, lineas, pedido_id, sucursal_id=None):
+        sucursal_id = _sucursal(sucursal_id)
+        if self._usar_cola():
+            return _cola_reservas().reservar(lineas, pedido_id, sucursal_id)
+        return self._reservar_idempotente(lineas, pedido_id, sucursal_id)
+
+    # IDEMPOTENCIA
+    def _reservas_existentes(self, lineas, pedido_id, sucursal_id):
+        """
+        Reservas ya hechas con este pedido_id en la sucursal, en orden de
+        línea, o None si el pedido es nuevo. Si el pedido se reservó con otro
+        contenido lanza ReservaDuplicada.
+        """
+        reservas = list(
+            ReservaStock.objects.filter(sucursal_id=sucursal_id, pedido_id=pedido_id).order_by('linea')
+        )
+        if not reservas:
+            return None
+        if [(reserva.plato_id, reserva.cantidad) for reserva in reservas] != lineas:
+            raise ReservaDuplicada(f"El pedido {pedido_id} ya fue reservado con otro contenido")
+        return reservas
+
+    def _reservar_idempotente(self, lineas, pedido_id, sucursal_id=None):
+        """
+        Un reintento con el mismo pedido_id devuelve las reservas originales
+        sin volver a descontar stock. La restricción única (sucursal,
+        pedido_id, linea) cubre los reintentos concurrentes: el que llega
+        segundo falla al insertar, su transacción se revierte y devuelve las
+        del primero.
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        existentes = self._reservas_existentes(lineas, pedido_id, sucursal_id)
+        if existentes is not None:
+            return existentes
+        try:
+            return self._reservar(lineas, pedido_id, sucursal_id)
+        except IntegrityError:
+            existentes = self._reservas_existentes(lineas, pedido_id, sucursal_id)
+            if existentes is None:
+                raise
+            return existentes
+
+    def _reservar(self, lineas, pedido_id, sucursal_id, primera_linea=0):
+        try:
+            return self._reservar_bloqueando(lineas, pedido_id, sucursal_id, primera_linea)
+        except FragmentosSinCupo:
+            return self._reservar_bloqueando(
+                lineas, pedido_id, sucursal_id, primera_linea, con_fragmentados=True
+            )
+
+    @transaction.atomic
+    def _reservar_bloqueando(self, lineas, pedido_id, sucursal_id, primera_linea=0, con_fragmentados=False):
+        cantidades = {}
+        for plato_id, cantidad in lineas:
+            cantidades[plato_id] = cantidades.get(plato_id, 0) + cantidad
+
+        platos = self._cargar_platos(list(cantidades))
+        filas = self._bloquear_stock(platos, sucursal_id, con_fragmentados)
+        demanda = self._calcular_demanda(filas, cantidades)
+        self._validar_demanda(demanda)
+        self._descontar_demanda(demanda, pedido_id, con_fragmentados=con_fragmentados)
+
+        reservas = [
+            ReservaStock(
+                sucursal_id=sucursal_id,
+                plato=platos[plato_id],
+                cantidad=cantidad,
+                pedido_id=pedido_id,
+                linea=linea,
+                estado='reservado',
+                consumo=self._consumo_linea(filas, plato_id, cantidad)
+            )
+            for linea, (plato_id, cantidad) in enumerate(lineas, start=primera_linea)
+        ]
+        return ReservaStock.objects.bulk_create(reservas)
+
+    # RESERVAS EN LOTE (modo cola)
+    def reservar_lote(self, solicitudes):
+        """
+        solicitudes: lista de (lineas, pedido_id, sucursal_id), ya en el orden
+        en que se deben atender. Devuelve, en el mismo orden, la lista de
+        reservas de cada solicitud o la excepción (ValidationError) que le
+        corresponde.
+
+        Las solicitudes de cada sucursal se resuelven en una transacción: si
+        falla entera (una inserción concurrente del mismo pedido, un fragmento
+        sin cupo) se reprocesan de a una por el camino normal, y el error de
+        una (también un IntegrityError) queda sólo en su resultado.
+        """
+        por_sucursal = defaultdict(list)
+        for indice, (_, _, sucursal_id) in enumerate(solicitudes):
+            por_sucursal[_sucursal(sucursal_id)].append(indice)
+
+        resultados = [None] * len(solicitudes)
+        for sucursal_id, indices in por_sucursal.items():
+            grupo = [solicitudes[indice][:2] for indice in indices]
+            try:
+                try:
+                    parciales = self._reservar_lote(grupo, sucursal_id)
+                except FragmentosSinCupo:
+                    parciales = self._reservar_lote(grupo, sucursal_id, con_fragmentados=True)
+            except (IntegrityError, ValidationError):
+                logger.warning("Lote de %s reservas reprocesado de a una", len(grupo), exc_info=True)
+                parciales = []
+                for lineas, pedido_id in grupo:
+                    try:
+                        parciales.append(self._reservar_idempotente(lineas, pedido_id, sucursal_id))
+                    except (IntegrityError, ValidationError) as error:
+                        parciales.append(error)
+            for indice, resultado in zip(indices, parciales):
+                resultados[indice] = resultado
+        return resultados
+
+    @transaction.atomic
+    def _reservar_lote(self, solicitudes, sucursal_id, con_fragmentados=False):
+        """
+        Una consulta de idempotencia, una de platos y una de Stock bloqueado
+        para todo el lote. Cada solicitud se valida contra una vista en
+        memoria del stock que va descontando las aceptadas; las rechazadas no
+        tocan la base. Lo aceptado se aplica con un UPDATE, un INSERT de
+        movimientos y un INSERT de reservas.
+        """
+        resultados = [None] * len(solicitudes)
+        existentes = defaultdict(list)
+        for reserva in ReservaStock.objects.filter(
+            sucursal_id=sucursal_id, pedido_id__in={pedido_id for _, pedido_id in solicitudes}
+        ).order_by('pedido_id', 'linea'):
+            existentes[reserva.pedido_id].append(reserva)
+
+        plato_ids = {plato_id for lineas, _ in solicitudes for plato_id, _ in lineas}
+        platos = {
+            plato.id: plato
+            for plato in Plato.objects.filter(id__in=plato_ids, activo=True).annotate(num_recetas=Count('recetas'))
+        }
+        filas_por_plato = defaultdict(list)
+        for fila in self._bloquear_stock(platos, sucursal_id, con_fragmentados):
+            filas_por_plato[fila.plato_id].append(fila)
+        disponible = {
+            fila.pk: fila.cantidad_disponible for filas in filas_por_plato.values() for fila in filas
+        }
+
+        total, movimientos, aceptadas, en_lote = {}, {}, [], {}
+        for indice, (lineas, pedido_id) in enumerate(solicitudes):
+            previas = existentes.get(pedido_id)
+            if previas is None and pedido_id in en_lote:
+                previas = solicitudes[en_lote[pedido_id]][0]
+            elif previas is not None:
+                previas = [(reserva.plato_id, reserva.cantidad) for reserva in previas]
+            if previas is not None:
+                # Reintento: las mismas reservas (se completan al final) o conflicto
+                if previas != lineas:
+                    resultados[indice] = ReservaDuplicada(f"El pedido {pedido_id} ya fue reservado con otro contenido")
+                continue
+
+            cantidades = {}
+            for plato_id, cantidad in lineas:
+                cantidades[plato_id] = cantidades.get(plato_id, 0) + cantidad
+            try:
+                if any(plato_id not in platos for plato_id in cantidades):
+                    raise ValidationError("Plato no encontrado o inactivo")
+                demanda = self._calcular_demanda(
+                    [fila for plato_id in cantidades for fila in filas_por_plato[plato_id]], cantidades
+                )
+                self._validar_demanda(demanda, disponible)
+            except ValidationError as error:
+                resultados[indice] = error
+                continue
+
+            for stock_id, item in demanda.items():
+                disponible[stock_id] -= item['necesario']
+                if stock_id in total:
+                    total[stock_id]['necesario'] += item['necesario']
+                else:
+                    total[stock_id] = dict(item)
+            movimientos[pedido_id] = {
+                item['stock'].ingrediente_id: -item['necesario'] for item in demanda.values()
+            }
+            en_lote[pedido_id] = indice
+            aceptadas.append(indice)
+
+        self._descontar_demanda(total, movimientos=movimientos, con_fragmentados=con_fragmentados)
+        creadas = iter(ReservaStock.objects.bulk_create([
+            ReservaStock(
+                sucursal_id=sucursal_id,
+                plato=platos[plato_id],
+                cantidad=cantidad,
+                pedido_id=solicitudes[indice][1],
+                linea=linea,
+                estado='reservado',
+                consumo=self._consumo_linea(filas_por_plato[plato_id], plato_id, cantidad)
+            )
+            for indice in aceptadas
+            for linea, (plato_id, cantidad) in enumerate(solicitudes[indice][0])
+        ]))
+        for indice in aceptadas:
+            resultados[indice] = [next(creadas) for _ in solicitudes[indice][0]]
+
+        for indice, (lineas, pedido_id) in enumerate(solicitudes):
+            if resultados[indice] is None:
+                resultados[indice] = existentes.get(pedido_id) or resultados[en_lote[pedido_id]]
+        return resultados
+
+    # CICLO DE VIDA DE RESERVAS
+    def _bloquear_reservas(self, reservas, skip_locked=False):
+        """
+        Bloquea las reservas todavía en estado 'reservado' y devuelve sus ids.
+        """
+        return list(
+            reservas.filter(estado='reservado')
+            .select_for_update(skip_locked=skip_locked)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+
+    def _devolver_stock(self, reserva_ids):
+        """
+        Devuelve al Stock lo que descontaron las reservas indicadas (su
+        consumo, no las recetas actuales), cada una a su sucursal, con un
+        UPDATE por sucursal. Las devoluciones quedan en el libro con el
+        pedido como referencia.
+        """
+        devoluciones = defaultdict(lambda: defaultdict(dict))
+        reservas = ReservaStock.objects.filter(pk__in=reserva_ids).values_list('sucursal_id', 'pedido_id', 'consumo')
+        for sucursal_id, pedido_id, consumo in reservas:
+            deltas = devoluciones[sucursal_id][pedido_id]
+            for ingrediente_id, cantidad in consumo.items():
+                deltas[int(ingrediente_id)] = deltas.get(int(ingrediente_id), 0) + Decimal(cantidad)
+
+        for sucursal_id, por_pedido in devoluciones.items():
+            cantidades = defaultdict(Decimal)
+            for deltas in por_pedido.values():
+                for ingrediente_id, cantidad in deltas.items():
+                    cantidades[ingrediente_id] += cantidad
+            if not cantidades:
+                continue
+            Stock.objects.filter(sucursal_id=sucursal_id, ingrediente_id__in=list(cantidades)).update(
+                cantidad_disponible=F('cantidad_disponible') + _case_cantidades('ingrediente_id', cantidades)
+            )
+            MovimientoService().registrar_lote(por_pedido, 'liberacion', sucursal_id)
+            AlertaStockService().actualizar_umbrales(ingrediente_ids=list(cantidades), sucursal_id=sucursal_id)
+            _invalidar_stock_al_confirmar()
+
+    @transaction.atomic
+    def confirmar_reservas(self, reservas):
+        """
+        Marca como confirmadas las reservas pendientes del queryset. El stock
+        ya fue descontado al reservar, así que no se modifica.
+        Devuelve la cantidad de reservas confirmadas.
+        """
+        reserva_ids = self._bloquear_reservas(reservas)
+        return ReservaStock.objects.filter(pk__in=reserva_ids).update(estado='confirmado')
+
+    @transaction.atomic
+    def liberar_reservas(self, reservas, skip_locked=False):
+        """
+        Libera las reservas pendientes del queryset y devuelve su stock.
+        Devuelve la cantidad de reservas liberadas.
+        """
+        reserva_ids = self._bloquear_reservas(reservas, skip_locked=skip_locked)
+        if not reserva_ids:
+            return 0
+        self._devolver_stock(reserva_ids)
+        return ReservaStock.objects.filter(pk__in=reserva_ids).update(estado='liberado')
+
+    def expirar_reservas(self, ttl, batch_size=500):
+        """
+        Libera las reservas 'reservado' más antiguas que `ttl` (timedelta).
+        Cada lote usa su propia transacción para no mantener bloqueos largos,
+        y las filas ya bloqueadas por otro proceso se saltan.
+        Devuelve el total de reservas liberadas.
+        """
+        limite = timezone.now() - ttl
+        total = 0
+        ultimo_id = 0
+        while True:
+            lote = list(
+                ReservaStock.objects.filter(
+                    estado='reservado', fecha_creacion__lt=limite, pk__gt=ultimo_id
+                ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not lote:
+                return total
+            ultimo_id = lote[-1]
+            total += self.liberar_reservas(
+                ReservaStock.objects.filter(pk__in=lote), skip_locked=True
+            )
+
+
+_cola = None
+_lock_cola = threading.Lock()
+
+
+def _cola_reservas():
+    """
+    Cola de reservas del proceso (RESERVA_MODO = 'cola'), creada al primer uso.
+    """
+    global _cola
+    with _lock_cola:
+        if _cola is None:
+            _cola = ColaReservas(
+                StockService().reservar_lote,
+                ventana=settings.RESERVA_COLA_VENTANA_MS / 1000,
+                lote_maximo=settings.RESERVA_COLA_LOTE,
+                politica=settings.RESERVA_COLA_POLITICA,
+                timeout=settings.RESERVA_COLA_TIMEOUT
+            )
+        return _cola
+
+
+# CONTADORES FRAGMENTADOS
+class FragmentoStockService:
+    """
+    Modo contador fragmentado para ingredientes muy reservados
+    (Ingrediente.fragmentos_stock = N > 0).
+
+    Las reservas no bloquean la fila de Stock: cada una toma, con SKIP
+    LOCKED, un fragmento al azar con cupo libre y suma a su consumido, así
+    que hasta N reservas del mismo ingrediente avanzan en paralelo. El stock
+    real es Stock.cantidad_disponible menos lo consumido en los fragmentos.
+    La suma de los cupos nunca supera Stock.cantidad_disponible, por eso
+    reservar dentro del cupo de un fragmento nunca vende de más.
+
+    consolidar() descuenta lo consumido de Stock y reparte los cupos de
+    nuevo. Corre periódicamente (comando consolidar_stock), antes y después
+    de cada escritura absoluta de Stock (importación, admin) y cuando una
+    reserva no entra en ningún fragmento; en ese caso bloquea el ingrediente
+    completo, igual que el modo normal.
+    """
+
+    def reservar(self, descuentos, consolidar=True):
+        """
+        descuentos: {stock_id: cantidad}, sólo de ingredientes fragmentados.
+        Con consolidar=False, si alguno no entra en un fragmento lanza
+        FragmentosSinCupo en lugar de bloquear su fila de Stock.
+        """
+        sin_cupo = {}
+        for stock_id, cantidad in sorted(descuentos.items()):
+            fragmento_id = (
+                FragmentoStock.objects.select_for_update(skip_locked=True)
+                .filter(stock_id=stock_id, cupo__gte=F('consumido') + cantidad)
+                .order_by('?')
+                .values_list('pk', flat=True)
+                .first()
+            )
+            if fragmento_id is None:
+                sin_cupo[stock_id] = cantidad
+                continue
+            FragmentoStock.objects.filter(pk=fragmento_id).update(consumido=F('consumido') + cantidad)
+        if sin_cupo:
+            if not consolidar:
+                raise FragmentosSinCupo(sorted(sin_cupo))
+            self.consolidar(stock_ids=list(sin_cupo), descuentos=sin_cupo)
+
+    @transaction.atomic
+    def consolidar(self, stock_ids=None, ingrediente_ids=None, descuentos=None, sucursal_id=None):
+        """
+        Descuenta de Stock lo consumido en los fragmentos y reparte el stock
+        restante en cupos iguales, creando o borrando fragmentos si cambió
+        Ingrediente.fragmentos_stock (con 0 se borran todos). Sin ids revisa
+        todos los ingredientes fragmentados (de todas las sucursales, salvo
+        que se indique sucursal_id).
+        descuentos: {stock_id: cantidad} a descontar además directamente de
+        Stock; si no alcanza lanza ValidationError.
+        Devuelve la cantidad de filas de Stock consolidadas.
+        """
+        descuentos = descuentos or {}
+        stocks = Stock.objects.filter(
+            Q(ingrediente__fragmentos_stock__gt=0)
+            | Exists(FragmentoStock.objects.filter(stock_id=OuterRef('pk')))
+        )
+        if stock_ids is not None:
+            stocks = stocks.filter(pk__in=stock_ids)
+        if ingrediente_ids is not None:
+            stocks = stocks.filter(ingrediente_id__in=ingrediente_ids)
+        if sucursal_id is not None:
+            stocks = stocks.filter(sucursal_id=sucursal_id)
+        filas = list(
+            stocks.select_for_update(of=('self',))
+            .order_by('pk')
+            .values_list('pk', 'cantidad_disponible', 'ingrediente__fragmentos_stock', 'ingrediente__nombre')
+        )
+        if not filas:
+            return 0
+
+        ids = [fila[0] for fila in filas]
+        consumido = defaultdict(Decimal)
+        indices = defaultdict(set)
+        sobrantes = []
+        numero = {stock_id: n for stock_id, _, n, _ in filas}
+        fragmentos = (
+            FragmentoStock.objects.select_for_update()
+            .filter(stock_id__in=ids)
+            .order_by('stock_id', 'indice')
+            .values_list('pk', 'stock_id', 'indice', 'consumido')
+        )
+        for pk, stock_id, indice, cantidad in fragmentos:
+            consumido[stock_id] += cantidad
+            if indice < numero[stock_id]:
+                indices[stock_id].add(indice)
+            else:
+                sobrantes.append(pk)
+
+        cantidades, cupos, nuevos = {}, {}, []
+        for stock_id, cantidad, n, nombre in filas:
+            restante = cantidad - consumido[stock_id]
+            if stock_id in descuentos:
+                if restante < descuentos[stock_id]:
+                    raise ValidationError(
+                        f"Stock insuficiente de {nombre}. "
+                        f"Necesario: {descuentos[stock_id]}, Disponible: {restante}"
+                    )
+                restante -= descuentos[stock_id]
+            if restante != cantidad:
+                cantidades[stock_id] = restante
+
+            cupo = Decimal('0')
+            if n and restante > 0:
+                cupo = (restante / n).quantize(Decimal('0.001'), rounding=ROUND_DOWN)
+            cupos[stock_id] = cupo
+            nuevos += [
+                FragmentoStock(stock_id=stock_id, indice=indice, cupo=cupo)
+                for indice in range(n) if indice not in indices.get(stock_id, ())
+            ]
+
+        if cantidades:
+            Stock.objects.filter(pk__in=list(cantidades)).update(
+                cantidad_disponible=_case_cantidades('pk', cantidades)
+            )
+        if sobrantes:
+            FragmentoStock.objects.filter(pk__in=sobrantes).delete()
+        if indices:
+            FragmentoStock.objects.filter(stock_id__in=list(indices)).update(
+                cupo=_case_cantidades('stock_id', cupos),
+                consumido=0
+            )
+        if nuevos:
+            FragmentoStock.objects.bulk_create(nuevos)
+        _invalidar_stock_al_confirmar()
+        AlertaStockService().actualizar_umbrales(stock_ids=ids)
+        return len(filas)
+
+
+# DISPONIBILIDAD DE PLATOS
+class DisponibilidadService:
+    """
+    Cuántas porciones de cada plato activo se pueden preparar con el stock
+    actual de una sucursal: el mínimo, sobre sus líneas de receta, de
+    floor(cantidad_disponible / cantidad). Todo el menú se resuelve con una
+    sola consulta agrupada.
+    """
+
+    def calcular(self, plato_ids=None, sucursal_id=None):
+        """
+        plato_ids (lista o subconsulta) limita el cálculo a esos platos.
+        """
+        # Lo consumido en fragmentos todavía no consolidado ya no está disponible
+        porciones = Floor(
+            (
+                Coalesce(
+                    F('stock_sucursal__cantidad_disponible'),
+                    Value(Decimal('0'), output_field=CAMPO_CANTIDAD)
+                ) - _consumido_pendiente('stock_sucursal__pk')
+            ) / NullIf(F('recetas__cantidad_base'), Value(Decimal('0'), output_field=CAMPO_CANTIDAD)),
+            output_field=CAMPO_CANTIDAD
+        )
+        platos = (
+            Plato.objects.filter(activo=True)
+            # La condición va en el JOIN: un ingrediente sin stock en la
+            # sucursal cuenta como 0, igual que sin fila de Stock
+            .annotate(stock_sucursal=FilteredRelation(
+                'recetas__ingrediente__stocks',
+                condition=Q(recetas__ingrediente__stocks__sucursal_id=_sucursal(sucursal_id))
+            ))
+            .annotate(porciones=Min(porciones))
+            .order_by('pk')
+            .values_list('pk', 'nombre', 'porciones')
+        )
+        if plato_ids is not None:
+            platos = platos.filter(pk__in=plato_ids)
+        # Un plato sin recetas no tiene límite de stock: porciones = None
+        return [
+            {
+                'plato_id': plato_id,
+                'nombre': nombre,
+                'porciones': int(porciones) if porciones is not None else None,
+                'disponible': porciones is None or porciones >= 1,
+            }
+            for plato_id, nombre, porciones in platos
+        ]
+
+    def disponibilidad(self, sucursal_id=None):
+        """
+        Igual que calcular(), pero servido desde el cache mientras no cambien
+        ni el menú ni el stock (DISPONIBILIDAD_CACHE_SEGUNDOS = 0 lo desactiva).
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        timeout = settings.DISPONIBILIDAD_CACHE_SEGUNDOS
+        if timeout <= 0:
+            return self.calcular(sucursal_id=sucursal_id)
+        return snapshot_disponibilidad(self.calcular, timeout, sucursal_id)
+
+
+# DEMANDA AGREGADA
+class DemandaService:
+    """
+    Cuánto de cada ingrediente necesitan muchos pedidos juntos, resuelto con
+    la matriz de recetas compilada (matriz_recetas.py) en lugar de recorrer
+    las recetas de cada plato. Es una consulta: no reserva ni bloquea nada.
+    """
+
+    def demanda(self, lineas):
+        """
+        lineas: [(plato_id, porciones)] de uno o varios pedidos. Devuelve
+        {ingrediente_id: cantidad} en la unidad del stock.
+        """
+        return matriz_vigente().demanda(lineas)
+
+    def cobertura(self, lineas, sucursal_id=None):
+        """
+        Para cada ingrediente que piden las líneas: lo necesario, lo
+        disponible en la sucursal y lo que falta. Una consulta para el stock.
+        """
+        demanda = self.demanda(lineas)
+        ingredientes = (
+            Ingrediente.objects.filter(pk__in=list(demanda))
+            .annotate(stock_sucursal=FilteredRelation(
+                'stocks', condition=Q(stocks__sucursal_id=_sucursal(sucursal_id))
+            ))
+            .annotate(disponible=Coalesce(
+                F('stock_sucursal__cantidad_disponible'), Value(Decimal('0'), output_field=CAMPO_CANTIDAD)
+            ) - _consumido_pendiente('stock_sucursal__pk'))
+            .order_by('nombre', 'pk')
+            .values_list('pk', 'nombre', 'unidad_medida', 'disponible')
+        )
+        resultado = []
+        for ingrediente_id, nombre, unidad_medida, disponible in ingredientes:
+            disponible = Decimal(disponible).quantize(DECIMALES_BASE)
+            necesario = demanda[ingrediente_id]
+            resultado.append({
+                'ingrediente_id': ingrediente_id,
+                'ingrediente': nombre,
+                'unidad_medida': unidad_medida,
+                'necesario': necesario,
+                'disponible': disponible,
+                'faltante': max(necesario - disponible, Decimal('0.000')),
+            })
+        return resultado
+
+
+# ALERTAS DE STOCK BAJO
+class AlertaStockService:
+    """
+    Seguimiento incremental del stock_minimo. Stock.bajo_minimo guarda el
+    último estado conocido de cada fila; cada escritura de stock revisa sólo
+    las filas que tocó y, si alguna cruzó el umbral (en cualquier sentido),
+    actualiza la marca y registra una AlertaStock. Así se emite una alerta por
+    cruce y nunca se recorre todo el catálogo.
+    """
+
+    def bajo_minimo(self, sucursal_id=None):
+        return (
+            Stock.objects.filter(sucursal_id=_sucursal(sucursal_id), bajo_minimo=True)
+            .select_related('ingrediente')
+            .order_by('ingrediente__nombre')
+        )
+
+    def registrar_cruces(self, cruces):
+        """
+        cruces: lista de dicts con stock_id, sucursal_id, ingrediente_id,
+        cantidad_disponible, stock_minimo y bajo_minimo (estado nuevo).
+        """
+        if not cruces:
+            return []
+
+        bajan = [cruce['stock_id'] for cruce in cruces if cruce['bajo_minimo']]
+        suben = [cruce['stock_id'] for cruce in cruces if not cruce['bajo_minimo']]
+        if bajan:
+            Stock.objects.filter(pk__in=bajan).update(bajo_minimo=True)
+        if suben:
+            Stock.objects.filter(pk__in=suben).update(bajo_minimo=False)
+
+        alertas = AlertaStock.objects.bulk_create([
+            AlertaStock(
+                sucursal_id=cruce['sucursal_id'],
+                ingrediente_id=cruce['ingrediente_id'],
+                tipo='bajo_minimo' if cruce['bajo_minimo'] else 'repuesto',
+                cantidad_disponible=cruce['cantidad_disponible'],
+                stock_minimo=cruce['stock_minimo'],
+            )
+            for cruce in cruces
+        ])
+        # El cruce ya queda en AlertaStock (y en /api/ingredientes/alertas/): el
+        # log es sólo para seguirlo y no debe inundar los warnings con cada
+        # reserva que deja un ingrediente bajo el mínimo
+        for cruce in cruces:
+            if cruce['bajo_minimo']:
+                logger.info(
+                    "Ingrediente %s bajo el mínimo en la sucursal %s: %s < %s",
+                    cruce['ingrediente_id'], cruce['sucursal_id'], cruce['cantidad_disponible'],
+                    cruce['stock_minimo']
+                )
+        return alertas
+
+    def actualizar_umbrales(self, stock_ids=None, ingrediente_ids=None, sucursal_id=None):
+        """
+        Busca, entre las filas indicadas, las que tienen la marca bajo_minimo
+        desactualizada y registra el cruce. Sin ids revisa toda la tabla
+        (o toda la sucursal, si se indica).
+        """
+        stocks = Stock.objects.all()
+        if stock_ids is not None:
+            stocks = stocks.filter(pk__in=stock_ids)
+        if ingrediente_ids is not None:
+            stocks = stocks.filter(ingrediente_id__in=ingrediente_ids)
+        if sucursal_id is not None:
+            stocks = stocks.filter(sucursal_id=sucursal_id)
+
+        minimo = F('ingrediente__stock_minimo')
+        filas = stocks.filter(
+            Q(bajo_minimo=False, cantidad_disponible__lt=minimo)
+            | Q(bajo_minimo=True, cantidad_disponible__gte=minimo)
+        ).values_list(
+            'pk', 'sucursal_id', 'ingrediente_id', 'cantidad_disponible', 'ingrediente__stock_minimo', 'bajo_minimo'
+        )
+
+        return self.registrar_cruces([
+            {
+                'stock_id': pk,
+                'sucursal_id': sucursal,
+                'ingrediente_id': ingrediente_id,
+                'cantidad_disponible': cantidad,
+                'stock_minimo': stock_minimo,
+                'bajo_minimo': not bajo_minimo,
+            }
+            for pk, sucursal, ingrediente_id, cantidad, stock_minimo, bajo_minimo in filas
+        ])
+
+
+# LIBRO DE MOVIMIENTOS Y SNAPSHOTS
+class MovimientoService:
+    """
+    Cada cambio de stock agrega filas a MovimientoStock (en bloque, dentro de
+    la misma transacción que el cambio). Periódicamente se guarda un
+    SnapshotStock por sucursal e ingrediente, así el stock en un momento
+    cualquiera es el snapshot anterior más una cola acotada de movimientos,
+    ambos leídos por el índice (sucursal, ingrediente, fecha).
+    """
+
+    def registrar(self, deltas, tipo, referencia='', sucursal_id=None):
+        """
+        deltas: {ingrediente_id: cantidad}. Los deltas en cero no se registran.
+        """
+        return self.registrar_lote({referencia: deltas}, tipo, sucursal_id)
+
+    def registrar_lote(self, deltas_por_referencia, tipo, sucursal_id=None):
+        """
+        Movimientos de varias referencias (pedidos) de una sucursal en un solo
+        INSERT. deltas_por_referencia: {referencia: {ingrediente_id: cantidad}}.
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        ahora = timezone.now()
+        movimientos = [
+            MovimientoStock(
+                sucursal_id=sucursal_id,
+                ingrediente_id=ingrediente_id,
+                tipo=tipo,
+                cantidad=cantidad,
+                referencia=referencia or '',
+                fecha=ahora
+            )
+            for referencia, deltas in deltas_por_referencia.items()
+            for ingrediente_id, cantidad in deltas.items() if cantidad
+        ]
+        if movimientos:
+            MovimientoStock.objects.bulk_create(movimientos)
+            _publicar_stock_al_confirmar([movimiento.ingrediente_id for movimiento in movimientos], sucursal_id)
+        return movimientos
+
+    def tomar_snapshot(self, batch_size=2000):
+        """
+        Guarda la cantidad actual de cada Stock. Devuelve cuántas filas escribió.
+        """
+        ahora = timezone.now()
+        total = 0
+        lote = []
+        filas = Stock.objects.annotate(
+            cantidad=F('cantidad_disponible') - _consumido_pendiente('pk')
+        ).order_by('pk').values_list('sucursal_id', 'ingrediente_id', 'cantidad')
+        for sucursal_id, ingrediente_id, cantidad in filas.iterator(chunk_size=batch_size):
+            lote.append(SnapshotStock(
+                sucursal_id=sucursal_id, ingrediente_id=ingrediente_id, cantidad=cantidad, fecha=ahora
+            ))
+            if len(lote) >= batch_size:
+                SnapshotStock.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            SnapshotStock.objects.bulk_create(lote)
+            total += len(lote)
+        return total
+
+    def stock_en(self, ingrediente_id, momento, sucursal_id=None):
+        """
+        Stock del ingrediente en la sucursal en `momento`: snapshot más
+        reciente anterior a ese momento más la suma de los movimientos entre
+        ambos.
+        """
+        filtro = Q(sucursal_id=_sucursal(sucursal_id), ingrediente_id=ingrediente_id, fecha__lte=momento)
+        snapshot = (
+            SnapshotStock.objects.filter(filtro)
+            .order_by('-fecha')
+            .values_list('cantidad', 'fecha')
+            .first()
+        )
+        movimientos = MovimientoStock.objects.filter(filtro)
+        base = Decimal('0')
+        if snapshot:
+            base, fecha_snapshot = snapshot
+            movimientos = movimientos.filter(fecha__gt=fecha_snapshot)
+        total = movimientos.aggregate(total=Sum('cantidad'))['total']
+        return base + (total or 0)
+
+
+# NOVEDADES PARA PANTALLAS
+class NovedadesService:
+    """
+    Eventos del canal de novedades (eventos.py). Se publican sólo los ids
+    que cambiaron, sin consultar la base, así una reserva no paga el armado
+    aunque nadie escuche. Al leerlos, expandir() los convierte en el stock
+    actual de los ingredientes y la disponibilidad de los platos que los
+    usan (dos consultas por evento distinto del lote).
+    """
+
+    def stock(self, ingrediente_ids, sucursal_id=None):
+        sucursal_id = _sucursal(sucursal_id)
+        filas = (
+            Stock.objects.filter(sucursal_id=sucursal_id, ingrediente_id__in=ingrediente_ids)
+            .annotate(cantidad=F('cantidad_disponible') - _consumido_pendiente('pk'))
+            .order_by('ingrediente_id')
+            .values_list('ingrediente_id', 'cantidad', 'bajo_minimo')
+        )
+        platos = Receta.objects.filter(ingrediente_id__in=ingrediente_ids).values('plato_id')
+        return {
+            'sucursal_id': sucursal_id,
+            'stock': [
+                {
+                    'ingrediente_id': ingrediente_id,
+                    # Mismo formato que /api/stock/ (SQLite no redondea expresiones)
+                    'cantidad_disponible': str(cantidad.quantize(Decimal('0.001'))),
+                    'bajo_minimo': bajo_minimo,
+                }
+                for ingrediente_id, cantidad, bajo_minimo in filas
+            ],
+            'disponibilidad': DisponibilidadService().calcular(plato_ids=platos, sucursal_id=sucursal_id),
+        }
+
+    def menu(self, plato_ids, sucursal_id=None):
+        """
+        Los platos pedidos que ya no están activos (o se borraron) salen en
+        'retirados'.
+        """
+        sucursal_id = _sucursal(sucursal_id)
+        disponibilidad = DisponibilidadService().calcular(plato_ids=plato_ids, sucursal_id=sucursal_id)
+        activos = {fila['plato_id'] for fila in disponibilidad}
+        return {
+            'sucursal_id': sucursal_id,
+            'disponibilidad': disponibilidad,
+            'retirados': [plato_id for plato_id in plato_ids if plato_id not in activos],
+        }
+
+    def publicar_stock(self, ingrediente_ids, sucursal_id=None):
+        return eventos.publicar('stock', {
+            'sucursal_id': _sucursal(sucursal_id), 'ingrediente_ids': list(ingrediente_ids)
+        })
+
+    def publicar_menu(self, plato_ids):
+        """
+        Un cambio de menú afecta la disponibilidad en todas las sucursales:
+        publica un evento por sucursal activa.
+        """
+        return [
+            eventos.publicar('menu', {'sucursal_id': sucursal_id, 'plato_ids': list(plato_ids)})
+            for sucursal_id in Sucursal.objects.filter(activa=True).order_by('pk').values_list('pk', flat=True)
+        ]
+
+    def expandir(self, nuevos):
+        """
+        nuevos: [(evento_id, tipo, datos)] leídos del broker. Devuelve la misma
+        lista con los datos armados a partir de los ids; los eventos repetidos
+        del lote se arman una sola vez y los que no traen ids pasan tal cual.
+        """
+        armados = {}
+        expandidos = []
+        for evento_id, tipo, datos in nuevos:
+            if tipo == 'stock' and 'ingrediente_ids' in datos:
+                clave = (tipo, datos['sucursal_id'], tuple(datos['ingrediente_ids']))
+                if clave not in armados:
+                    armados[clave] = self.stock(datos['ingrediente_ids'], datos['sucursal_id'])
+                datos = armados[clave]
+            elif tipo == 'menu' and 'plato_ids' in datos:
+                clave = (tipo, datos['sucursal_id'], tuple(datos['plato_ids']))
+                if clave not in armados:
+                    armados[clave] = self.menu(datos['plato_ids'], datos['sucursal_id'])
+                datos = armados[clave]
+            expandidos.append((evento_id, tipo, datos))
+        return expandidos
+
+
+# CONVERSIÓN DE UNIDADES
+class ConversionService:
+    """
+    Mantiene Receta.cantidad_base cuando cambia cómo se convierte un
+    ingrediente (su unidad_medida, densidad o peso_unidad). Las recetas se
+    normalizan al guardarse (signals.py y PlatoService); esto cubre el cambio
+    del otro lado. Cambiar la unidad de un ingrediente no convierte su stock:
+    los conteos se vuelven a cargar en la unidad nueva.
+    """
+
+    def _bases(self, ingredientes):
+        """
+        ingredientes: {id: Ingrediente} con los valores a usar (pueden no
+        estar guardados). Genera (receta, cantidad_base nueva).
+        """
+        recetas = Receta.objects.filter(ingrediente_id__in=list(ingredientes)).only(
+            'pk', 'plato_id', 'ingrediente_id', 'cantidad', 'unidad_medida', 'cantidad_base'
+        )
+        for receta in recetas:
+            ingrediente = ingredientes[receta.ingrediente_id]
+            yield receta, a_unidad_de_stock(receta.cantidad, receta.unidad_medida, ingrediente)
+
+    def validar_ingrediente(self, ingrediente):
+        """
+        Lanza ConversionImposible si alguna receta del ingrediente no se puede
+        convertir con sus valores actuales (sin guardar).
+        """
+        for _ in self._bases({ingrediente.pk: ingrediente}):
+            pass
+
+    def recalcular_recetas(self, ingrediente_ids):
+        """
+        Recalcula cantidad_base de las recetas de los ingredientes y guarda
+        sólo las que cambiaron. Devuelve cuántas actualizó.
+        """
+        ingredientes = Ingrediente.objects.in_bulk(list(ingrediente_ids))
+        modificadas = []
+        for receta, base in self._bases(ingredientes):
+            if receta.cantidad_base != base:
+                receta.cantidad_base = base
+                modificadas.append(receta)
+        if modificadas:
+            Receta.objects.bulk_update(modificadas, ['cantidad_base'])
+            _invalidar_menu_al_confirmar()
+            _invalidar_recetas_al_confirmar([receta.plato_id for receta in modificadas])
+            _publicar_menu_al_confirmar([receta.plato_id for receta in modificadas])
+            CostoService().recalcular(plato_ids=[receta.plato_id for receta in modificadas])
+        return len(modificadas)
+
+
+# COSTOS Y MÁRGENES
+class CostoService:
+    """
+    Mantiene Plato.costo y costo_completo: suma de cantidad_base por el
+    costo_unitario de cada ingrediente de la receta. Nunca se recalcula el
+    menú entero: se recalculan los platos cuyas recetas cambiaron y los que
+    usan un ingrediente cuyo costo cambió (se buscan por el índice de
+    Receta.ingrediente), de a `lote` platos por consulta.
+    """
+
+    def __init__(self, lote=500):
+        self.lote = lote
+
+    def platos_con(self, ingrediente_ids):
+        return set(
+            Receta.objects.filter(ingrediente_id__in=list(ingrediente_ids))
+            .values_list('plato_id', flat=True).distinct()
+        )
+
+    def recalcular(self, plato_ids=None, ingrediente_ids=None):
+        """
+        Recalcula el costo de `plato_ids` y de los platos que usan
+        `ingrediente_ids`, y guarda sólo los que cambiaron. Devuelve cuántos
+        actualizó.
+        """
+        ids = set(plato_ids or ())
+        if ingrediente_ids:
+            ids |= self.platos_con(ingrediente_ids)
+        ids = sorted(ids)
+
+        modificados = []
+        for inicio in range(0, len(ids), self.lote):
+            lote = ids[inicio:inicio + self.lote]
+            costos = {plato_id: Decimal('0') for plato_id in lote}
+            incompletos = set()
+            recetas = Receta.objects.filter(plato_id__in=lote).values_list(
+                'plato_id', 'cantidad_base', 'ingrediente__costo_unitario'
+            )
+            for plato_id, cantidad, costo_unitario in recetas:
+                if costo_unitario is None:
+                    incompletos.add(plato_id)
+                else:
+                    costos[plato_id] += cantidad * costo_unitario
+            for plato in Plato.objects.filter(pk__in=lote).only('pk', 'costo', 'costo_completo'):
+                costo = costos[plato.pk].quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+                completo = plato.pk not in incompletos
+                if (plato.costo, plato.costo_completo) != (costo, completo):
+                    plato.costo, plato.costo_completo = costo, completo
+                    modificados.append(plato)
+
+        if modificados:
+            Plato.objects.bulk_update(modificados, ['costo', 'costo_completo'], batch_size=self.lote)
+            _invalidar_menu_al_confirmar()
+        return len(modificados)
+
+
+# CARGA MASIVA DE PLATOS
+class PlatoService:
+    """
+    Alta y actualización masiva de platos con sus recetas. Las categorías e
+    ingredientes se resuelven con un in_bulk por tabla y las recetas se
+    sincronizan por diferencia: sólo se insertan, actualizan o borran las
+    líneas que cambiaron.
+    """
+
+    def _a_entero(self, valor):
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            return None
+
+    def _a_decimal_positivo(self, valor):
+        try:
+            numero = Decimal(str(valor))
+        except (InvalidOperation, ValueError):
+            return None
+        return numero if numero.is_finite() and numero > 0 else None
+
+    def _parsear_recetas(self, recetas_data, ingredientes, errores):
+        """
+        Devuelve {ingrediente_id: (cantidad, unidad_medida, cantidad_base)} y
+        agrega a `errores` las líneas inválidas o no convertibles a la unidad
+        del ingrediente.
+        """
+        if not isinstance(recetas_data, list):
+            errores.append('recetas debe ser una lista')
+            return {}
+
+        recetas = {}
+        for receta_data in recetas_data:
+            if not isinstance(receta_data, dict):
+                errores.append('cada receta debe ser un objeto')
+                continue
+            ingrediente_id = self._a_entero(receta_data.get('ingrediente_id'))
+            cantidad = self._a_decimal_positivo(receta_data.get('cantidad'))
+            unidad = receta_data.get('unidad_medida') or ''
+            if ingrediente_id not in ingredientes:
+                errores.append(f"ingrediente {receta_data.get('ingrediente_id')} no existe")
+            elif cantidad is None:
+                errores.append(f"cantidad inválida para ingrediente {ingrediente_id}")
+            elif ingrediente_id in recetas:
+                errores.append(f"ingrediente {ingrediente_id} repetido")
+            else:
+                try:
+                    base = a_unidad_de_stock(cantidad, unidad, ingredientes[ingrediente_id])
+                except ConversionImposible as error:
+                    errores.append(error.message)
+                    continue
+                recetas[ingrediente_id] = (cantidad, unidad, base)
+        return recetas
+
+    def _validar_item(self, item, platos, categorias, ingredientes):
+        """
+        Devuelve (errores, campos, recetas) para un ítem del lote.
+        recetas es None si el ítem no trae la clave 'recetas'.
+        """
+        errores = []
+        campos = {}
+        es_nuevo = 'id' not in item
+
+        if not es_nuevo and self._a_entero(item['id']) not in platos:
+            errores.append(f"plato {item['id']} no existe")
+
+        if 'nombre' in item or es_nuevo:
+            if not item.get('nombre'):
+                errores.append('nombre es requerido')
+            else:
+                campos['nombre'] = item['nombre']
+        if 'descripcion' in item:
+            campos['descripcion'] = item.get('descripcion') or ''
+        if 'precio' in item or es_nuevo:
+            precio = self._a_decimal_positivo(item.get('precio'))
+            if precio is None:
+                errores.append('precio debe ser un número mayor a 0')
+            else:
+                campos['precio'] = precio
+        if 'categoria' in item or es_nuevo:
+            categoria_id = self._a_entero(item.get('categoria'))
+            if categoria_id not in categorias:
+                errores.append('categoría inexistente')
+            else:
+                campos['categoria_id'] = categoria_id
+        if 'activo' in item:
+            campos['activo'] = bool(item['activo'])
+
+        recetas = None
+        if 'recetas' in item:
+            recetas = self._parsear_recetas(item['recetas'], ingredientes, errores)
+        return errores, campos, recetas
+
+    def sincronizar_recetas(self, recetas_por_plato):
+        """
+        recetas_por_plato: {plato_id: {ingrediente_id: (cantidad,
+        unidad_medida, cantidad_base)}}. Deja las recetas de cada plato
+        exactamente así, tocando sólo las filas que cambian (una consulta de
+        lectura y como máximo un bulk por operación).
+        """
+        if not recetas_por_plato:
+            return
+
+        existentes = {}
+        for receta in Receta.objects.filter(plato_id__in=list(recetas_por_plato)):
+            existentes[(receta.plato_id, receta.ingrediente_id)] = receta
+
+        nuevas, modificadas = [], []
+        for plato_id, recetas in recetas_por_plato.items():
+            for ingrediente_id, (cantidad, unidad, base) in recetas.items():
+                receta = existentes.pop((plato_id, ingrediente_id), None)
+                if receta is None:
+                    nuevas.append(Receta(
+                        plato_id=plato_id, ingrediente_id=ingrediente_id, cantidad=cantidad,
+                        unidad_medida=unidad, cantidad_base=base
+                    ))
+                elif (receta.cantidad, receta.unidad_medida, receta.cantidad_base) != (cantidad, unidad, base):
+                    receta.cantidad, receta.unidad_medida, receta.cantidad_base = cantidad, unidad, base
+                    modificadas.append(receta)
+
+        # Lo que queda en `existentes` ya no está en la receta pedida
+        if existentes:
+            Receta.objects.filter(pk__in=[receta.pk for receta in existentes.values()]).delete()
+        if modificadas:
+            Receta.objects.bulk_update(modificadas, ['cantidad', 'unidad_medida', 'cantidad_base'])
+        if nuevas:
+            Receta.objects.bulk_create(nuevas)
+        if existentes or modificadas or nuevas:
+            _invalidar_recetas_al_confirmar(recetas_por_plato)
+            CostoService().recalcular(plato_ids=recetas_por_plato)
+
+    def guardar_recetas(self, plato, recetas_data):
+        """
+        Reemplaza las recetas de un plato a partir de los datos de la API,
+        ignorando las líneas con ingredientes inexistentes o sin cantidad.
+        Una unidad que no se puede convertir a la del ingrediente lanza
+        ConversionImposible.
+        """
+        if not isinstance(recetas_data, list):
+            recetas_data = []
+        lineas = [
+            (
+                self._a_entero(receta_data.get('ingrediente_id')),
+                self._a_decimal_positivo(receta_data.get('cantidad')),
+                receta_data.get('unidad_medida') or ''
+            )
+            for receta_data in recetas_data if isinstance(receta_data, dict)
+        ]
+        ingredientes = Ingrediente.objects.in_bulk(
+            [ingrediente_id for ingrediente_id, _, _ in lineas if ingrediente_id is not None]
+        )
+        recetas = {
+            ingrediente_id: (cantidad, unidad, a_unidad_de_stock(cantidad, unidad, ingredientes[ingrediente_id]))
+            for ingrediente_id, cantidad, unidad in lineas
+            if ingrediente_id in ingredientes and cantidad is not None
+        }
+        self.sincronizar_recetas({plato.id: recetas})
+        _invalidar_menu_al_confirmar()
+        _publicar_menu_al_confirmar([plato.id])
+
+    @transaction.atomic
+    def guardar_platos(self, items):
+        """
+        Crea (ítems sin 'id') o actualiza (ítems con 'id') muchos platos en
+        una transacción. Los ítems con errores no se aplican y se informan
+        en el resultado, uno por ítem y en el mismo orden.
+        """
+        plato_ids, categoria_ids, ingrediente_ids = set(), set(), set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            plato_ids.add(self._a_entero(item.get('id')))
+            categoria_ids.add(self._a_entero(item.get('categoria')))
+            # Un 'recetas' que no es lista lo informa _validar_item
+            recetas_data = item.get('recetas')
+            for receta_data in recetas_data if isinstance(recetas_data, list) else []:
+                if isinstance(receta_data, dict):
+                    ingrediente_ids.add(self._a_entero(receta_data.get('ingrediente_id')))
+
+        platos = Plato.objects.in_bulk([pk for pk in plato_ids if pk is not None])
+        categorias = CategoriaMenu.objects.in_bulk([pk for pk in categoria_ids if pk is not None])
+        ingredientes = Ingrediente.objects.in_bulk([pk for pk in ingrediente_ids if pk is not None])
+
+        resultados = []
+        # Cada plato actualizado escribe sólo los campos que trajo su ítem: los
+        # demás valores vienen de in_bulk sin bloqueo y pisarían ediciones
+        # concurrentes. Un bulk_update por combinación de campos
+        nuevos, actualizados, por_campos = [], [], defaultdict(list)
+        recetas_nuevos, recetas_por_plato = [], {}
+        vistos = set()
+        for indice, item in enumerate(items):
+            if not isinstance(item, dict):
+                resultados.append({'indice': indice, 'success': False, 'errores': ['el ítem debe ser un objeto']})
+                continue
+
+            errores, campos, recetas = self._validar_item(item, platos, categorias, ingredientes)
+            plato_id = self._a_entero(item.get('id'))
+            if plato_id is not None and plato_id in vistos:
+                errores.append(f'plato {plato_id} repetido en el lote')
+            if errores:
+                resultados.append({'indice': indice, 'success': False, 'errores': errores})
+                continue
+
+            if 'id' not in item:
+                plato = Plato(**campos)
+                nuevos.append(plato)
+                recetas_nuevos.append(recetas)
+                resultados.append({'indice': indice, 'success': True, 'accion': 'creado', 'plato': plato})
+            else:
+                vistos.add(plato_id)
+                plato = platos[plato_id]
+                for campo, valor in campos.items():
+                    setattr(plato, campo, valor)
+                por_campos[tuple(sorted(campos))].append(plato)
+                actualizados.append(plato)
+                if recetas is not None:
+                    recetas_por_plato[plato.id] = recetas
+                resultados.append({'indice': indice, 'success': True, 'accion': 'actualizado', 'plato': plato})
+
+        if nuevos:
+            Plato.objects.bulk_create(nuevos)
+            for plato, recetas in zip(nuevos, recetas_nuevos):
+                if recetas:
+                    recetas_por_plato[plato.id] = recetas
+        for campos, modificados in por_campos.items():
+            if campos:
+                Plato.objects.bulk_update(modificados, campos)
+        self.sincronizar_recetas(recetas_por_plato)
+
+        if nuevos or actualizados:
+            _invalidar_menu_al_confirmar()
+            _publicar_menu_al_confirmar([plato.id for plato in nuevos + actualizados])
+
+        for resultado in resultados:
+            plato = resultado.pop('plato', None)
+            if plato is not None:
+                resultado['id'] = plato.id
+        return resultados
+
+
+# IMPORTACIÓN DE INGREDIENTES Y STOCK
+class ImportadorStock:
+    """
+    Importa ingredientes y conteos de stock desde CSV o JSON-lines.
+
+    Las líneas se leen de a una (sirve cualquier iterable de strings: un
+    archivo abierto, un upload decodificado, etc.) y se aplican en lotes de
+    `batch_size`, cada lote en su propia transacción, así que la memoria no
+    depende del tamaño del archivo.
+
+    Columnas: nombre (clave), unidad_medida, stock_minimo, costo_unitario,
+    cantidad_disponible, unidad_cantidad. Un ingrediente nuevo necesita
+    unidad_medida; el resto de columnas es opcional y sólo se actualiza si
+    viene con valor. Las cantidades son el conteo de la sucursal indicada
+    (sin ella, la predeterminada); con unidad_cantidad se convierten a la
+    unidad del ingrediente antes de guardarse. Un archivo de sólo nombre y
+    costo_unitario actualiza precios: se recalcula el costo de los platos que
+    usan los ingredientes que cambiaron.
+    """
+
+    FORMATOS = ('csv', 'jsonl')
+
+    def __init__(self, batch_size=1000, max_rechazos=100, progreso=None, sucursal_id=None):
+        self.sucursal_id = _sucursal(sucursal_id)
+        self.batch_size = batch_size
+        self.max_rechazos = max_rechazos
+        self.progreso = progreso
+        self.unidades = {codigo for codigo, _ in Ingrediente.UNIDADES}
+
+    def _filas(self, lineas, formato):
+        """
+        Genera (numero_de_linea, dict) o (numero_de_linea, mensaje_de_error).
+        """
+        if formato == 'csv':
+            reader = csv.DictReader(lineas)
+            for fila in reader:
+                yield reader.line_num, fila
+        else:
+            for numero, linea in enumerate(lineas, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    yield numero, 'JSON inválido'
+                    continue
+                yield numero, fila if isinstance(fila, dict) else 'se espera un objeto JSON'
+
+    def _limpiar(self, fila):
+        """
+        Devuelve (datos, None) o (None, error).
+        """
+        nombre = str(fila.get('nombre') or '').strip()
+        if not nombre:
+            return None, 'nombre es requerido'
+        datos = {'nombre': nombre}
+
+        unidad = str(fila.get('unidad_medida') or '').strip()
+        if unidad:
+            if unidad not in self.unidades:
+                return None, f'unidad_medida inválida: {unidad}'
+            datos['unidad_medida'] = unidad
+
+        stock_minimo = fila.get('stock_minimo')
+        if stock_minimo not in (None, ''):
+            try:
+                datos['stock_minimo'] = int(stock_minimo)
+            except (TypeError, ValueError):
+                return None, 'stock_minimo debe ser un entero'
+
+        costo = fila.get('costo_unitario')
+        if costo not in (None, ''):
+            try:
+                costo = Decimal(str(costo))
+            except InvalidOperation:
+                return None, 'costo_unitario debe ser un número'
+            if not costo.is_finite() or costo < 0:
+                return None, 'costo_unitario debe ser mayor o igual a 0'
+            datos['costo_unitario'] = costo.quantize(DECIMALES_COSTO, rounding=ROUND_HALF_UP)
+
+        cantidad = fila.get('cantidad_disponible')
+        if cantidad not in (None, ''):
+            try:
+                cantidad = Decimal(str(cantidad))
+            except InvalidOperation:
+                return None, 'cantidad_disponible debe ser un número'
+            if not cantidad.is_finite() or cantidad < 0:
+                return None, 'cantidad_disponible debe ser mayor o igual a 0'
+            datos['cantidad_disponible'] = cantidad
+
+        unidad_cantidad = str(fila.get('unidad_cantidad') or '').strip()
+        if unidad_cantidad:
+            if unidad_cantidad not in self.unidades:
+                return None, f'unidad_cantidad inválida: {unidad_cantidad}'
+            datos['unidad_cantidad'] = unidad_cantidad
+        return datos, None
+
+    def _convertir(self, datos, ingrediente):
+        """
+        cantidad_disponible de la línea en la unidad del ingrediente.
+        """
+        cantidad = datos['cantidad_disponible']
+        unidad = datos.get('unidad_cantidad')
+        if unidad and unidad != ingrediente['unidad_medida']:
+            cantidad *= factor(
+                unidad, ingrediente['unidad_medida'], ingrediente['densidad'], ingrediente['peso_unidad']
+            )
+        return cantidad.quantize(DECIMALES_BASE, rounding=ROUND_HALF_UP)
+
+    @transaction.atomic
+    def _aplicar_lote(self, lote, resumen):
+        """
+        lote: {nombre: (numero_de_linea, datos)}. Hace un SELECT de los
+        ingredientes existentes, un bulk_create y un bulk_update de
+        ingredientes y un upsert de Stock.
+        """
+        # Se leen tuplas y no modelos: instanciar miles de Ingrediente sólo
+        # para compararlos es la parte más cara del lote
+        existentes = {}
+        filas = Ingrediente.objects.filter(nombre__in=list(lote)).order_by('-pk').values_list(
+            'nombre', 'pk', 'unidad_medida', 'stock_minimo', 'costo_unitario', 'densidad', 'peso_unidad'
+        )
+        for nombre, pk, unidad_medida, stock_minimo, costo_unitario, densidad, peso_unidad in filas:
+            # Con nombres duplicados en la base gana el de menor pk
+            existentes[nombre] = {
+                'pk': pk, 'unidad_medida': unidad_medida, 'stock_minimo': stock_minimo,
+                'costo_unitario': costo_unitario, 'densidad': densidad, 'peso_unidad': peso_unidad
+            }
+
+        nuevos, modificados, campos, cambio_unidad, cambio_costo = [], [], set(), [], []
+        for nombre, (numero, datos) in list(lote.items()):
+            actual = existentes.get(nombre)
+            if actual is None:
+                if 'unidad_medida' not in datos:
+                    self._rechazar(resumen, numero, 'unidad_medida es requerida para un ingrediente nuevo')
+                    del lote[nombre]
+                    continue
+                nuevos.append(Ingrediente(
+                    nombre=nombre,
+                    unidad_medida=datos['unidad_medida'],
+                    stock_minimo=datos.get('stock_minimo', 0),
+                    costo_unitario=datos.get('costo_unitario')
+                ))
+                continue
+
+            cambios = [
+                campo for campo in ('unidad_medida', 'stock_minimo', 'costo_unitario')
+                if campo in datos and actual[campo] != datos[campo]
+            ]
+            if 'unidad_medida' in cambios:
+                # Las recetas existentes tienen que poder convertirse a la
+                # unidad nueva; si no, se rechaza la línea y no el lote
+                try:
+                    ConversionService().validar_ingrediente(Ingrediente(
+                        pk=actual['pk'], nombre=nombre, unidad_medida=datos['unidad_medida'],
+                        densidad=actual['densidad'], peso_unidad=actual['peso_unidad']
+                    ))
+                except ConversionImposible as error:
+                    self._rechazar(resumen, numero, f'{nombre}: {error.message}')
+                    del lote[nombre]
+                    continue
+            if cambios:
+                if 'unidad_medida' in cambios:
+                    cambio_unidad.append(actual['pk'])
+                if 'costo_unitario' in cambios:
+                    cambio_costo.append(actual['pk'])
+                actual.update({campo: datos[campo] for campo in cambios})
+                modificados.append(Ingrediente(
+                    pk=actual['pk'],
+                    nombre=nombre,
+                    unidad_medida=actual['unidad_medida'],
+                    stock_minimo=actual['stock_minimo'],
+                    costo_unitario=actual['costo_unitario']
+                ))
+                campos.update(cambios)
+
+        if nuevos:
+            Ingrediente.objects.bulk_create(nuevos)
+            for ingrediente in nuevos:
+                existentes[ingrediente.nombre] = {
+                    'pk': ingrediente.pk, 'unidad_medida': ingrediente.unidad_medida,
+                    'densidad': None, 'peso_unidad': None
+                }
+        if modificados:
+            Ingrediente.objects.bulk_update(modificados, sorted(campos))
+            _invalidar_menu_al_confirmar()
+        if cambio_unidad:
+            # Las recetas siguen escritas en su unidad; cambia su equivalente
+            ConversionService().recalcular_recetas(cambio_unidad)
+        if cambio_costo:
+            CostoService().recalcular(ingrediente_ids=cambio_costo)
+
+        stocks = []
+        for nombre, (numero, datos) in list(lote.items()):
+            if 'cantidad_disponible' not in datos:
+                continue
+            try:
+                cantidad = self._convertir(datos, existentes[nombre])
+            except ConversionImposible as error:
+                # El ingrediente ya quedó guardado; se rechaza sólo el conteo
+                self._rechazar(resumen, numero, f'{nombre}: {error.message}')
+                del lote[nombre]
+                continue
+            stocks.append(Stock(
+                sucursal_id=self.sucursal_id,
+                ingrediente_id=existentes[nombre]['pk'],
+                cantidad_disponible=cantidad
+            ))
+        if stocks:
+            # El conteo importado reemplaza lo reservado en fragmentos: se
+            # consolida antes para que el delta del libro sea el real y
+            # después para repartir los cupos sobre la cantidad nueva
+            ingrediente_ids = [stock.ingrediente_id for stock in stocks]
+            previas = Stock.objects.filter(sucursal_id=self.sucursal_id, ingrediente_id__in=ingrediente_ids)
+            # Se bloquean en orden de pk, como las reservas, antes de consolidar
+            list(previas.select_for_update().order_by('pk').values_list('pk', flat=True))
+            fragmentos = FragmentoStockService()
+            fragmentos.consolidar(ingrediente_ids=ingrediente_ids, sucursal_id=self.sucursal_id)
+            # Cantidades previas para registrar el delta en el libro
+            anteriores = dict(previas.values_list('ingrediente_id', 'cantidad_disponible'))
+            Stock.objects.bulk_create(
+                stocks,
+                update_conflicts=True,
+                unique_fields=['sucursal', 'ingrediente'],
+                update_fields=['cantidad_disponible']
+            )
+            _invalidar_stock_al_confirmar()
+            MovimientoService().registrar(
+                {
+                    stock.ingrediente_id: stock.cantidad_disponible - anteriores.get(stock.ingrediente_id, 0)
+                    for stock in stocks
+                },
+                'importacion',
+                sucursal_id=self.sucursal_id
+            )
+            fragmentos.consolidar(ingrediente_ids=ingrediente_ids, sucursal_id=self.sucursal_id)
+
+        # Cambios de cantidad o de stock_minimo pueden cruzar el umbral
+        tocados = [ingrediente.pk for ingrediente in modificados] + [stock.ingrediente_id for stock in stocks]
+        if tocados:
+            AlertaStockService().actualizar_umbrales(ingrediente_ids=tocados)
+
+        resumen['ingredientes_creados'] += len(nuevos)
+        resumen['ingredientes_actualizados'] += len(modificados)
+        resumen['stocks'] += len(stocks)
+        resumen['procesadas'] += len(lote)
+
+    def _rechazar(self, resumen, numero, error):
+        resumen['rechazadas'] += 1
+        if len(resumen['rechazos']) < self.max_rechazos:
+            resumen['rechazos'].append({'linea': numero, 'error': error})
+
+    def importar(self, lineas, formato='csv'):
+        if formato not in self.FORMATOS:
+            raise ValidationError(f"Formato no soportado: {formato}")
+
+        resumen = {
+            'procesadas': 0,
+            'rechazadas': 0,
+            'ingredientes_creados': 0,
+            'ingredientes_actualizados': 0,
+            'stocks': 0,
+            'rechazos': [],
+        }
+        lote = {}
+        for numero, fila in self._filas(lineas, formato):
+            if isinstance(fila, str):
+                self._rechazar(resumen, numero, fila)
+                continue
+            datos, error = self._limpiar(fila)
+            if error:
+                self._rechazar(resumen, numero, error)
+                continue
+
+            # Si un nombre se repite dentro del lote gana la última línea
+            lote[datos['nombre']] = (numero, datos)
+            if len(lote) >= self.batch_size:
+                self._aplicar_lote(lote, resumen)
+                lote = {}
+                if self.progreso:
+                    self.progreso(resumen)
+
+        if lote:
+            self._aplicar_lote(lote, resumen)
+            if self.progreso:
+                self.progreso(resumen)
+        return resumen
+
+
+# EXPORTACIÓN
+class _Eco:
+    """
+    Pseudo-archivo para csv.writer: devuelve la línea en vez de escribirla.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+class Exportador:
+    """
+    Exporta stock, menú y reservas como CSV o JSON-lines. Las filas se leen
+    como tuplas con .iterator(chunk_size) (cursor del lado del servidor en
+    PostgreSQL) y se devuelven en bloques de texto, así que la memoria no
+    crece con la cantidad de filas.
+    """
+
+    FORMATOS = ('csv', 'jsonl')
+
+    def __init__(self, chunk_size=2000):
+        self.chunk_size = chunk_size
+
+    def stock(self, sucursal_id=None):
+        """
+        Sin sucursal_id exporta el stock de todas las sucursales.
+        """
+        columnas = [
+            'id', 'sucursal_id', 'ingrediente_id', 'ingrediente', 'unidad_medida', 'stock_minimo',
+            'cantidad_disponible'
+        ]
+        stocks = Stock.objects.all()
+        if sucursal_id:
+            stocks = stocks.filter(sucursal_id=sucursal_id)
+        filas = stocks.order_by('pk').values_list(
+            'pk', 'sucursal_id', 'ingrediente_id', 'ingrediente__nombre', 'ingrediente__unidad_medida',
+            'ingrediente__stock_minimo', 'cantidad_disponible'
+        )
+        return columnas, filas.iterator(chunk_size=self.chunk_size)
+
+    def platos(self):
+        # Una fila por línea de receta; los platos sin receta salen con una
+        # fila de ingrediente vacío. cantidad está en unidad_receta (vacía: la
+        # del ingrediente); cantidad_base, en unidad_medida
+        columnas = [
+            'plato_id', 'plato', 'categoria', 'precio', 'activo',
+            'ingrediente_id', 'ingrediente', 'unidad_medida', 'cantidad', 'unidad_receta', 'cantidad_base'
+        ]
+        filas = Plato.objects.order_by('pk', 'recetas__pk').values_list(
+            'pk', 'nombre', 'categoria__nombre', 'precio', 'activo',
+            'recetas__ingrediente_id', 'recetas__ingrediente__nombre',
+            'recetas__ingrediente__unidad_medida', 'recetas__cantidad',
+            'recetas__unidad_medida', 'recetas__cantidad_base'
+        )
+        return columnas, filas.iterator(chunk_size=self.chunk_size)
+
+    def reservas(self, desde=None, hasta=None, sucursal_id=None):
+        columnas = ['id', 'sucursal_id', 'pedido_id', 'plato_id', 'plato', 'cantidad', 'estado', 'fecha_creacion']
+        reservas = ReservaStock.objects.all()
+        if sucursal_id:
+            reservas = reservas.filter(sucursal_id=sucursal_id)
+        if desde:
+            reservas = reservas.filter(fecha_creacion__gte=desde)
+        if hasta:
+            reservas = reservas.filter(fecha_creacion__lt=hasta)
+        filas = reservas.order_by('pk').values_list(
+            'pk', 'sucursal_id', 'pedido_id', 'plato_id', 'plato__nombre', 'cantidad', 'estado', 'fecha_creacion'
+        )
+        return columnas, filas.iterator(chunk_size=self.chunk_size)
+
+    def serializar(self, columnas, filas, formato='csv'):
+        """
+        Genera bloques de texto de hasta chunk_size filas.
+        """
+        if formato not in self.FORMATOS:
+            raise ValidationError(f"Formato no soportado: {formato}")
+
+        if formato == 'csv':
+            writer = csv.writer(_Eco())
+            yield writer.writerow(columnas)
+            convertir = writer.writerow
+        else:
+            encoder = DjangoJSONEncoder()
+
+            def convertir(fila):
+                return encoder.encode(dict(zip(columnas, fila))) + '\n'
+
+        bloque = []
+        for fila in filas:
+            bloque.append(convertir(fila))
+            if len(bloque) >= self.chunk_size:
+                yield ''.join(bloque)
+                bloque = []
+        if bloque:
+            yield ''.join(bloque)
@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .matriz_recetas import invalidar_recetas
+from .menu_cache import invalidar_menu, invalidar_stock
+from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock
+from .services import (
+    AlertaStockService, ConversionService, CostoService, FragmentoStockService, MovimientoService,
+    _publicar_menu_al_confirmar
+)
+from .unidades import a_unidad_de_stock
+
+
+@receiver([post_save, post_delete], sender=Plato)
+@receiver([post_save, post_delete], sender=Receta)
+@receiver([post_save, post_delete], sender=CategoriaMenu)
+@receiver([post_save, post_delete], sender=Ingrediente)
+def invalidar_menu_al_cambiar(sender, **kwargs):
+    # Se invalida ya y otra vez al confirmar la transacción: un snapshot
+    # construido entre medio todavía no ve el cambio y debe descartarse
+    invalidar_menu()
+    transaction.on_commit(invalidar_menu)
+
+
+@receiver([post_save, post_delete], sender=Plato)
+@receiver([post_save, post_delete], sender=Receta)
+def publicar_menu_al_cambiar(sender, instance, **kwargs):
+    # Los cambios de stock se publican desde el libro de movimientos
+    _publicar_menu_al_confirmar([instance.pk if sender is Plato else instance.plato_id])
+
+
+@receiver([post_save, post_delete], sender=Receta)
+def invalidar_matriz_al_cambiar(sender, instance, **kwargs):
+    plato_id = instance.plato_id
+    transaction.on_commit(lambda: invalidar_recetas([plato_id]))
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def invalidar_stock_al_cambiar(sender, **kwargs):
+    invalidar_stock()
+    transaction.on_commit(invalidar_stock)
+
+
+@receiver(post_save, sender=Stock)
+def revisar_umbral_stock(sender, instance, **kwargs):
+    # Ediciones desde formularios o el admin; los servicios que escriben con
+    # update() revisan el umbral por su cuenta
+    AlertaStockService().actualizar_umbrales(stock_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Ingrediente)
+def revisar_umbral_ingrediente(sender, instance, created, **kwargs):
+    if not created:
+        AlertaStockService().actualizar_umbrales(ingrediente_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=Receta)
+def normalizar_receta(sender, instance, raw=False, **kwargs):
+    # Recetas guardadas de a una (formularios, admin, create()); la carga
+    # masiva de PlatoService calcula cantidad_base por su cuenta
+    if not raw:
+        instance.cantidad_base = a_unidad_de_stock(instance.cantidad, instance.unidad_medida, instance.ingrediente)
+
+
+# Campos de Ingrediente de los que dependen cantidad_base y el costo de los
+# platos: guardar el ingrediente sin cambiarlos no recalcula nada
+CAMPOS_CONVERSION = ('unidad_medida', 'densidad', 'peso_unidad')
+CAMPOS_COSTO = ('costo_unitario', 'densidad', 'peso_unidad')
+
+
+@receiver(pre_save, sender=Ingrediente)
+def recordar_ingrediente_anterior(sender, instance, raw=False, **kwargs):
+    instance._ingrediente_anterior = None
+    if instance.pk and not raw:
+        instance._ingrediente_anterior = (
+            Ingrediente.objects.filter(pk=instance.pk)
+            .values('unidad_medida', 'densidad', 'peso_unidad', 'costo_unitario')
+            .first()
+        )
+
+
+def _cambio(instance, campos):
+    anterior = getattr(instance, '_ingrediente_anterior', None)
+    if anterior is None:
+        return True
+    return any(
+        Ingrediente._meta.get_field(campo).to_python(getattr(instance, campo)) != anterior[campo]
+        for campo in campos
+    )
+
+
+@receiver(post_save, sender=Ingrediente)
+def recalcular_recetas(sender, instance, created, raw=False, **kwargs):
+    # Cambiar unidad_medida, densidad o peso_unidad cambia el equivalente de
+    # las recetas en la unidad del stock
+    if not created and not raw and _cambio(instance, CAMPOS_CONVERSION):
+        ConversionService().recalcular_recetas([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Receta)
+def recalcular_costo_plato(sender, instance, raw=False, **kwargs):
+    # La carga masiva de PlatoService recalcula los costos por su cuenta
+    if not raw:
+        CostoService().recalcular(plato_ids=[instance.plato_id])
+
+
+@receiver(post_save, sender=Ingrediente)
+def recalcular_costos_ingrediente(sender, instance, created, raw=False, **kwargs):
+    # Sólo los platos que usan el ingrediente; si cambió la conversión,
+    # recalcular_recetas ya actualizó cantidad_base
+    if not created and not raw and _cambio(instance, CAMPOS_COSTO):
+        CostoService().recalcular(ingrediente_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Ingrediente)
+def reconfigurar_fragmentos(sender, instance, created, **kwargs):
+    # Cambiar fragmentos_stock crea o borra fragmentos y reparte los cupos
+    if not created:
+        FragmentoStockService().consolidar(ingrediente_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=Stock)
+def recordar_stock_anterior(sender, instance, raw=False, **kwargs):
+    instance._stock_anterior = None
+    if instance.pk and not raw:
+        # Lo reservado en fragmentos se descuenta antes de leer la cantidad
+        # anterior: el valor guardado reemplaza al stock real
+        FragmentoStockService().consolidar(stock_ids=[instance.pk])
+        instance._stock_anterior = (
+            Stock.objects.filter(pk=instance.pk)
+            .values_list('sucursal_id', 'ingrediente_id', 'cantidad_disponible')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Stock)
+def registrar_ajuste_manual(sender, instance, raw=False, **kwargs):
+    # Altas y ediciones de Stock por formulario o admin quedan en el libro
+    # como ajustes manuales
+    if raw:
+        return
+    FragmentoStockService().consolidar(stock_ids=[instance.pk])
+    cantidad = Stock._meta.get_field('cantidad_disponible').to_python(instance.cantidad_disponible)
+    deltas = {instance.ingrediente_id: cantidad}
+    anterior = getattr(instance, '_stock_anterior', None)
+    if anterior:
+        sucursal_id, ingrediente_id, cantidad_anterior = anterior
+        if sucursal_id != instance.sucursal_id:
+            # La fila cambió de sucursal: sale de la anterior y entra en la nueva
+            MovimientoService().registrar({ingrediente_id: -cantidad_anterior}, 'ajuste', sucursal_id=sucursal_id)
+        else:
+            deltas[ingrediente_id] = deltas.get(ingrediente_id, 0) - cantidad_anterior
+    MovimientoService().registrar(deltas, 'ajuste', sucursal_id=instance.sucursal_id)
@@ -1,9 +1,38 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock
-from .services import StockService
+from . import benchmark, eventos, matriz_recetas, metricas
+from .cola_reservas import ColaReservas
+from .models import (
+    AlertaStock, CategoriaMenu, DemandaHoraria, Ingrediente, MarcaProceso, MovimientoStock, Plato, Receta,
+    ReservaStock, SnapshotStock, Stock, Sucursal
+)
+from .services import (
+    ConversionService, CostoService, DemandaService, DisponibilidadService, FragmentoStockService,
+    ImportadorStock, MovimientoService, NovedadesService, PlatoService, ReservaDuplicada, StockService
+)
+from .pronostico import PronosticoService
+from .unidades import ConversionImposible, factor
 
 class PlatoAPITests(APITestCase):
     
@@ -140,7 +169,8 @@ class PlatoAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         plato.refresh_from_db()
         self.assertEqual(plato.nombre, 'Plato Actualizado')
-        self.assertEqual(plato.precio, 15.99)
+        # precio es DecimalField: comparado con el float 15.99 nunca sería igual
+        self.assertEqual(plato.precio, Decimal('15.99'))
     
     def test_eliminar_plato(self):
         """
@@ -258,6 +288,113 @@ class StockServiceTests(TestCase):
         
         self.assertIn("no encontrado", str(context.exception).lower())
 
+    def test_reserva_numero_fijo_de_consultas(self):
+        """
+        La reserva no debe depender del número de ingredientes del plato
+        """
+        for i in range(10):
+            ingrediente = Ingrediente.objects.create(nombre=f"Extra {i}", unidad_medida="gr")
+            Receta.objects.create(plato=self.plato, ingrediente=ingrediente, cantidad=1)
+            Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=100)
+
+        service = StockService()
+        # pedido existente + savepoint + plato + stock bloqueado + UPDATE +
+        # movimientos + INSERT + release
+        with self.assertNumQueries(8):
+            service.validar_y_reservar_stock(
+                plato_id=self.plato.id,
+                cantidad=1,
+                pedido_id="TEST-004"
+            )
+
+        self.assertEqual(
+            Stock.objects.get(ingrediente__nombre="Extra 0").cantidad_disponible, 99
+        )
+
+    def test_reintento_concurrente(self):
+        """
+        Si dos intentos no ven la reserva del otro, la restricción única
+        revierte el segundo y devuelve la reserva del primero
+        """
+        service = StockService()
+        primera = service.validar_y_reservar_stock(self.plato.id, 1, "TEST-006")
+
+        original = StockService._reserva_del_plato
+        llamadas = []
+
+        def sin_ver_la_primera(self, plato_id, cantidad, pedido_id, sucursal_id):
+            llamadas.append(pedido_id)
+            if len(llamadas) == 1:
+                return None, 0
+            return original(self, plato_id, cantidad, pedido_id, sucursal_id)
+
+        with mock.patch.object(StockService, '_reserva_del_plato', sin_ver_la_primera):
+            segunda = service.validar_y_reservar_stock(self.plato.id, 1, "TEST-006")
+
+        self.assertEqual(len(llamadas), 2)
+        self.assertEqual(segunda.pk, primera.pk)
+        self.assertEqual(ReservaStock.objects.filter(pedido_id="TEST-006").count(), 1)
+        self.assertEqual(
+            Stock.objects.get(ingrediente=self.ingrediente1).cantidad_disponible, 8
+        )
+
+    def test_platos_de_un_pedido_en_llamadas_separadas(self):
+        """
+        Cada plato de un pedido se puede reservar con su propia llamada: la
+        clave es (pedido_id, plato) y cada uno toma la siguiente línea
+        """
+        ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=5, categoria=self.categoria)
+        Receta.objects.create(plato=ensalada, ingrediente=self.ingrediente1, cantidad=1)
+        service = StockService()
+
+        pizza = service.validar_y_reservar_stock(self.plato.id, 1, "TEST-007")
+        segunda = service.validar_y_reservar_stock(ensalada.id, 2, "TEST-007")
+
+        self.assertEqual((pizza.linea, segunda.linea), (0, 1))
+        self.assertEqual(service.validar_y_reservar_stock(ensalada.id, 2, "TEST-007").pk, segunda.pk)
+        with self.assertRaises(ReservaDuplicada):
+            service.validar_y_reservar_stock(ensalada.id, 3, "TEST-007")
+        # 10 - 2 (pizza) - 2 (ensalada)
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente1).cantidad_disponible, 6)
+
+    def test_reserva_sin_stock_configurado(self):
+        """
+        Un ingrediente de la receta sin fila de Stock es un error de configuración
+        """
+        sin_stock = Ingrediente.objects.create(nombre="Albahaca", unidad_medida="gr")
+        Receta.objects.create(plato=self.plato, ingrediente=sin_stock, cantidad=1)
+
+        service = StockService()
+        with self.assertRaises(ValidationError) as context:
+            service.validar_y_reservar_stock(
+                plato_id=self.plato.id,
+                cantidad=1,
+                pedido_id="TEST-005"
+            )
+
+        self.assertIn("configuración", str(context.exception))
+        self.assertEqual(ReservaStock.objects.count(), 0)
+
+    def test_descuento_condicional_no_deja_stock_negativo(self):
+        """
+        Si el stock cambia entre la validación y el UPDATE no se descuenta nada
+        """
+        service = StockService()
+        platos = service._cargar_platos([self.plato.id])
+        filas = service._bloquear_stock(platos, settings.SUCURSAL_PREDETERMINADA)
+        demanda = service._calcular_demanda(filas, {self.plato.id: 2})
+        service._validar_demanda(demanda)
+
+        # Otro pedido consume el tomate antes del descuento
+        Stock.objects.filter(ingrediente=self.ingrediente1).update(cantidad_disponible=1)
+
+        with self.assertRaises(ValidationError):
+            service._descontar_demanda(demanda)
+
+        self.assertEqual(
+            Stock.objects.get(ingrediente=self.ingrediente1).cantidad_disponible, 1
+        )
+
 
 class StockAPITests(APITestCase):
     """
@@ -276,6 +413,7 @@ class StockAPITests(APITestCase):
         )
         Receta.objects.create(plato=self.plato, ingrediente=self.ingrediente, cantidad=2)
         Stock.objects.create(ingrediente=self.ingrediente, cantidad_disponible=10)
+        cache.clear()
     
     def test_validar_reservar_stock_exitoso(self):
         """
@@ -293,6 +431,25 @@ class StockAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['success'])
         self.assertIn('reserva_id', response.data)
+
+    def test_validar_reservar_otro_plato_del_mismo_pedido(self):
+        """
+        Un segundo plato del mismo pedido no es un duplicado (no 409)
+        """
+        ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=5, categoria=self.categoria)
+        Receta.objects.create(plato=ensalada, ingrediente=self.ingrediente, cantidad=1)
+        url = reverse('stock-validar-reservar')
+
+        for plato in (self.plato, ensalada):
+            response = self.client.post(url, {
+                'plato_id': plato.id, 'cantidad': 1, 'pedido_id': 'PED-002'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(url, {
+            'plato_id': ensalada.id, 'cantidad': 2, 'pedido_id': 'PED-002'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
     
     def test_validar_reservar_stock_insuficiente(self):
         """
@@ -310,3 +467,1972 @@ class StockAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertFalse(response.data['success'])
         self.assertIn('insuficiente', response.data['message'].lower())
+
+    def test_plato_id_invalido(self):
+        response = self.client.post(reverse('stock-validar-reservar'), {
+            'plato_id': 'pizza', 'cantidad': 1, 'pedido_id': 'PED-001'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'plato_id debe ser un número válido')
+
+    def test_reintento_devuelve_la_misma_reserva(self):
+        """
+        Un reintento del mismo pedido sale del cache y no descuenta de nuevo
+        """
+        url = reverse('stock-validar-reservar')
+        data = {'plato_id': self.plato.id, 'cantidad': 2, 'pedido_id': 'PED-001'}
+
+        primera = self.client.post(url, data, format='json')
+        with self.assertNumQueries(0):
+            segunda = self.client.post(url, data, format='json')
+
+        self.assertEqual(primera.data, segunda.data)
+        self.assertEqual(ReservaStock.objects.filter(pedido_id='PED-001').count(), 1)
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente).cantidad_disponible, 6)
+
+        # El mismo pedido escrito de otra forma también sale del cache
+        with self.assertNumQueries(0):
+            cuarta = self.client.post(url, {
+                **data, 'plato_id': str(self.plato.id), 'sucursal_id': settings.SUCURSAL_PREDETERMINADA
+            }, format='json')
+        self.assertEqual(cuarta.data, primera.data)
+
+        # Sin cache lo resuelve la base, con el mismo resultado
+        cache.clear()
+        tercera = self.client.post(url, data, format='json')
+        self.assertEqual(tercera.data, primera.data)
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente).cantidad_disponible, 6)
+
+    def test_reintento_con_otro_contenido(self):
+        url = reverse('stock-validar-reservar')
+        self.client.post(url, {'plato_id': self.plato.id, 'cantidad': 2, 'pedido_id': 'PED-001'}, format='json')
+
+        response = self.client.post(
+            url, {'plato_id': self.plato.id, 'cantidad': 3, 'pedido_id': 'PED-001'}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(response.data['success'])
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente).cantidad_disponible, 6)
+
+    def test_validar_reservar_pedido_completo(self):
+        """
+        Un pedido con varios platos que comparten ingrediente se reserva entero
+        """
+        otro_plato = Plato.objects.create(
+            nombre="Ensalada Test",
+            descripcion="Test",
+            precio=8.00,
+            categoria=self.categoria
+        )
+        Receta.objects.create(plato=otro_plato, ingrediente=self.ingrediente, cantidad=3)
+
+        url = reverse('stock-validar-reservar-pedido')
+        data = {
+            'pedido_id': 'PED-003',
+            'lineas': [
+                {'plato_id': self.plato.id, 'cantidad': 2},
+                {'plato_id': otro_plato.id, 'cantidad': 2},
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['success'])
+        self.assertEqual(len(response.data['lineas']), 2)
+        self.assertEqual(ReservaStock.objects.filter(pedido_id='PED-003').count(), 2)
+        # 2*2 + 3*2 = 10 tomates
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente).cantidad_disponible, 0)
+
+    def test_validar_reservar_pedido_todo_o_nada(self):
+        """
+        Si la demanda sumada del pedido supera el stock no se reserva ninguna línea
+        """
+        url = reverse('stock-validar-reservar-pedido')
+        data = {
+            'pedido_id': 'PED-004',
+            'lineas': [
+                {'plato_id': self.plato.id, 'cantidad': 3},
+                {'plato_id': self.plato.id, 'cantidad': 3},
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+        self.assertEqual(ReservaStock.objects.count(), 0)
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente).cantidad_disponible, 10)
+
+
+class ReservaLifecycleTests(APITestCase):
+    """
+    Tests para confirmar, liberar y expirar reservas
+    """
+
+    def setUp(self):
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="gr")
+        self.pizza = Plato.objects.create(
+            nombre="Pizza Test", descripcion="Test", precio=10.00, categoria=self.categoria
+        )
+        self.ensalada = Plato.objects.create(
+            nombre="Ensalada Test", descripcion="Test", precio=8.00, categoria=self.categoria
+        )
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=100)
+        Receta.objects.create(plato=self.ensalada, ingrediente=self.tomate, cantidad=3)
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=50)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=1000)
+
+        self.service = StockService()
+        self.reservas = self.service.validar_y_reservar_pedido(
+            [(self.pizza.id, 2), (self.ensalada.id, 1)], 'PED-100'
+        )
+
+    def _stock(self, ingrediente):
+        return Stock.objects.get(ingrediente=ingrediente).cantidad_disponible
+
+    def test_liberar_pedido_devuelve_stock(self):
+        """
+        Liberar un pedido devuelve todos sus ingredientes al stock
+        """
+        self.assertEqual(self._stock(self.tomate), 43)
+
+        url = reverse('reserva-liberar-pedido')
+        response = self.client.post(url, {'pedido_id': 'PED-100'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['reservas'], 2)
+        self.assertEqual(self._stock(self.tomate), 50)
+        self.assertEqual(self._stock(self.queso), 1000)
+        self.assertFalse(ReservaStock.objects.exclude(estado='liberado').exists())
+
+    def test_confirmar_reserva_no_devuelve_stock(self):
+        """
+        Confirmar mantiene el descuento y una reserva confirmada ya no se libera
+        """
+        reserva = self.reservas[0]
+        url = reverse('reserva-confirmar', kwargs={'pk': reserva.id})
+        response = self.client.post(url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.estado, 'confirmado')
+
+        url = reverse('reserva-liberar', kwargs={'pk': reserva.id})
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._stock(self.tomate), 43)
+
+    def test_expirar_reservas_por_ttl(self):
+        """
+        Sólo las reservas más antiguas que el TTL se liberan
+        """
+        antigua = timezone.now() - timedelta(hours=2)
+        ReservaStock.objects.filter(pk=self.reservas[0].pk).update(fecha_creacion=antigua)
+
+        liberadas = self.service.expirar_reservas(timedelta(minutes=30), batch_size=1)
+
+        self.assertEqual(liberadas, 1)
+        # Se devuelve sólo la pizza: 2*2 tomates
+        self.assertEqual(self._stock(self.tomate), 47)
+        self.assertEqual(self._stock(self.queso), 1000)
+        self.assertEqual(
+            ReservaStock.objects.get(pk=self.reservas[1].pk).estado, 'reservado'
+        )
+
+    def test_liberar_devuelve_lo_descontado_aunque_cambie_la_receta(self):
+        """
+        Se devuelve lo que tomó la reserva, no lo que pide la receta actual
+        """
+        Receta.objects.filter(plato=self.pizza, ingrediente=self.tomate).update(cantidad=6, cantidad_base=6)
+        ReservaStock.objects.filter(pk=self.reservas[0].pk).update(
+            fecha_creacion=timezone.now() - timedelta(hours=2)
+        )
+
+        self.service.expirar_reservas(timedelta(minutes=30))
+        self.assertEqual(self._stock(self.tomate), 47)
+
+        self.service.liberar_reservas(ReservaStock.objects.filter(pedido_id='PED-100'))
+        self.assertEqual(self._stock(self.tomate), 50)
+        self.assertEqual(self._stock(self.queso), 1000)
+        self.assertEqual(
+            list(
+                MovimientoStock.objects.filter(tipo='liberacion', ingrediente=self.tomate)
+                .order_by('pk').values_list('cantidad', 'referencia')
+            ),
+            [(Decimal('4'), 'PED-100'), (Decimal('3'), 'PED-100')]
+        )
+
+
+class PlatoConsultasTests(APITestCase):
+    """
+    Regresión N+1: el menú se serializa con un número fijo de consultas
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        ingredientes = [
+            Ingrediente.objects.create(nombre=f"Ingrediente {i}", unidad_medida="gr")
+            for i in range(5)
+        ]
+        for i in range(20):
+            plato = Plato.objects.create(
+                nombre=f"Plato {i}", descripcion="Test", precio=10.00, categoria=categoria
+            )
+            for ingrediente in ingredientes:
+                Receta.objects.create(plato=plato, ingrediente=ingrediente, cantidad=1)
+        self.plato = plato
+
+    def test_listar_platos_consultas_fijas(self):
+        """
+        platos+categoría y recetas+ingredientes, sin importar el tamaño del menú
+        """
+        url = reverse('plato-list')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(len(response.data[0]['recetas']), 5)
+
+    def test_obtener_plato_consultas_fijas(self):
+        """
+        El detalle de un plato usa el mismo queryset precargado
+        """
+        url = reverse('plato-detail', kwargs={'pk': self.plato.id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data['recetas'][0]['ingrediente'], 'Ingrediente 0')
+
+
+class MenuSnapshotTests(APITestCase):
+    """
+    Tests del snapshot del menú en cache con ETag
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.ingrediente = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.plato = Plato.objects.create(
+            nombre="Pizza Test", descripcion="Test", precio=10.00, categoria=self.categoria
+        )
+        Receta.objects.create(plato=self.plato, ingrediente=self.ingrediente, cantidad=2)
+        self.url = reverse('plato-list')
+
+    def test_segunda_lectura_no_consulta_la_base(self):
+        """
+        Con el snapshot en cache el listado no ejecuta consultas
+        """
+        primera = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url)
+
+        self.assertEqual(primera.data, segunda.data)
+        self.assertEqual(primera['ETag'], segunda['ETag'])
+
+    def test_if_none_match_devuelve_304(self):
+        """
+        Un cliente con el ETag vigente recibe 304 sin cuerpo
+        """
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_cambio_en_receta_invalida_snapshot(self):
+        """
+        Modificar una receta o un ingrediente cambia la versión y el ETag
+        """
+        etag = self.client.get(self.url)['ETag']
+
+        self.ingrediente.nombre = "Tomate Cherry"
+        self.ingrediente.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['recetas'][0]['ingrediente'], "Tomate Cherry")
+
+
+class ListadosPaginadosTests(APITestCase):
+    """
+    Tests de paginación por cursor, filtros y proyección de campos
+    """
+
+    def setUp(self):
+        self.entradas = CategoriaMenu.objects.create(nombre="Entradas")
+        self.fondos = CategoriaMenu.objects.create(nombre="Fondos")
+        for i in range(5):
+            ingrediente = Ingrediente.objects.create(
+                nombre=f"Ingrediente {i}", unidad_medida="gr", stock_minimo=10
+            )
+            Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=i * 5)
+            Plato.objects.create(
+                nombre=f"Plato {i}", descripcion="Test", precio=10.00,
+                categoria=self.entradas if i % 2 else self.fondos
+            )
+
+    def test_paginacion_por_cursor(self):
+        """
+        El header Link lleva a la página siguiente sin repetir filas
+        """
+        url = reverse('ingrediente-list')
+        primera = self.client.get(url, {'limit': 3})
+
+        self.assertEqual(len(primera.data), 3)
+        self.assertIn('rel="next"', primera['Link'])
+
+        siguiente = primera['Link'].split(';')[0].strip('<>')
+        segunda = self.client.get(siguiente)
+
+        self.assertEqual(len(segunda.data), 2)
+        self.assertNotIn('Link', segunda)
+        ids = [fila['id'] for fila in primera.data + segunda.data]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_cursor_invalido(self):
+        url = reverse('stock-list')
+        response = self.client.get(url, {'cursor': '###'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filtro_bajo_stock(self):
+        """
+        bajo_stock compara cantidad_disponible con stock_minimo en SQL
+        """
+        url = reverse('stock-list')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'bajo_stock': 'true'})
+
+        # cantidades 0, 5 -> bajo el mínimo de 10
+        self.assertEqual(
+            sorted(fila['ingrediente'] for fila in response.data),
+            ['Ingrediente 0', 'Ingrediente 1']
+        )
+
+    def test_platos_filtro_categoria_y_fields(self):
+        """
+        Con fields=id,nombre no se consultan categorías ni recetas
+        """
+        url = reverse('plato-list')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'categoria': self.entradas.id, 'fields': 'id,nombre'})
+
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(set(response.data[0]), {'id', 'nombre'})
+
+
+class PlatoBulkTests(APITestCase):
+    """
+    Tests de la carga masiva de platos con recetas
+    """
+
+    def setUp(self):
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="gr")
+        self.albahaca = Ingrediente.objects.create(nombre="Albahaca", unidad_medida="gr")
+        self.url = reverse('plato-bulk')
+
+    def test_crear_muchos_platos_consultas_fijas(self):
+        """
+        Crear 50 platos con recetas no depende del tamaño del lote
+        """
+        items = [
+            {
+                'nombre': f'Plato {i}',
+                'precio': '9.90',
+                'categoria': self.categoria.id,
+                'recetas': [
+                    {'ingrediente_id': self.tomate.id, 'cantidad': 2},
+                    {'ingrediente_id': self.queso.id, 'cantidad': '150.5'},
+                ]
+            } for i in range(50)
+        ]
+        # savepoint, in_bulk de categorías e ingredientes, insert platos,
+        # lectura de recetas, insert recetas, costos (recetas, platos y un
+        # bulk_update), release
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['procesados'], 50)
+        self.assertEqual(Plato.objects.count(), 50)
+        self.assertEqual(Receta.objects.count(), 100)
+
+    def test_actualizar_recetas_por_diferencia(self):
+        """
+        Las líneas sin cambios conservan su fila; sólo cambian las demás
+        """
+        plato = Plato.objects.create(
+            nombre="Pizza", descripcion="", precio=10, categoria=self.categoria
+        )
+        sin_cambio = Receta.objects.create(plato=plato, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=plato, ingrediente=self.queso, cantidad=100)
+
+        items = [{
+            'id': plato.id,
+            'precio': '12.50',
+            'recetas': [
+                {'ingrediente_id': self.tomate.id, 'cantidad': 2},
+                {'ingrediente_id': self.albahaca.id, 'cantidad': 5},
+            ]
+        }]
+        response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        plato.refresh_from_db()
+        self.assertEqual(plato.precio, Decimal('12.50'))
+        self.assertTrue(Receta.objects.filter(pk=sin_cambio.pk).exists())
+        self.assertEqual(
+            set(plato.recetas.values_list('ingrediente__nombre', flat=True)),
+            {'Tomate', 'Albahaca'}
+        )
+
+    def test_errores_por_item(self):
+        """
+        Los ítems inválidos se informan y no impiden guardar los válidos
+        """
+        items = [
+            {'nombre': 'Valido', 'precio': '5', 'categoria': self.categoria.id},
+            {'nombre': 'Sin categoria', 'precio': '5', 'categoria': 999},
+            {'nombre': 'Ingrediente malo', 'precio': '5', 'categoria': self.categoria.id,
+             'recetas': [{'ingrediente_id': 999, 'cantidad': 1}]},
+            {'id': 999, 'precio': '5'},
+        ]
+        response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['procesados'], 1)
+        self.assertEqual(
+            [resultado['success'] for resultado in response.data['resultados']],
+            [True, False, False, False]
+        )
+        self.assertEqual(list(Plato.objects.values_list('nombre', flat=True)), ['Valido'])
+
+    def test_recetas_que_no_son_lista(self):
+        resultados = PlatoService().guardar_platos([
+            {'nombre': 'x', 'precio': '1', 'categoria': self.categoria.id, 'recetas': 5}
+        ])
+
+        self.assertEqual(resultados, [{'indice': 0, 'success': False, 'errores': ['recetas debe ser una lista']}])
+        self.assertFalse(Plato.objects.exists())
+
+    def test_actualizar_solo_escribe_los_campos_del_item(self):
+        """
+        Un cambio concurrente en un campo que el ítem no trae se conserva
+        """
+        pizza = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=self.categoria)
+        sopa = Plato.objects.create(nombre="Sopa", descripcion="", precio=5, categoria=self.categoria)
+        in_bulk = CategoriaMenu.objects.in_bulk
+
+        def con_edicion_concurrente(*args, **kwargs):
+            # Los platos ya se leyeron: otro request renombra la pizza
+            Plato.objects.filter(pk=pizza.pk).update(nombre="Pizza napolitana")
+            return in_bulk(*args, **kwargs)
+
+        with mock.patch.object(CategoriaMenu.objects, 'in_bulk', side_effect=con_edicion_concurrente):
+            PlatoService().guardar_platos([
+                {'id': pizza.id, 'precio': '12'},
+                {'id': sopa.id, 'nombre': 'Sopa del día'},
+            ])
+
+        pizza.refresh_from_db()
+        sopa.refresh_from_db()
+        self.assertEqual((pizza.nombre, pizza.precio), ("Pizza napolitana", Decimal('12')))
+        self.assertEqual((sopa.nombre, sopa.precio), ("Sopa del día", Decimal('5')))
+
+
+class ImportadorStockTests(APITestCase):
+    """
+    Tests de la importación de ingredientes y stock
+    """
+
+    def setUp(self):
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un", stock_minimo=5)
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=3)
+
+    def test_importar_csv_por_lotes(self):
+        """
+        Crea y actualiza ingredientes, hace upsert del stock y reporta rechazos
+        """
+        lineas = [
+            "nombre,unidad_medida,stock_minimo,cantidad_disponible\n",
+            "Tomate,,10,40\n",
+            "Queso,gr,100,2500.5\n",
+            "Aceite,lt,,12\n",
+            ",gr,1,1\n",
+            "Sal,xx,1,1\n",
+            "Pimienta,,1,1\n",
+        ]
+        progreso = []
+        resumen = ImportadorStock(batch_size=2, progreso=lambda r: progreso.append(r['procesadas'])).importar(lineas, 'csv')
+
+        self.assertEqual(resumen['procesadas'], 3)
+        self.assertEqual(resumen['ingredientes_creados'], 2)
+        self.assertEqual(resumen['ingredientes_actualizados'], 1)
+        self.assertEqual(resumen['rechazadas'], 3)
+        self.assertEqual([rechazo['linea'] for rechazo in resumen['rechazos']], [5, 6, 7])
+        self.assertEqual(progreso, [2, 3])
+
+        self.tomate.refresh_from_db()
+        self.assertEqual(self.tomate.stock_minimo, 10)
+        self.assertEqual(Stock.objects.get(ingrediente=self.tomate).cantidad_disponible, 40)
+        self.assertEqual(Stock.objects.get(ingrediente__nombre="Queso").cantidad_disponible, Decimal('2500.5'))
+
+    def test_importar_jsonl_por_api(self):
+        """
+        El endpoint acepta un upload JSON-lines
+        """
+        contenido = (
+            b'{"nombre": "Tomate", "cantidad_disponible": "7"}\n'
+            b'no es json\n'
+            b'{"nombre": "Harina", "unidad_medida": "kg", "cantidad_disponible": 20}\n'
+        )
+        archivo = SimpleUploadedFile('conteo.jsonl', contenido)
+
+        response = self.client.post(reverse('stock-importar'), {'archivo': archivo}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['procesadas'], 2)
+        self.assertEqual(response.data['rechazos'], [{'linea': 2, 'error': 'JSON inválido'}])
+        self.assertEqual(Stock.objects.get(ingrediente=self.tomate).cantidad_disponible, 7)
+        self.assertEqual(Stock.objects.get(ingrediente__nombre="Harina").cantidad_disponible, 20)
+
+    def test_cambio_de_unidad_imposible_rechaza_solo_su_linea(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        plato = Plato.objects.create(nombre="Tortilla", descripcion="", precio=5, categoria=categoria)
+        Receta.objects.create(plato=plato, ingrediente=self.tomate, cantidad=2, unidad_medida="un")
+
+        resumen = ImportadorStock().importar([
+            "nombre,unidad_medida,cantidad_disponible\n", "Otro,kg,5\n", "Tomate,kg,3\n"
+        ], 'csv')
+
+        self.assertEqual(resumen['procesadas'], 1)
+        self.assertEqual([rechazo['linea'] for rechazo in resumen['rechazos']], [3])
+        self.assertIn('peso_unidad', resumen['rechazos'][0]['error'])
+        self.assertEqual(Stock.objects.get(ingrediente__nombre="Otro").cantidad_disponible, 5)
+        self.tomate.refresh_from_db()
+        self.assertEqual(self.tomate.unidad_medida, 'un')
+        self.assertEqual(Stock.objects.get(ingrediente=self.tomate).cantidad_disponible, 3)
+
+    def test_importar_consolida_solo_su_sucursal(self):
+        centro = Sucursal.objects.create(nombre="Centro")
+        aceite = Ingrediente.objects.create(nombre="Aceite", unidad_medida="lt", fragmentos_stock=2)
+        Stock.objects.create(ingrediente=aceite, cantidad_disponible=10)
+        stock_centro = Stock.objects.create(sucursal=centro, ingrediente=aceite, cantidad_disponible=10)
+        stock_centro.fragmentos.filter(indice=0).update(consumido=3)
+
+        ImportadorStock().importar(["nombre,cantidad_disponible\n", "Aceite,8\n"], 'csv')
+
+        self.assertEqual(Stock.objects.get(sucursal_id=settings.SUCURSAL_PREDETERMINADA, ingrediente=aceite)
+                         .cantidad_disponible, 8)
+        stock_centro.refresh_from_db()
+        # Lo reservado en el centro sigue en su fragmento, sin consolidar
+        self.assertEqual(stock_centro.cantidad_disponible, 10)
+        self.assertEqual(stock_centro.fragmentos.get(indice=0).consumido, 3)
+
+
+class ExportacionTests(APITestCase):
+    """
+    Tests de los endpoints de exportación
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=100)
+        self.plato = Plato.objects.create(
+            nombre="Pizza", descripcion="", precio=10, categoria=categoria
+        )
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+        Plato.objects.create(nombre="Agua", descripcion="", precio=1, categoria=categoria)
+
+        service = StockService()
+        self.vieja = service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1')
+        self.nueva = service.validar_y_reservar_stock(self.plato.id, 1, 'PED-2')
+        ReservaStock.objects.filter(pk=self.vieja.pk).update(
+            fecha_creacion=timezone.make_aware(datetime(2025, 1, 15, 12, 0))
+        )
+
+    def _contenido(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_exportar_stock_csv(self):
+        response = self.client.get(reverse('stock-exportar'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lineas = self._contenido(response).splitlines()
+        self.assertEqual(lineas[0], 'id,sucursal_id,ingrediente_id,ingrediente,unidad_medida,stock_minimo,cantidad_disponible')
+        self.assertIn('Tomate,un,0,96', lineas[1])
+
+    def test_exportar_platos_jsonl(self):
+        """
+        Una línea por receta; los platos sin receta también aparecen
+        """
+        response = self.client.get(reverse('plato-exportar'), {'formato': 'jsonl'})
+
+        filas = [json.loads(linea) for linea in self._contenido(response).splitlines()]
+        self.assertEqual([fila['plato'] for fila in filas], ['Pizza', 'Agua'])
+        self.assertEqual(filas[0]['ingrediente'], 'Tomate')
+        self.assertIsNone(filas[1]['ingrediente'])
+
+    def test_exportar_reservas_por_rango_de_fechas(self):
+        url = reverse('reserva-exportar')
+        response = self.client.get(url, {'formato': 'jsonl', 'desde': '2025-01-01', 'hasta': '2025-01-31'})
+
+        filas = [json.loads(linea) for linea in self._contenido(response).splitlines()]
+        self.assertEqual([fila['pedido_id'] for fila in filas], ['PED-1'])
+
+        response = self.client.get(url, {'desde': 'ayer'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DisponibilidadTests(APITestCase):
+    """
+    Tests del cálculo de porciones disponibles por plato
+    """
+
+    def setUp(self):
+        cache.clear()
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="gr")
+        self.sal = Ingrediente.objects.create(nombre="Sal", unidad_medida="gr")
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=7)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=1000)
+
+        self.pizza = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=150)
+        self.caprese = Plato.objects.create(nombre="Caprese", descripcion="", precio=9, categoria=categoria)
+        Receta.objects.create(plato=self.caprese, ingrediente=self.tomate, cantidad=1)
+        Receta.objects.create(plato=self.caprese, ingrediente=self.sal, cantidad=1)
+        self.agua = Plato.objects.create(nombre="Agua", descripcion="", precio=1, categoria=categoria)
+        self.url = reverse('plato-disponibilidad')
+
+    def test_porciones_por_plato_en_una_consulta(self):
+        """
+        Mínimo de stock/receta por ingrediente; sin stock cuenta como 0
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        porciones = {fila['nombre']: (fila['porciones'], fila['disponible']) for fila in response.data}
+        # tomate 7/2 = 3, queso 1000/150 = 6 -> 3
+        self.assertEqual(porciones['Pizza'], (3, True))
+        # la sal no tiene fila de Stock
+        self.assertEqual(porciones['Caprese'], (0, False))
+        self.assertEqual(porciones['Agua'], (None, True))
+
+    def test_cache_se_invalida_al_reservar(self):
+        """
+        La segunda lectura sale del cache hasta que una reserva cambia el stock
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        StockService().validar_y_reservar_stock(self.pizza.id, 1, 'PED-1')
+
+        response = self.client.get(self.url)
+        pizza = next(fila for fila in response.data if fila['nombre'] == 'Pizza')
+        # quedan 5 tomates -> 2 pizzas
+        self.assertEqual(pizza['porciones'], 2)
+
+
+class AlertaStockTests(APITestCase):
+    """
+    Tests del seguimiento incremental del stock mínimo
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un", stock_minimo=5)
+        self.stock = Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+        self.service = StockService()
+
+    def test_una_alerta_por_cruce(self):
+        """
+        Bajar del mínimo genera una sola alerta aunque se siga reservando
+        """
+        self.service.validar_y_reservar_stock(self.plato.id, 2, 'PED-1')  # 6
+        self.assertEqual(AlertaStock.objects.count(), 0)
+
+        with self.assertLogs('mainApp.services', level='INFO') as logs:
+            self.service.validar_y_reservar_stock(self.plato.id, 1, 'PED-2')  # 4 -> cruza
+        self.assertEqual([registro.levelname for registro in logs.records], ['INFO'])
+        self.service.validar_y_reservar_stock(self.plato.id, 1, 'PED-3')  # 2
+
+        self.stock.refresh_from_db()
+        self.assertTrue(self.stock.bajo_minimo)
+        self.assertEqual(list(AlertaStock.objects.values_list('tipo', flat=True)), ['bajo_minimo'])
+
+    def test_liberar_reserva_registra_reposicion(self):
+        """
+        Devolver stock por encima del mínimo registra el cruce inverso
+        """
+        self.service.validar_y_reservar_stock(self.plato.id, 3, 'PED-1')  # 4
+        self.service.liberar_reservas(ReservaStock.objects.filter(pedido_id='PED-1'))
+
+        self.stock.refresh_from_db()
+        self.assertFalse(self.stock.bajo_minimo)
+        self.assertEqual(
+            list(AlertaStock.objects.order_by('pk').values_list('tipo', flat=True)),
+            ['bajo_minimo', 'repuesto']
+        )
+
+    def test_endpoints_bajo_stock_y_alertas(self):
+        """
+        Editar el mínimo del ingrediente también cuenta como cruce
+        """
+        self.tomate.stock_minimo = 20
+        self.tomate.save()
+
+        response = self.client.get(reverse('ingrediente-bajo-stock'))
+        self.assertEqual([fila['ingrediente'] for fila in response.data], ['Tomate'])
+
+        response = self.client.get(reverse('ingrediente-alertas'))
+        self.assertEqual(len(response.data), 1)
+        ultima = response.data[0]['id']
+
+        response = self.client.get(reverse('ingrediente-alertas'), {'desde_id': ultima})
+        self.assertEqual(response.data, [])
+
+        response = self.client.get(reverse('stock_bajo_minimo'))
+        self.assertContains(response, 'Tomate')
+
+
+class MovimientoStockTests(APITestCase):
+    """
+    Tests del libro de movimientos y los snapshots de stock
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.stock = Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+
+    def test_cada_cambio_de_stock_queda_registrado(self):
+        service = StockService()
+        service.validar_y_reservar_stock(self.plato.id, 2, 'PED-1')
+        service.liberar_reservas(ReservaStock.objects.filter(pedido_id='PED-1'))
+        self.stock.refresh_from_db()
+        self.stock.cantidad_disponible = 15
+        self.stock.save()
+        ImportadorStock().importar(["nombre,cantidad_disponible\n", "Tomate,12\n"], 'csv')
+
+        movimientos = list(
+            MovimientoStock.objects.filter(ingrediente=self.tomate)
+            .order_by('pk').values_list('tipo', 'cantidad', 'referencia')
+        )
+        self.assertEqual(movimientos, [
+            ('ajuste', Decimal('10'), ''),
+            ('reserva', Decimal('-4'), 'PED-1'),
+            ('liberacion', Decimal('4'), 'PED-1'),
+            ('ajuste', Decimal('5'), ''),
+            ('importacion', Decimal('-3'), ''),
+        ])
+
+    def test_stock_en_un_momento(self):
+        """
+        Snapshot anterior más los movimientos hasta el momento pedido
+        """
+        inicio = timezone.now()
+        MovimientoStock.objects.all().delete()
+        SnapshotStock.objects.create(ingrediente=self.tomate, cantidad=10, fecha=inicio)
+        MovimientoStock.objects.create(
+            ingrediente=self.tomate, tipo='reserva', cantidad=-4, fecha=inicio + timedelta(hours=1)
+        )
+        MovimientoStock.objects.create(
+            ingrediente=self.tomate, tipo='reserva', cantidad=-2, fecha=inicio + timedelta(hours=3)
+        )
+        # Un snapshot posterior corta la cola de movimientos
+        SnapshotStock.objects.create(ingrediente=self.tomate, cantidad=4, fecha=inicio + timedelta(hours=4))
+        MovimientoStock.objects.create(
+            ingrediente=self.tomate, tipo='ajuste', cantidad=6, fecha=inicio + timedelta(hours=5)
+        )
+
+        service = MovimientoService()
+        self.assertEqual(service.stock_en(self.tomate.id, inicio + timedelta(hours=2)), 6)
+        self.assertEqual(service.stock_en(self.tomate.id, inicio + timedelta(hours=6)), 10)
+
+        url = reverse('ingrediente-stock-en', kwargs={'pk': self.tomate.id})
+        response = self.client.get(url, {'momento': (inicio + timedelta(hours=2)).isoformat()})
+        self.assertEqual(Decimal(response.data['cantidad']), 6)
+
+    def test_tomar_snapshot(self):
+        self.assertEqual(MovimientoService().tomar_snapshot(), 1)
+        self.assertEqual(SnapshotStock.objects.get().cantidad, 10)
+
+
+class FragmentoStockTests(TestCase):
+    """
+    Tests del modo contador fragmentado
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.aceite = Ingrediente.objects.create(
+            nombre="Aceite", unidad_medida="lt", stock_minimo=20, fragmentos_stock=4
+        )
+        self.stock = Stock.objects.create(ingrediente=self.aceite, cantidad_disponible=100)
+        self.harina = Ingrediente.objects.create(nombre="Harina", unidad_medida="kg")
+        Stock.objects.create(ingrediente=self.harina, cantidad_disponible=100)
+        self.plato = Plato.objects.create(nombre="Fritura", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.aceite, cantidad=1)
+        Receta.objects.create(plato=self.plato, ingrediente=self.harina, cantidad=1)
+        self.service = StockService()
+
+    def cupos(self):
+        return list(self.stock.fragmentos.order_by('indice').values_list('cupo', 'consumido'))
+
+    def test_alta_reparte_cupos(self):
+        self.assertEqual(self.cupos(), [(Decimal('25'), Decimal('0'))] * 4)
+
+    def test_reserva_descuenta_de_un_fragmento(self):
+        self.service.validar_y_reservar_stock(self.plato.id, 10, 'PED-1')
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 100)
+        self.assertEqual(sum(consumido for _, consumido in self.cupos()), 10)
+        self.assertEqual(Stock.objects.get(ingrediente=self.harina).cantidad_disponible, 90)
+        self.assertEqual(DisponibilidadService().calcular()[0]['porciones'], 90)
+        self.assertEqual(
+            MovimientoStock.objects.filter(ingrediente=self.aceite, tipo='reserva').get().cantidad, -10
+        )
+
+    def test_reserva_sin_cupo_consolida(self):
+        """
+        Una reserva mayor que cualquier cupo bloquea el ingrediente completo
+        """
+        self.service.validar_y_reservar_stock(self.plato.id, 10, 'PED-1')
+        with mock.patch.object(StockService, '_bloquear_stock', autospec=True,
+                               side_effect=StockService._bloquear_stock) as bloquear:
+            self.service.validar_y_reservar_stock(self.plato.id, 30, 'PED-2')
+
+        # El primer intento se revierte; el segundo bloquea las dos filas de
+        # Stock en una consulta, en orden de pk, antes de consolidar
+        self.assertEqual([llamada.args[3] for llamada in bloquear.call_args_list], [False, True])
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 60)
+        self.assertEqual(Stock.objects.get(ingrediente=self.harina).cantidad_disponible, 60)
+        self.assertEqual(self.cupos(), [(Decimal('15'), Decimal('0'))] * 4)
+        self.assertEqual(MovimientoStock.objects.filter(tipo='reserva', referencia='PED-2').count(), 2)
+
+    def test_lote_sin_cupo_bloquea_todo_y_reintenta(self):
+        resultados = self.service.reservar_lote([
+            ([(self.plato.id, 10)], 'PED-1', None),
+            ([(self.plato.id, 30)], 'PED-2', None),
+        ])
+
+        self.assertEqual([resultado[0].pedido_id for resultado in resultados], ['PED-1', 'PED-2'])
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 60)
+        self.assertEqual(Stock.objects.get(ingrediente=self.harina).cantidad_disponible, 60)
+
+    def test_no_vende_de_mas(self):
+        self.service.validar_y_reservar_stock(self.plato.id, 100, 'PED-1')
+        with self.assertRaises(ValidationError):
+            self.service.validar_y_reservar_stock(self.plato.id, 1, 'PED-2')
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 0)
+
+    def test_consolidar_revisa_el_minimo(self):
+        for pedido in range(4):
+            self.service.validar_y_reservar_stock(self.plato.id, 21, f'PED-{pedido}')
+        # Los cruces de un ingrediente fragmentado se detectan al consolidar
+        self.assertEqual(AlertaStock.objects.count(), 0)
+
+        self.assertEqual(FragmentoStockService().consolidar(), 1)
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 16)
+        self.assertTrue(self.stock.bajo_minimo)
+        self.assertEqual(AlertaStock.objects.get().tipo, 'bajo_minimo')
+        self.assertEqual(self.cupos(), [(Decimal('4'), Decimal('0'))] * 4)
+        self.assertEqual(
+            MovimientoService().stock_en(self.aceite.id, timezone.now()), self.stock.cantidad_disponible
+        )
+
+    def test_desactivar_modo_fragmentado(self):
+        self.service.validar_y_reservar_stock(self.plato.id, 10, 'PED-1')
+        self.aceite.fragmentos_stock = 0
+        self.aceite.save()
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 90)
+        self.assertFalse(self.stock.fragmentos.exists())
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'EXPLAIN sólo se interpreta en SQLite y PostgreSQL')
+class PlanesDeConsultaTests(TestCase):
+    """
+    Las consultas calientes deben resolverse con índices: sobre un set de
+    datos grande y con estadísticas (ANALYZE), el plan no puede recorrer la
+    tabla completa
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categorias = CategoriaMenu.objects.bulk_create([CategoriaMenu(nombre=f"Categoría {i}") for i in range(20)])
+        cls.categoria = categorias[3]
+        platos = Plato.objects.bulk_create([
+            Plato(nombre=f"Plato {i}", descripcion="", precio=10, categoria=categorias[i % 20], activo=i % 10 != 0)
+            for i in range(2000)
+        ])
+        ingredientes = Ingrediente.objects.bulk_create([
+            Ingrediente(nombre=f"Ingrediente {i}", unidad_medida="un") for i in range(2000)
+        ])
+        Stock.objects.bulk_create([
+            Stock(ingrediente=ingrediente, cantidad_disponible=10, bajo_minimo=i % 50 == 0)
+            for i, ingrediente in enumerate(ingredientes)
+        ])
+        estados = ['confirmado', 'liberado']
+        reservas = ReservaStock.objects.bulk_create([
+            ReservaStock(
+                plato=platos[i % 2000],
+                cantidad=1,
+                pedido_id=f"PED-{i}",
+                # pocas reservas pendientes, como en producción
+                estado='reservado' if i % 50 == 0 else estados[i % 2]
+            )
+            for i in range(10000)
+        ])
+        # Un bloque de reservas por día durante los últimos 20 días
+        cls.ahora = timezone.now()
+        for dia in range(20):
+            primera = reservas[dia * 500].pk
+            ReservaStock.objects.filter(pk__gte=primera, pk__lt=primera + 500).update(
+                fecha_creacion=cls.ahora - timedelta(days=20 - dia)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsaIndice(self, queryset, tabla):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            escaneo = rf'Seq Scan on "?{tabla}"?\b'
+        else:
+            # SCAN ... USING INDEX recorre un índice (p. ej. uno parcial), no la tabla
+            escaneo = rf'\bSCAN (TABLE )?{tabla}\b(?! USING)'
+        self.assertIsNone(re.search(escaneo, plan), f"Escaneo completo de {tabla}:\n{plan}")
+
+    def test_reservas_vencidas(self):
+        # Consulta de expirar_reservas
+        limite = self.ahora - timedelta(minutes=30)
+        self.assertUsaIndice(
+            ReservaStock.objects.filter(estado='reservado', fecha_creacion__lt=limite, pk__gt=0)
+            .order_by('pk').values_list('pk', flat=True)[:500],
+            'mainApp_reservastock'
+        )
+
+    def test_reservas_por_estado(self):
+        self.assertUsaIndice(ReservaStock.objects.filter(estado='reservado'), 'mainApp_reservastock')
+
+    def test_reservas_por_pedido(self):
+        self.assertUsaIndice(
+            ReservaStock.objects.filter(sucursal_id=1, pedido_id='PED-50').order_by('linea'),
+            'mainApp_reservastock'
+        )
+
+    def test_reservas_por_fecha(self):
+        # Exportación de reservas de un rango de fechas
+        self.assertUsaIndice(
+            ReservaStock.objects.filter(
+                fecha_creacion__gte=self.ahora - timedelta(days=2), fecha_creacion__lt=self.ahora
+            ).order_by('pk'),
+            'mainApp_reservastock'
+        )
+
+    def test_ingredientes_por_nombre(self):
+        # Búsqueda de la importación
+        self.assertUsaIndice(
+            Ingrediente.objects.filter(nombre__in=['Ingrediente 1', 'Ingrediente 2']), 'mainApp_ingrediente'
+        )
+
+    def test_platos_activos_por_categoria(self):
+        self.assertUsaIndice(
+            Plato.objects.filter(activo=True, categoria=self.categoria).order_by('pk')[:100],
+            'mainApp_plato'
+        )
+
+    def test_stock_bajo_minimo(self):
+        self.assertUsaIndice(Stock.objects.filter(sucursal_id=1, bajo_minimo=True), 'mainApp_stock')
+
+    def test_stock_de_una_sucursal(self):
+        # Listado paginado de /api/stock/
+        self.assertUsaIndice(
+            Stock.objects.filter(sucursal_id=1, pk__gt=100).order_by('pk')[:50], 'mainApp_stock'
+        )
+
+
+class SucursalesTests(APITestCase):
+    """
+    Stock, reservas y disponibilidad separados por sucursal
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.principal = Sucursal.objects.get(pk=settings.SUCURSAL_PREDETERMINADA)
+        self.centro = Sucursal.objects.create(nombre="Centro")
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un", stock_minimo=3)
+        self.stock_principal = Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.stock_centro = Stock.objects.create(sucursal=self.centro, ingrediente=self.tomate, cantidad_disponible=4)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+
+    def test_reserva_descuenta_solo_de_su_sucursal(self):
+        reserva = StockService().validar_y_reservar_stock(self.plato.id, 1, 'PED-1', sucursal_id=self.centro.id)
+
+        self.assertEqual(reserva.sucursal_id, self.centro.id)
+        self.stock_principal.refresh_from_db()
+        self.stock_centro.refresh_from_db()
+        self.assertEqual(self.stock_principal.cantidad_disponible, 10)
+        self.assertEqual(self.stock_centro.cantidad_disponible, 2)
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(tipo='reserva').values_list('sucursal_id', 'cantidad')),
+            [(self.centro.id, Decimal('-2'))]
+        )
+        # Quedó bajo el mínimo sólo en el centro
+        self.assertEqual(list(AlertaStock.objects.values_list('sucursal_id', flat=True)), [self.centro.id])
+
+        with self.assertRaises(ValidationError):
+            StockService().validar_y_reservar_stock(self.plato.id, 2, 'PED-2', sucursal_id=self.centro.id)
+
+    def test_vistas_web_por_sucursal(self):
+        self.stock_centro.cantidad_disponible = 2
+        self.stock_centro.save()
+
+        response = self.client.get(reverse('stock_bajo_minimo'))
+        self.assertEqual(list(response.context['stocks']), [])
+        response = self.client.get(reverse('stock_bajo_minimo'), {'sucursal': self.centro.id})
+        self.assertEqual(list(response.context['stocks']), [self.stock_centro])
+
+        self.client.post(reverse('simular_pedido'), {
+            'plato_id': self.plato.id, 'cantidad': 1, 'pedido_id': 'PED-WEB', 'sucursal_id': self.centro.id
+        })
+        self.assertEqual(ReservaStock.objects.get(pedido_id='PED-WEB').sucursal_id, self.centro.id)
+
+    def test_importar_stock_de_una_sucursal(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as archivo:
+            archivo.write("nombre,cantidad_disponible\nTomate,25\n")
+        self.addCleanup(os.remove, archivo.name)
+
+        call_command('importar_stock', archivo.name, sucursal=self.centro.id, stdout=io.StringIO())
+
+        self.stock_principal.refresh_from_db()
+        self.stock_centro.refresh_from_db()
+        self.assertEqual(self.stock_principal.cantidad_disponible, 10)
+        self.assertEqual(self.stock_centro.cantidad_disponible, 25)
+        with self.assertRaises(CommandError):
+            call_command('importar_stock', archivo.name, sucursal=999, stdout=io.StringIO())
+
+    def test_mismo_pedido_en_dos_sucursales(self):
+        service = StockService()
+        en_principal = service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1')
+        en_centro = service.validar_y_reservar_stock(self.plato.id, 2, 'PED-1', sucursal_id=self.centro.id)
+
+        self.assertNotEqual(en_principal.pk, en_centro.pk)
+        self.assertEqual(service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1').pk, en_principal.pk)
+
+    def test_liberar_devuelve_a_su_sucursal(self):
+        service = StockService()
+        service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1')
+        service.validar_y_reservar_stock(self.plato.id, 2, 'PED-2', sucursal_id=self.centro.id)
+
+        service.liberar_reservas(ReservaStock.objects.all())
+
+        self.stock_principal.refresh_from_db()
+        self.stock_centro.refresh_from_db()
+        self.assertEqual(self.stock_principal.cantidad_disponible, 10)
+        self.assertEqual(self.stock_centro.cantidad_disponible, 4)
+        self.assertEqual(
+            sorted(MovimientoStock.objects.filter(tipo='liberacion').values_list('sucursal_id', 'cantidad')),
+            [(self.principal.id, Decimal('2')), (self.centro.id, Decimal('4'))]
+        )
+
+    def test_lote_con_varias_sucursales(self):
+        resultados = StockService().reservar_lote([
+            ([(self.plato.id, 2)], 'PED-1', self.centro.id),
+            ([(self.plato.id, 2)], 'PED-2', None),
+            ([(self.plato.id, 1)], 'PED-3', self.centro.id),
+        ])
+
+        self.assertEqual(resultados[0][0].sucursal_id, self.centro.id)
+        self.assertEqual(resultados[1][0].sucursal_id, self.principal.id)
+        self.assertIsInstance(resultados[2], ValidationError)
+
+    def test_disponibilidad_por_sucursal(self):
+        response = self.client.get(reverse('plato-disponibilidad'), {'sucursal': self.centro.id})
+        self.assertEqual(response.data[0]['porciones'], 2)
+
+        response = self.client.get(reverse('plato-disponibilidad'))
+        self.assertEqual(response.data[0]['porciones'], 5)
+
+        # Sin stock del ingrediente en la sucursal no se puede preparar
+        vacia = Sucursal.objects.create(nombre="Norte")
+        response = self.client.get(reverse('plato-disponibilidad'), {'sucursal': vacia.id})
+        self.assertEqual(response.data[0]['porciones'], 0)
+
+        response = self.client.get(reverse('plato-disponibilidad'), {'sucursal': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listado_y_reserva_por_api(self):
+        response = self.client.get(reverse('stock-list'), {'sucursal': self.centro.id})
+        self.assertEqual([fila['id'] for fila in response.data], [self.stock_centro.id])
+
+        response = self.client.post(reverse('stock-validar-reservar'), {
+            'plato_id': self.plato.id, 'cantidad': 1, 'pedido_id': 'PED-1', 'sucursal_id': self.centro.id
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # El mismo pedido en otra sucursal no sale del cache de respuestas
+        response = self.client.post(reverse('stock-validar-reservar'), {
+            'plato_id': self.plato.id, 'cantidad': 1, 'pedido_id': 'PED-1'
+        }, format='json')
+        self.assertEqual(ReservaStock.objects.get(pk=response.data['reserva_id']).sucursal_id, self.principal.id)
+
+    def test_consolidado_en_una_consulta(self):
+        ajo = Ingrediente.objects.create(nombre="Ajo", unidad_medida="gr")
+        Stock.objects.create(ingrediente=ajo, cantidad_disponible=1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('stock-consolidado'))
+
+        self.assertEqual(response.data, [
+            {
+                'ingrediente_id': ajo.id, 'ingrediente': 'Ajo', 'unidad_medida': 'gr',
+                'cantidad_disponible': '1.000', 'sucursales': 1, 'sucursales_bajo_minimo': 0,
+            },
+            {
+                'ingrediente_id': self.tomate.id, 'ingrediente': 'Tomate', 'unidad_medida': 'un',
+                'cantidad_disponible': '14.000', 'sucursales': 2, 'sucursales_bajo_minimo': 0,
+            },
+        ])
+
+    def test_importar_en_una_sucursal(self):
+        resumen = ImportadorStock(sucursal_id=self.centro.id).importar(
+            ['nombre,cantidad_disponible', 'Tomate,7'], 'csv'
+        )
+
+        self.assertEqual(resumen['stocks'], 1)
+        self.stock_principal.refresh_from_db()
+        self.stock_centro.refresh_from_db()
+        self.assertEqual(self.stock_principal.cantidad_disponible, 10)
+        self.assertEqual(self.stock_centro.cantidad_disponible, 7)
+
+
+class UnidadesTests(APITestCase):
+    """
+    Recetas en una unidad distinta a la del stock del ingrediente
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = CategoriaMenu.objects.create(nombre="Panadería")
+        self.harina = Ingrediente.objects.create(nombre="Harina", unidad_medida="kg")
+        self.stock = Stock.objects.create(ingrediente=self.harina, cantidad_disponible=1)
+        self.plato = Plato.objects.create(nombre="Pan", descripcion="", precio=5, categoria=self.categoria)
+        self.receta = Receta.objects.create(plato=self.plato, ingrediente=self.harina, cantidad=250, unidad_medida="gr")
+
+    def test_factores(self):
+        self.assertEqual(factor('gr', 'kg'), Decimal('0.001'))
+        self.assertEqual(factor('lt', 'ml'), Decimal('1000'))
+        self.assertEqual(factor('lt', 'kg', densidad=Decimal('0.92')), Decimal('0.92'))
+        self.assertEqual(factor('un', 'kg', peso_unidad=Decimal('60')), Decimal('0.06'))
+        with self.assertRaisesMessage(ConversionImposible, 'falta densidad'):
+            factor('ml', 'gr')
+
+    def test_receta_se_guarda_en_la_unidad_del_stock(self):
+        self.assertEqual(self.receta.cantidad_base, Decimal('0.250'))
+
+        StockService().validar_y_reservar_stock(self.plato.id, 3, 'PED-1')
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, Decimal('0.250'))
+        self.assertEqual(DisponibilidadService().calcular([self.plato.id])[0]['porciones'], 1)
+        with self.assertRaises(ValidationError):
+            StockService().validar_y_reservar_stock(self.plato.id, 2, 'PED-2')
+
+    def test_cambio_de_unidad_recalcula_recetas(self):
+        self.harina.unidad_medida = 'gr'
+        self.harina.save()
+
+        self.receta.refresh_from_db()
+        self.assertEqual(self.receta.cantidad, Decimal('250'))
+        self.assertEqual(self.receta.cantidad_base, Decimal('250.000'))
+
+    def test_receta_sin_conversion_posible(self):
+        response = self.client.post('/api/platos/', {
+            'nombre': 'Fideos', 'precio': '8', 'categoria': self.categoria.id,
+            'recetas': [{'ingrediente_id': self.harina.id, 'cantidad': '100', 'unidad_medida': 'ml'}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('falta densidad', response.data['error'])
+        self.assertFalse(Plato.objects.filter(nombre='Fideos').exists())
+
+        self.harina.densidad = Decimal('0.5')
+        self.harina.save()
+        response = self.client.post('/api/platos/', {
+            'nombre': 'Fideos', 'precio': '8', 'categoria': self.categoria.id,
+            'recetas': [{'ingrediente_id': self.harina.id, 'cantidad': '100', 'unidad_medida': 'ml'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Receta.objects.get(plato_id=response.data['id']).cantidad_base, Decimal('0.050'))
+
+    def test_importar_conteo_en_otra_unidad(self):
+        lineas = [
+            "nombre,unidad_medida,cantidad_disponible,unidad_cantidad\n",
+            "Harina,,2500,gr\n",
+            "Aceite,lt,3,un\n",
+        ]
+        resumen = ImportadorStock().importar(lineas, 'csv')
+
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, Decimal('2.500'))
+        self.assertEqual(resumen['rechazadas'], 1)
+        self.assertIn('falta densidad y peso_unidad', resumen['rechazos'][0]['error'])
+
+    def test_reserva_convertida_no_agrega_consultas(self):
+        tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        Stock.objects.create(ingrediente=tomate, cantidad_disponible=10)
+        ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=5, categoria=self.categoria)
+        Receta.objects.create(plato=ensalada, ingrediente=tomate, cantidad=1)
+
+        service = StockService()
+        with CaptureQueriesContext(connection) as sin_conversion:
+            service.validar_y_reservar_stock(ensalada.id, 1, 'PED-1')
+        with CaptureQueriesContext(connection) as con_conversion:
+            service.validar_y_reservar_stock(self.plato.id, 1, 'PED-2')
+        self.assertEqual(len(con_conversion), len(sin_conversion))
+
+
+class MatrizRecetasTests(APITestCase):
+    """
+    Demanda agregada con la matriz de recetas compilada
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.reiniciar()
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="kg")
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=1)
+        self.pizza = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        self.ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=5, categoria=categoria)
+        self.pan = Plato.objects.create(nombre="Pan", descripcion="", precio=2, categoria=categoria)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        self.receta_queso = Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=150, unidad_medida="gr")
+        Receta.objects.create(plato=self.ensalada, ingrediente=self.tomate, cantidad=3)
+
+    def test_demanda_de_varios_pedidos(self):
+        demanda = DemandaService().demanda([(self.pizza.id, 2), (self.ensalada.id, 1), (self.pizza.id, 1), (self.pan.id, 4)])
+
+        self.assertEqual(demanda, {self.tomate.id: Decimal('9.000'), self.queso.id: Decimal('0.450')})
+
+    def test_cambio_de_receta_relee_solo_su_plato(self):
+        matriz_recetas.matriz_vigente()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.receta_queso.cantidad = 200
+            self.receta_queso.save()
+
+        with mock.patch.object(matriz_recetas, '_leer_filas', wraps=matriz_recetas._leer_filas) as leer:
+            demanda = DemandaService().demanda([(self.pizza.id, 1)])
+        leer.assert_called_once_with({self.pizza.id})
+        self.assertEqual(demanda[self.queso.id], Decimal('0.200'))
+
+        # Sin cambios no se relee nada
+        with mock.patch.object(matriz_recetas, '_leer_filas') as leer:
+            DemandaService().demanda([(self.pizza.id, 1)])
+        leer.assert_not_called()
+
+    def test_cambio_perdido_recompila_todo(self):
+        anterior = matriz_recetas.matriz_vigente()
+        with self.captureOnCommitCallbacks(execute=True):
+            Receta.objects.filter(plato=self.ensalada).delete()
+        cache.delete(f'recetas:cambios:{matriz_recetas.version_recetas()}')
+
+        with mock.patch.object(matriz_recetas, '_leer_filas', wraps=matriz_recetas._leer_filas) as leer:
+            matriz = matriz_recetas.matriz_vigente()
+        leer.assert_called_once_with()
+        self.assertIsNot(matriz, anterior)
+        self.assertEqual(DemandaService().demanda([(self.ensalada.id, 1)]), {})
+
+    def test_endpoint_demanda(self):
+        response = self.client.post('/api/stock/demanda/', {
+            'lineas': [{'plato_id': self.pizza.id, 'cantidad': 5}, {'plato_id': self.ensalada.id, 'cantidad': 1}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {
+                'ingrediente_id': self.queso.id, 'ingrediente': 'Queso', 'unidad_medida': 'kg',
+                'necesario': '0.750', 'disponible': '1.000', 'faltante': '0.000',
+            },
+            {
+                'ingrediente_id': self.tomate.id, 'ingrediente': 'Tomate', 'unidad_medida': 'un',
+                'necesario': '13.000', 'disponible': '10.000', 'faltante': '3.000',
+            },
+        ])
+
+        response = self.client.post('/api/stock/demanda/', {'lineas': [{'plato_id': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PronosticoTests(APITestCase):
+    """
+    Demanda horaria materializada, consumo y sugerencias de reposición
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.reiniciar()
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un", stock_minimo=5)
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="kg")
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=Decimal('0.5'))
+        self.pizza = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        self.ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=5, categoria=categoria)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=100, unidad_medida="gr")
+        Receta.objects.create(plato=self.ensalada, ingrediente=self.tomate, cantidad=1)
+        self.dia = datetime(2026, 10, 10, tzinfo=dt_timezone.utc)
+        self.pedidos = 0
+
+    def _reserva(self, plato, cantidad, fecha, estado='confirmado'):
+        self.pedidos += 1
+        reserva = ReservaStock.objects.create(
+            plato=plato, cantidad=cantidad, estado=estado, pedido_id=f'PED-{self.pedidos}'
+        )
+        ReservaStock.objects.filter(pk=reserva.pk).update(fecha_creacion=fecha)
+
+    def test_actualizar_resume_por_hora_desde_la_marca(self):
+        self._reserva(self.pizza, 1, self.dia + timedelta(hours=12, minutes=10))
+        self._reserva(self.pizza, 2, self.dia + timedelta(hours=12, minutes=40))
+        self._reserva(self.pizza, 5, self.dia + timedelta(hours=12, minutes=50), estado='liberado')
+        self._reserva(self.ensalada, 1, self.dia + timedelta(hours=13, minutes=5))
+        self._reserva(self.ensalada, 4, self.dia + timedelta(days=1, hours=20))
+        service = PronosticoService()
+
+        resumen = service.actualizar(hasta=self.dia + timedelta(days=1, minutes=30))
+
+        self.assertEqual(resumen['desde'], self.dia + timedelta(hours=12))
+        self.assertEqual(resumen['hasta'], self.dia + timedelta(days=1))
+        self.assertEqual(
+            list(DemandaHoraria.objects.order_by('hora').values_list('plato_id', 'hora', 'porciones')),
+            [
+                (self.pizza.id, self.dia + timedelta(hours=12), 3),
+                (self.ensalada.id, self.dia + timedelta(hours=13), 1),
+            ]
+        )
+
+        # La siguiente corrida sólo lee lo posterior a la marca
+        self.assertEqual(service.actualizar(hasta=self.dia + timedelta(days=1))['filas'], 0)
+        resumen = service.actualizar(hasta=self.dia + timedelta(days=3))
+        self.assertEqual(resumen['desde'], self.dia + timedelta(days=1))
+        self.assertEqual(resumen['filas'], 1)
+        self.assertEqual(DemandaHoraria.objects.count(), 3)
+        self.assertEqual(service.marca(), self.dia + timedelta(days=3))
+
+    def test_consumo_por_dia(self):
+        self._reserva(self.pizza, 3, self.dia + timedelta(hours=15))
+        self._reserva(self.ensalada, 1, self.dia + timedelta(hours=16))
+        service = PronosticoService()
+        service.actualizar(hasta=self.dia + timedelta(days=1))
+
+        consumo = service.consumo(self.dia, self.dia + timedelta(days=1))
+
+        self.assertEqual(
+            [(fila.periodo, fila.ingrediente_id, fila.cantidad) for fila in consumo.itertuples()],
+            [(date(2026, 10, 10), self.tomate.id, 7.0), (date(2026, 10, 10), self.queso.id, 0.3)]
+        )
+
+    def test_sugerencias_de_reposicion(self):
+        self._reserva(self.pizza, 3, self.dia + timedelta(hours=12))
+        self._reserva(self.pizza, 1, self.dia + timedelta(days=1, hours=12))
+        service = PronosticoService()
+        service.actualizar(hasta=self.dia + timedelta(days=2))
+
+        # tomate: 6 y 2 por día -> media 4, desvío 2; queso: 0.3 y 0.1
+        resultado = service.sugerencias(dias=2, cobertura_dias=1)
+
+        self.assertEqual(resultado['sugerencias'], [{
+            'ingrediente_id': self.tomate.id,
+            'ingrediente': 'Tomate',
+            'unidad_medida': 'un',
+            'disponible': Decimal('10.000'),
+            'stock_minimo': 5,
+            'consumo_diario': Decimal('4.000'),
+            'punto_pedido': Decimal('12.300'),
+            'sugerido': Decimal('2.300'),
+        }])
+
+        # Las estadísticas quedan en cache hasta que avance la marca
+        with self.assertNumQueries(1):
+            service.estadisticas(dias=2)
+
+        response = self.client.get('/api/ingredientes/reposicion/', {'dias': 2, 'cobertura': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['sugerencias'][0]['sugerido'], '2.300')
+        response = self.client.get('/api/ingredientes/reposicion/', {'dias': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_endpoint_consumo(self):
+        self._reserva(self.ensalada, 2, self.dia + timedelta(hours=15))
+        PronosticoService().actualizar(hasta=self.dia + timedelta(days=1))
+
+        response = self.client.get(
+            '/api/ingredientes/consumo/', {'desde': '2026-10-10', 'hasta': '2026-10-10', 'por': 'hora'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{
+            'periodo': (self.dia + timedelta(hours=15)).isoformat(),
+            'ingrediente_id': self.tomate.id,
+            'cantidad': '2.000',
+        }])
+        response = self.client.get('/api/ingredientes/consumo/', {'desde': '2026-10-10'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CostoTests(APITestCase):
+    """
+    Costo y margen materializados por plato
+    """
+
+    def setUp(self):
+        cache.clear()
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un", costo_unitario=Decimal('0.5'))
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="kg", costo_unitario=8)
+        self.lechuga = Ingrediente.objects.create(nombre="Lechuga", unidad_medida="un")
+        self.pizza = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        self.ensalada = Plato.objects.create(nombre="Ensalada", descripcion="", precio=4, categoria=categoria)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        self.receta_queso = Receta.objects.create(
+            plato=self.pizza, ingrediente=self.queso, cantidad=150, unidad_medida="gr"
+        )
+        Receta.objects.create(plato=self.ensalada, ingrediente=self.lechuga, cantidad=1)
+
+    def test_costo_se_materializa_con_las_recetas(self):
+        # 2 × 0.5 + 0.150 kg × 8
+        self.pizza.refresh_from_db()
+        self.assertEqual(self.pizza.costo, Decimal('2.20'))
+        self.assertTrue(self.pizza.costo_completo)
+        self.assertEqual(self.pizza.margen, Decimal('7.80'))
+        self.assertEqual(self.pizza.margen_porcentaje, Decimal('78.0'))
+
+        self.receta_queso.delete()
+        self.pizza.refresh_from_db()
+        self.assertEqual(self.pizza.costo, Decimal('1.00'))
+
+    def test_ingrediente_sin_costo_deja_el_costo_incompleto(self):
+        self.ensalada.refresh_from_db()
+        self.assertEqual(self.ensalada.costo, 0)
+        self.assertFalse(self.ensalada.costo_completo)
+
+        self.lechuga.costo_unitario = Decimal('1.25')
+        self.lechuga.save()
+        self.ensalada.refresh_from_db()
+        self.assertEqual(self.ensalada.costo, Decimal('1.25'))
+        self.assertTrue(self.ensalada.costo_completo)
+
+    def test_guardar_sin_cambiar_costo_ni_conversion_no_recalcula(self):
+        with mock.patch.object(CostoService, 'recalcular') as recalcular, \
+                mock.patch.object(ConversionService, 'recalcular_recetas') as recalcular_recetas:
+            self.queso.stock_minimo = 3
+            self.queso.costo_unitario = '8.0000'
+            self.queso.save()
+            recalcular.assert_not_called()
+            recalcular_recetas.assert_not_called()
+
+            self.queso.costo_unitario = Decimal('9')
+            self.queso.save()
+            recalcular.assert_called_once_with(ingrediente_ids=[self.queso.pk])
+            recalcular_recetas.assert_not_called()
+
+            self.queso.densidad = Decimal('1.1')
+            self.queso.save()
+            recalcular_recetas.assert_called_once_with([self.queso.pk])
+
+    def test_cambio_de_costo_recalcula_solo_los_platos_que_lo_usan(self):
+        # Un costo desactualizado a propósito: si se recalculara todo el menú
+        # la ensalada volvería a 0
+        Plato.objects.filter(pk=self.ensalada.pk).update(costo=99)
+
+        self.queso.costo_unitario = 10
+        self.queso.save()
+
+        self.pizza.refresh_from_db()
+        self.ensalada.refresh_from_db()
+        self.assertEqual(self.pizza.costo, Decimal('2.50'))
+        self.assertEqual(self.ensalada.costo, 99)
+        self.assertEqual(CostoService().platos_con([self.queso.id]), {self.pizza.id})
+
+    def test_importar_costos(self):
+        lineas = [
+            '{"nombre": "Tomate", "costo_unitario": "0.75"}',
+            '{"nombre": "Queso", "costo_unitario": "abc"}',
+            '{"nombre": "Lechuga", "costo_unitario": 0.3}',
+        ]
+
+        resumen = ImportadorStock().importar(lineas, 'jsonl')
+
+        self.assertEqual(resumen['ingredientes_actualizados'], 2)
+        self.assertEqual(resumen['rechazos'], [{'linea': 2, 'error': 'costo_unitario debe ser un número'}])
+        self.pizza.refresh_from_db()
+        self.ensalada.refresh_from_db()
+        self.assertEqual(self.pizza.costo, Decimal('2.70'))
+        self.assertEqual(self.ensalada.costo, Decimal('0.30'))
+        self.assertTrue(self.ensalada.costo_completo)
+
+    def test_api_y_listado_exponen_costo_y_margen(self):
+        response = self.client.get(reverse('plato-detail', kwargs={'pk': self.pizza.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['costo'], '2.20')
+        self.assertTrue(response.data['costo_completo'])
+        self.assertEqual(response.data['margen'], '7.80')
+        self.assertEqual(response.data['margen_porcentaje'], '78.0')
+        response = self.client.get(reverse('ingrediente-list'), {'fields': 'nombre,costo_unitario'})
+        self.assertIn({'nombre': 'Tomate', 'costo_unitario': '0.5000'}, response.data)
+
+        response = self.client.get(reverse('plato_list'))
+        # Formato local (es): coma decimal, igual que el precio
+        self.assertContains(response, '7,80 (78,0%)')
+        self.assertContains(response, 'incompleto')
+
+
+class BenchmarkTests(TestCase):
+    """
+    Humo del generador de carga: un catálogo chico y un worker
+    """
+
+    def test_sembrar_ejecutar_y_limpiar(self):
+        catalogo = benchmark.sembrar(platos=5, ingredientes=10, recetas_por_plato=2, categorias=2)
+        self.assertEqual(Receta.objects.count(), 10)
+
+        for escenario in benchmark.ESCENARIOS:
+            resultado = benchmark.ejecutar(escenario, catalogo, workers=1, requests=3)
+            self.assertEqual(resultado['requests'], 3)
+            self.assertEqual(resultado['errores'], 0)
+            self.assertEqual(resultado['rechazos'], 0)
+        self.assertEqual(ReservaStock.objects.count(), 3 + 3 * 3)
+
+        benchmark.limpiar()
+        self.assertFalse(Plato.objects.exists())
+        self.assertFalse(Ingrediente.objects.exists())
+
+    def test_comparar_demanda(self):
+        catalogo = benchmark.sembrar(platos=20, ingredientes=10, recetas_por_plato=3, categorias=2)
+
+        resultado = benchmark.comparar_demanda(catalogo, pedidos=5, repeticiones=1)
+
+        self.assertTrue(resultado['coinciden'])
+        self.assertEqual(resultado['platos'], 20)
+        self.assertEqual(resultado['recetas'], 60)
+        self.assertEqual(resultado['lineas'], 15)
+
+    def test_medir_costos(self):
+        catalogo = benchmark.sembrar(platos=20, ingredientes=30, recetas_por_plato=3, categorias=2)
+
+        resultado = benchmark.medir_costos(catalogo, cambios=5)
+
+        self.assertEqual(resultado['ingredientes'], 30)
+        self.assertEqual(resultado['cambios'], 5)
+        self.assertLessEqual(resultado['platos_recalculados'], 20)
+        self.assertTrue(resultado['coinciden'])
+
+    def test_medir_pronostico(self):
+        catalogo = benchmark.sembrar(platos=5, ingredientes=10, recetas_por_plato=2, categorias=2)
+
+        resultado = benchmark.medir_pronostico(catalogo, dias=3, reservas_por_dia=5, sucursales=2)
+
+        self.assertEqual(resultado['reservas'], 2 * 5 * 4)
+        self.assertGreater(resultado['filas_iniciales'], 0)
+        self.assertGreater(resultado['filas_nocturna'], 0)
+        self.assertFalse(MarcaProceso.objects.exists())
+
+        benchmark.limpiar()
+        self.assertFalse(Sucursal.objects.filter(nombre__startswith='Bench').exists())
+
+
+class MetricasTests(APITestCase):
+    """
+    Tests del middleware de métricas y del endpoint /metrics
+    """
+
+    def setUp(self):
+        metricas.reiniciar()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=self.categoria)
+        for i in range(3):
+            ingrediente = Ingrediente.objects.create(nombre=f"Ingrediente {i}", unidad_medida="un")
+            Receta.objects.create(plato=self.plato, ingrediente=ingrediente, cantidad=1)
+
+    def test_expone_histogramas_por_vista(self):
+        self.client.get(reverse('plato-list'), {'categoria': self.categoria.id})
+        self.client.get(reverse('plato-list'), {'categoria': self.categoria.id})
+
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        texto = response.content.decode()
+        self.assertIn('menu_request_duracion_segundos_count{vista="plato-list",metodo="GET"} 2', texto)
+        self.assertIn('menu_request_consultas_sum{vista="plato-list",metodo="GET"} 4', texto)
+        self.assertIn('menu_requests_total{vista="plato-list",metodo="GET",estado="200"} 2', texto)
+        # /metrics no se mide a sí mismo
+        self.assertNotIn('vista="metricas"', texto)
+
+    @override_settings(METRICAS_UMBRAL_REPETIDAS=3)
+    def test_detecta_consultas_repetidas(self):
+        """
+        El formset de recetas consulta los ingredientes una vez por formulario
+        """
+        with self.assertLogs('mainApp.middleware', level='WARNING'):
+            self.client.get(reverse('plato_update', kwargs={'pk': self.plato.pk}))
+
+        texto = metricas.exportar_prometheus()
+        self.assertIn('menu_request_consultas_repetidas_total{vista="plato_update",metodo="GET"} 1', texto)
+
+    @override_settings(METRICAS_MUESTREO=0)
+    def test_muestreo_apagado(self):
+        self.client.get(reverse('plato-list'))
+        self.assertNotIn('plato-list', metricas.exportar_prometheus())
+
+
+class VistasAsyncTests(TestCase):
+    """
+    Tests de los endpoints async (ASGI) de menú, disponibilidad y reserva
+    """
+
+    def setUp(self):
+        cache.clear()
+        metricas.reiniciar()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.stock = Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=self.categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+
+    def test_mismo_contenido_que_los_endpoints_sync(self):
+        for sync, asincrona in (
+            ('plato-list', 'plato-list-async'),
+            ('plato-disponibilidad', 'plato-disponibilidad-async'),
+        ):
+            esperado = self.client.get(reverse(sync))
+            response = self.client.get(reverse(asincrona))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), esperado.json())
+
+    async def test_menu_con_etag(self):
+        url = reverse('plato-list-async')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['nombre'], "Pizza")
+
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_reserva_descuenta_y_es_idempotente(self):
+        url = reverse('stock-validar-reservar-async')
+        datos = {'plato_id': self.plato.id, 'cantidad': 2, 'pedido_id': 'PED-ASYNC'}
+        primera = await self.async_client.post(url, datos, content_type='application/json')
+        segunda = await self.async_client.post(url, datos, content_type='application/json')
+
+        self.assertEqual(primera.status_code, status.HTTP_200_OK)
+        self.assertEqual(segunda.json()['reserva_id'], primera.json()['reserva_id'])
+        await self.stock.arefresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, Decimal('6'))
+        self.assertEqual(await ReservaStock.objects.filter(pedido_id='PED-ASYNC').acount(), 1)
+
+    async def test_reserva_invalida(self):
+        url = reverse('stock-validar-reservar-async')
+        response = await self.async_client.post(url, 'no es json', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = await self.async_client.post(
+            url, {'plato_id': self.plato.id, 'cantidad': 50, 'pedido_id': 'PED-X'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.json()['success'])
+
+    async def test_metricas_en_modo_async(self):
+        """
+        Bajo ASGI el middleware registra la latencia pero no las consultas
+        """
+        await self.async_client.get(reverse('plato-list-async'))
+
+        texto = metricas.exportar_prometheus()
+        self.assertIn('menu_request_duracion_segundos_count{vista="plato-list-async",metodo="GET"} 1', texto)
+        self.assertIn('menu_request_consultas_count{vista="plato-list-async",metodo="GET"} 0', texto)
+
+
+class EventosTests(TestCase):
+    """
+    Tests del canal de novedades de stock y menú (SSE y long-poll)
+    """
+
+    def setUp(self):
+        cache.clear()
+        eventos.reiniciar()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=self.categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+        # Lo publicado al armar los datos no interesa
+        eventos.reiniciar()
+
+    def test_reserva_publica_stock_y_disponibilidad(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService().validar_y_reservar_stock(self.plato.id, 1, 'PED-EV')
+
+        ultimo, nuevos = eventos.broker().leer(0)
+        self.assertEqual(ultimo, 1)
+        self.assertEqual(nuevos, [(1, 'stock', {'sucursal_id': 1, 'ingrediente_ids': [self.tomate.id]})])
+        [(_, tipo, datos)] = NovedadesService().expandir(nuevos)
+        self.assertEqual(datos['stock'], [
+            {'ingrediente_id': self.tomate.id, 'cantidad_disponible': '8.000', 'bajo_minimo': False}
+        ])
+        self.assertEqual(datos['disponibilidad'], [
+            {'plato_id': self.plato.id, 'nombre': "Pizza", 'porciones': 4, 'disponible': True}
+        ])
+
+    def test_publicar_no_consulta_la_base(self):
+        """
+        Con eventos habilitados la reserva hace las mismas consultas que sin
+        ellos, aun ejecutando lo que corre al confirmar
+        """
+        with self.assertNumQueries(8), self.captureOnCommitCallbacks(execute=True):
+            StockService().validar_y_reservar_stock(self.plato.id, 1, 'PED-EV')
+        self.assertEqual(eventos.broker().ultimo(), 1)
+
+    def test_expandir_arma_una_vez_los_eventos_repetidos(self):
+        for _ in range(3):
+            NovedadesService().publicar_stock([self.tomate.id])
+        _, nuevos = eventos.broker().leer(0)
+
+        with self.assertNumQueries(2):
+            expandidos = NovedadesService().expandir(nuevos)
+        self.assertEqual([evento[0] for evento in expandidos], [1, 2, 3])
+        self.assertEqual(expandidos[0][2]['stock'][0]['cantidad_disponible'], '10.000')
+
+    def test_reserva_rechazada_no_publica(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValidationError):
+                StockService().validar_y_reservar_stock(self.plato.id, 50, 'PED-EV')
+        self.assertEqual(eventos.broker().leer(0), (0, []))
+
+    def test_plato_desactivado_sale_como_retirado(self):
+        self.plato.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plato.save()
+
+        _, nuevos = eventos.broker().leer(0)
+        self.assertEqual(
+            NovedadesService().expandir(nuevos)[-1][1:],
+            ('menu', {'sucursal_id': 1, 'disponibilidad': [], 'retirados': [self.plato.id]})
+        )
+
+    @override_settings(EVENTOS_HEARTBEAT_SEGUNDOS=0)
+    async def test_stream_retoma_desde_last_event_id(self):
+        for numero in range(3):
+            eventos.publicar('stock', {'numero': numero})
+
+        response = await self.async_client.get(reverse('eventos'), headers={'Last-Event-ID': '1'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        flujo = response.streaming_content
+        partes = [await anext(flujo) for _ in range(4)]
+        await flujo.aclose()
+
+        self.assertEqual(partes[0], b'retry: 3000\n\n')
+        self.assertEqual(partes[1], b'id: 2\nevent: stock\ndata: {"numero": 1}\n\n')
+        self.assertEqual(partes[2], b'id: 3\nevent: stock\ndata: {"numero": 2}\n\n')
+        self.assertEqual(partes[3], b': ping\n\n')
+
+    async def test_stream_con_id_desconocido_pide_reset(self):
+        eventos.publicar('stock', {})
+
+        response = await self.async_client.get(reverse('eventos'), {'ultimo_id': 99})
+        flujo = response.streaming_content
+        partes = [await anext(flujo) for _ in range(2)]
+        await flujo.aclose()
+        self.assertEqual(partes[1], b'id: 1\nevent: reset\ndata: {}\n\n')
+
+    async def test_long_poll(self):
+        url = reverse('eventos-poll')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json(), {'ultimo_id': 0, 'reset': False, 'eventos': []})
+
+        eventos.publicar('menu', {'retirados': [1]})
+        response = await self.async_client.get(url, {'desde': 0, 'espera': 0})
+        self.assertEqual(response.json(), {
+            'ultimo_id': 1, 'reset': False,
+            'eventos': [{'id': 1, 'tipo': 'menu', 'datos': {'retirados': [1]}}]
+        })
+
+        response = await self.async_client.get(url, {'desde': 1, 'espera': 0})
+        self.assertEqual(response.json()['eventos'], [])
+
+    async def test_long_poll_arma_los_datos_al_leer(self):
+        NovedadesService().publicar_stock([self.tomate.id])
+
+        response = await self.async_client.get(reverse('eventos-poll'), {'desde': 0, 'espera': 0})
+        [evento] = response.json()['eventos']
+        self.assertEqual(evento['datos']['stock'], [
+            {'ingrediente_id': self.tomate.id, 'cantidad_disponible': '10.000', 'bajo_minimo': False}
+        ])
+
+    def test_long_poll_bajo_wsgi_no_espera(self):
+        with mock.patch.object(eventos.BrokerMemoria, 'esperar', autospec=True, return_value=(0, [])) as esperar:
+            response = self.client.get(reverse('eventos-poll'), {'desde': 0, 'espera': 30})
+
+        self.assertEqual(response.json()['eventos'], [])
+        esperar.assert_called_once_with(eventos.broker(), 0, 0)
+
+    @override_settings(EVENTOS_BROKER='cache', EVENTOS_RETENCION=2)
+    def test_broker_en_cache(self):
+        for numero in range(3):
+            eventos.publicar('stock', {'numero': numero})
+
+        canal = eventos.broker()
+        self.assertEqual(canal.leer(0), (3, None))
+        self.assertEqual(canal.leer(1), (3, [(2, 'stock', {'numero': 1}), (3, 'stock', {'numero': 2})]))
+        self.assertEqual(canal.leer(3), (3, []))
+        self.assertEqual(canal.leer(7), (3, None))
+
+
+class ColaReservasTests(TestCase):
+    """
+    Tests de las reservas en lote (modo cola) y de la cola que las agrupa
+    """
+
+    def setUp(self):
+        categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.stock = Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Pizza", descripcion="", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.tomate, cantidad=2)
+        self.service = StockService()
+
+    def test_lote_valida_contra_el_stock_en_memoria(self):
+        solicitudes = [
+            ([(self.plato.id, 3)], 'PED-A', None),
+            ([(self.plato.id, 2)], 'PED-B', None),
+            ([(self.plato.id, 1)], 'PED-C', None),
+        ]
+        resultados = self.service.reservar_lote(solicitudes)
+
+        self.assertEqual(resultados[0][0].cantidad, 3)
+        self.assertEqual(resultados[1][0].cantidad, 2)
+        self.assertIsInstance(resultados[2], ValidationError)
+        self.assertIn("Disponible: 0", resultados[2].message)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 0)
+        self.assertEqual(
+            sorted(MovimientoStock.objects.filter(tipo='reserva').values_list('referencia', 'cantidad')),
+            [('PED-A', Decimal('-6')), ('PED-B', Decimal('-4'))]
+        )
+
+    def test_consultas_fijas_por_lote(self):
+        """
+        Idempotencia, platos, stock, UPDATE y dos INSERT (más el savepoint)
+        sin importar cuántas solicitudes traiga el lote
+        """
+        solicitudes = [([(self.plato.id, 1)], f'PED-{i}', None) for i in range(5)]
+        with self.assertNumQueries(8):
+            self.service.reservar_lote(solicitudes)
+        self.assertEqual(ReservaStock.objects.count(), 5)
+
+    def test_reintentos_dentro_y_fuera_del_lote(self):
+        previa = self.service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1')
+
+        resultados = self.service.reservar_lote([
+            ([(self.plato.id, 1)], 'PED-1', None),
+            ([(self.plato.id, 2)], 'PED-1', None),
+            ([(self.plato.id, 1)], 'PED-2', None),
+            ([(self.plato.id, 1)], 'PED-2', None),
+            ([(9999, 1)], 'PED-3', None),
+        ])
+
+        self.assertEqual(resultados[0], [previa])
+        self.assertIsInstance(resultados[1], ReservaDuplicada)
+        self.assertEqual(resultados[2], resultados[3])
+        self.assertIn("no encontrado", resultados[4].message)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 6)
+
+    def test_lote_fallido_se_reprocesa_de_a_una(self):
+        with mock.patch.object(StockService, '_reservar_lote', side_effect=IntegrityError):
+            with self.assertLogs('mainApp.services', level='WARNING'):
+                resultados = self.service.reservar_lote([
+                    ([(self.plato.id, 1)], 'PED-1', None),
+                    ([(self.plato.id, 50)], 'PED-2', None),
+                ])
+        self.assertEqual(resultados[0][0].pedido_id, 'PED-1')
+        self.assertIsInstance(resultados[1], ValidationError)
+
+    def test_integrity_error_al_reprocesar_queda_en_su_solicitud(self):
+        original = StockService._reservar_idempotente
+
+        def falla_ped_2(service, lineas, pedido_id, sucursal_id=None):
+            if pedido_id == 'PED-2':
+                raise IntegrityError
+            return original(service, lineas, pedido_id, sucursal_id)
+
+        with mock.patch.object(StockService, '_reservar_lote', side_effect=IntegrityError), \
+                mock.patch.object(StockService, '_reservar_idempotente', falla_ped_2):
+            with self.assertLogs('mainApp.services', level='WARNING'):
+                resultados = self.service.reservar_lote([
+                    ([(self.plato.id, 1)], 'PED-1', None),
+                    ([(self.plato.id, 1)], 'PED-2', None),
+                    ([(self.plato.id, 1)], 'PED-3', None),
+                ])
+        self.assertEqual(resultados[0][0].pedido_id, 'PED-1')
+        self.assertIsInstance(resultados[1], IntegrityError)
+        self.assertEqual(resultados[2][0].pedido_id, 'PED-3')
+
+    @override_settings(RESERVA_MODO='cola')
+    def test_dentro_de_una_transaccion_no_usa_la_cola(self):
+        with mock.patch('mainApp.services._cola_reservas') as cola:
+            reserva = self.service.validar_y_reservar_stock(self.plato.id, 1, 'PED-1')
+        cola.assert_not_called()
+        self.assertEqual(reserva.pedido_id, 'PED-1')
+
+    def test_cola_agrupa_y_ordena_por_politica(self):
+        lotes = []
+
+        def procesar(solicitudes):
+            lotes.append(solicitudes)
+            return [pedido_id for _, pedido_id, _ in solicitudes]
+
+        cola = ColaReservas(procesar, ventana=0.2, politica='pedidos_chicos')
+        futuros = [cola.encolar([(1, cantidad)], f'PED-{cantidad}') for cantidad in (5, 1, 3)]
+
+        self.assertEqual([futuro.result(timeout=5) for futuro in futuros], ['PED-5', 'PED-1', 'PED-3'])
+        self.assertEqual(lotes, [[([(1, 1)], 'PED-1', None), ([(1, 3)], 'PED-3', None), ([(1, 5)], 'PED-5', None)]])
+
+    def test_cola_sin_respuesta_a_tiempo(self):
+        cola = ColaReservas(lambda solicitudes: time.sleep(0.5) or [None] * len(solicitudes), ventana=0, timeout=0.01)
+        with self.assertRaises(ValidationError):
+            cola.reservar([(1, 1)], 'PED-1')
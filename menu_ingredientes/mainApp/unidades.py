@@ -0,0 +1,104 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.exceptions import ValidationError
+
+
+# CONVERSIÓN DE UNIDADES
+# El stock de cada ingrediente se cuenta en su unidad_medida; las recetas
+# pueden escribirse en cualquier unidad convertible a ella. La conversión se
+# hace una vez, al guardar (Receta.cantidad_base, conteos de Stock cargados
+# en otra unidad): las reservas y la disponibilidad sólo multiplican y restan
+# cantidades ya expresadas en la unidad del stock.
+#
+# Dentro de una misma magnitud (masa, volumen, piezas) alcanza con el factor
+# de la tabla. Entre magnitudes hace falta un dato del ingrediente:
+# - densidad (g/ml) entre masa y volumen
+# - peso_unidad (g por pieza) entre piezas y masa
+# - ambos entre piezas y volumen
+
+UNIDADES = [
+    ('gr', 'Gramos'),
+    ('kg', 'Kilogramos'),
+    ('un', 'Unidades'),
+    ('lt', 'Litros'),
+    ('ml', 'Mililitros'),
+]
+
+# unidad: (magnitud, cantidad de la unidad base de la magnitud)
+FACTORES = {
+    'gr': ('masa', Decimal('1')),
+    'kg': ('masa', Decimal('1000')),
+    'ml': ('volumen', Decimal('1')),
+    'lt': ('volumen', Decimal('1000')),
+    'un': ('piezas', Decimal('1')),
+}
+
+# Precisión de Receta.cantidad_base y de Stock: cantidad_base por porciones
+# ya tiene la precisión del stock, las reservas no redondean
+DECIMALES_BASE = Decimal('0.001')
+
+
+class ConversionImposible(ValidationError):
+    """
+    Las unidades no son convertibles con los datos del ingrediente.
+    """
+
+
+def _en_gramos(unidad, densidad, peso_unidad):
+    """
+    Gramos que pesa una unidad, o None si falta el dato para saberlo.
+    """
+    magnitud, factor = FACTORES[unidad]
+    if magnitud == 'masa':
+        return factor
+    if magnitud == 'volumen':
+        return factor * densidad if densidad else None
+    return peso_unidad or None
+
+
+def factor(origen, destino, densidad=None, peso_unidad=None):
+    """
+    Cuántas `destino` hay en una `origen`. densidad en g/ml, peso_unidad en
+    gramos por pieza; sólo se usan si las magnitudes son distintas.
+    """
+    if origen not in FACTORES or destino not in FACTORES:
+        raise ConversionImposible(f"Unidad desconocida: {origen if origen not in FACTORES else destino}")
+    magnitud_origen, factor_origen = FACTORES[origen]
+    magnitud_destino, factor_destino = FACTORES[destino]
+    if magnitud_origen == magnitud_destino:
+        return factor_origen / factor_destino
+
+    gramos_origen = _en_gramos(origen, densidad, peso_unidad)
+    gramos_destino = _en_gramos(destino, densidad, peso_unidad)
+    if gramos_origen is None or gramos_destino is None:
+        faltan = []
+        if 'volumen' in (magnitud_origen, magnitud_destino) and not densidad:
+            faltan.append('densidad')
+        if 'piezas' in (magnitud_origen, magnitud_destino) and not peso_unidad:
+            faltan.append('peso_unidad')
+        raise ConversionImposible(
+            f"No se puede convertir {origen} a {destino}: falta {' y '.join(faltan)} del ingrediente"
+        )
+    return gramos_origen / gramos_destino
+
+
+def a_unidad_de_stock(cantidad, unidad, ingrediente):
+    """
+    `cantidad` en `unidad` (vacía: la del ingrediente) expresada en la unidad
+    de stock del ingrediente, con la precisión de Receta.cantidad_base.
+    """
+    cantidad = Decimal(str(cantidad))
+    conversion = Decimal('1')
+    if unidad and unidad != ingrediente.unidad_medida:
+        try:
+            conversion = factor(unidad, ingrediente.unidad_medida, ingrediente.densidad, ingrediente.peso_unidad)
+        except ConversionImposible as error:
+            raise ConversionImposible(f"{ingrediente.nombre}: {error.message}")
+    base = (cantidad * conversion).quantize(DECIMALES_BASE, rounding=ROUND_HALF_UP)
+    if cantidad > 0 and base == 0:
+        # Una receta en cero no limitaría nunca la disponibilidad
+        raise ConversionImposible(
+            f"{ingrediente.nombre}: {cantidad} {unidad} es menos de lo que se puede descontar "
+            f"en {ingrediente.unidad_medida}"
+        )
+    return base
@@ -1,9 +1,21 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import PlatoViewSet, IngredienteViewSet, StockViewSet
+from .views import (
+    PlatoViewSet, IngredienteViewSet, StockViewSet, ReservaViewSet, SucursalViewSet,
+    disponibilidad_async, eventos_poll, eventos_stream, menu_async, validar_reservar_async
+)
 
 router = DefaultRouter()
 router.register(r'platos', PlatoViewSet, basename='plato')
 router.register(r'ingredientes', IngredienteViewSet, basename='ingrediente')
 router.register(r'stock', StockViewSet, basename='stock')
+router.register(r'reservas', ReservaViewSet, basename='reserva')
+router.register(r'sucursales', SucursalViewSet, basename='sucursal')
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('async/platos/', menu_async, name='plato-list-async'),
+    path('async/platos/disponibilidad/', disponibilidad_async, name='plato-disponibilidad-async'),
+    path('async/stock/validar_reservar/', validar_reservar_async, name='stock-validar-reservar-async'),
+    path('eventos/', eventos_stream, name='eventos'),
+    path('eventos/poll/', eventos_poll, name='eventos-poll'),
+]
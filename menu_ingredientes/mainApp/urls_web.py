@@ -15,6 +15,7 @@ urlpatterns = [
 
     path('stock/', views.stock_list, name='stock_list'),
     path('stock/new/', views.stock_create, name='stock_create'),
+    path('stock/bajo-minimo/', views.stock_bajo_minimo, name='stock_bajo_minimo'),
     # Ingredientes
     path('ingredientes/', views.ingrediente_list, name='ingrediente_list'),
     path('ingrediente/new/', views.ingrediente_create, name='ingrediente_create'),
@@ -23,4 +24,6 @@ urlpatterns = [
     path('stock/<int:pk>/edit/', views.stock_update, name='stock_update'),
 
     path('simular/', views.simular_pedido, name='simular_pedido'),
+
+    path('metrics', views.metricas, name='metricas'),
 ]
@@ -1,16 +1,180 @@
 # IMPORTS
+import asyncio
+import codecs
+import json
+from asgiref.sync import sync_to_async
+from datetime import datetime, time, timedelta
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock
+from .models import (
+    AlertaStock, CategoriaMenu, Ingrediente, MovimientoStock, Plato, Receta, Stock, ReservaStock, Sucursal
+)
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.forms import inlineformset_factory
 from .forms import PlatoForm, StockForm, CategoriaForm, IngredienteForm, RecetaInlineForm
+from .services import (
+    AlertaStockService, DemandaService, DisponibilidadService, Exportador, ImportadorStock,
+    MovimientoService, NovedadesService, PlatoService, ReservaDuplicada, StockService
+)
+from . import eventos
+from .pronostico import PronosticoService
+from .metricas import exportar_prometheus
+from .menu_cache import etag_coincide, guardar_respuesta_reserva, respuesta_reserva, snapshot_menu
 from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock
 
+# PAGINACIÓN, FILTROS Y PROYECCIÓN
+def proyectar(data, fields):
+    if fields is None:
+        return data
+    return {campo: valor for campo, valor in data.items() if campo in fields}
+
+
+def campos_solicitados(request):
+    """
+    ?fields=id,nombre -> {'id', 'nombre'}; sin parámetro devuelve None (todos).
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {campo.strip() for campo in fields.split(',') if campo.strip()}
+
+
+def parametro_bool(valor):
+    return str(valor).lower() in ('1', 'true', 'si', 'sí')
+
+
+def sucursal_solicitada(valor):
+    """
+    ?sucursal=N (o sucursal_id en el cuerpo) -> N; sin valor devuelve None
+    y los servicios usan la sucursal predeterminada.
+    """
+    if valor in (None, ''):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValidationError('sucursal debe ser un número válido')
+
+
+def lineas_solicitadas(lineas_data):
+    """
+    [{"plato_id": 1, "cantidad": 2}, ...] -> [(plato_id, cantidad)].
+    """
+    lineas = []
+    for indice, linea in enumerate(lineas_data):
+        try:
+            plato_id = int(linea.get('plato_id'))
+            cantidad = int(linea.get('cantidad'))
+        except (AttributeError, TypeError, ValueError):
+            raise ValidationError(f'linea {indice}: plato_id y cantidad deben ser números válidos')
+        if cantidad <= 0:
+            raise ValidationError(f'linea {indice}: cantidad debe ser mayor a 0')
+        lineas.append((plato_id, cantidad))
+    return lineas
+
+
+def paginar_por_cursor(request, queryset):
+    """
+    Paginación keyset por pk: ?limit=N&cursor=X. El cursor es el último pk
+    de la página anterior (codificado), así que cada página es un
+    WHERE pk > X ORDER BY pk LIMIT N sin importar qué tan lejos se pagine.
+    Devuelve (filas, headers); si hay más filas, headers trae un Link rel="next".
+    """
+    try:
+        limite = int(request.query_params.get('limit', settings.API_PAGINA_TAMANIO))
+    except ValueError:
+        raise ValidationError('limit debe ser un número válido')
+    limite = max(1, min(limite, settings.API_PAGINA_MAXIMA))
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        try:
+            ultimo_pk = int(urlsafe_b64decode(cursor.encode()).decode())
+        except ValueError:
+            raise ValidationError('cursor inválido')
+        queryset = queryset.filter(pk__gt=ultimo_pk)
+
+    filas = list(queryset.order_by('pk')[:limite + 1])
+    headers = {}
+    if len(filas) > limite:
+        filas = filas[:limite]
+        params = request.query_params.copy()
+        params['cursor'] = urlsafe_b64encode(str(filas[-1].pk).encode()).decode()
+        siguiente = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+        headers['Link'] = f'<{siguiente}>; rel="next"'
+    return filas, headers
+
+
+# EXPORTACIÓN
+class ExportacionRenderer(BaseRenderer):
+    """
+    Permite que la negociación de contenido acepte text/csv o
+    application/x-ndjson en los endpoints de exportación. El contenido real
+    lo genera la StreamingHttpResponse; sólo los errores pasan por aquí.
+    """
+    media_type = '*/*'
+    format = 'exportacion'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+
+def parsear_fecha(valor, fin=False):
+    """
+    Acepta fecha (YYYY-MM-DD) o fecha y hora ISO. Una fecha sola como `fin`
+    se toma como el comienzo del día siguiente, para filtrar con < sobre el
+    índice de fecha_creacion.
+    """
+    if not valor:
+        return None
+    # parse_datetime también acepta una fecha sola (medianoche): se prueba
+    # primero como fecha para no perder el día completo de `fin`
+    fecha = parse_date(valor)
+    if fecha is not None:
+        if fin:
+            fecha += timedelta(days=1)
+        fecha_hora = datetime.combine(fecha, time.min)
+    else:
+        fecha_hora = parse_datetime(valor)
+        if fecha_hora is None:
+            raise ValidationError(f'fecha inválida: {valor}')
+    if timezone.is_naive(fecha_hora):
+        fecha_hora = timezone.make_aware(fecha_hora)
+    return fecha_hora
+
+
+def respuesta_exportacion(request, nombre, columnas, filas):
+    formato = request.query_params.get('formato', 'csv')
+    if formato not in Exportador.FORMATOS:
+        return Response(
+            {'error': 'formato debe ser csv o jsonl'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    content_type = 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        Exportador().serializar(columnas, filas, formato),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return response
+
+
 # SERIALIZERS (Simples, sin DRF)
 class PlatoSerializer:
     def __init__(self, instance=None, data=None, partial=False):
@@ -18,26 +182,39 @@ class PlatoSerializer:
         self.data = data
         self.partial = partial  # Para soportar PATCH
     
-    def to_representation(self, instance):
-        return {
+    def to_representation(self, instance, fields=None):
+        # fields: conjunto de campos a devolver (None = todos). Las recetas
+        # sólo se recorren si se piden.
+        data = {
             'id': instance.id,
             'nombre': instance.nombre,
             'descripcion': instance.descripcion,
             'precio': str(instance.precio),
-            'categoria': {
+            'activo': instance.activo,
+            # Costo materializado de los ingredientes de una porción
+            'costo': str(instance.costo),
+            'costo_completo': instance.costo_completo,
+            'margen': str(instance.margen),
+            'margen_porcentaje': str(instance.margen_porcentaje) if instance.margen_porcentaje is not None else None,
+        }
+        if fields is None or 'categoria' in fields:
+            data['categoria'] = {
                 'id': instance.categoria.id if instance.categoria else None,
                 'nombre': instance.categoria.nombre if instance.categoria else None
-            },
-            'activo': instance.activo,
-            'recetas': [
+            }
+        if fields is None or 'recetas' in fields:
+            data['recetas'] = [
                 {
                     'id': receta.id,
                     'ingrediente': receta.ingrediente.nombre,
-                    'unidad_medida': receta.ingrediente.unidad_medida,
-                    'cantidad': str(receta.cantidad)
+                    'unidad_medida': receta.unidad_medida or receta.ingrediente.unidad_medida,
+                    'cantidad': str(receta.cantidad),
+                    # Lo que descuenta cada porción, en la unidad del stock
+                    'unidad_stock': receta.ingrediente.unidad_medida,
+                    'cantidad_base': str(receta.cantidad_base)
                 } for receta in instance.recetas.all()
             ]
-        }
+        return proyectar(data, fields)
 
     def is_valid(self):
         if not self.data:
@@ -68,7 +245,10 @@ class PlatoSerializer:
 
         return True
 
+    @transaction.atomic
     def save(self):
+        # Atómico: una receta con una unidad no convertible no deja el plato
+        # guardado a medias
         if self.instance:
             # UPDATE - Solo actualizar campos que vienen en data
             if 'nombre' in self.data:
@@ -82,24 +262,9 @@ class PlatoSerializer:
             
             self.instance.save()
             
-            # Manejar recetas si vienen en los datos
+            # Manejar recetas si vienen en los datos (sólo se tocan las líneas que cambian)
             if 'recetas' in self.data:
-                # Eliminar recetas existentes y crear nuevas
-                self.instance.recetas.all().delete()
-                recetas_data = self.data.get('recetas', [])
-                for receta_data in recetas_data:
-                    ingrediente_id = receta_data.get('ingrediente_id')
-                    cantidad = receta_data.get('cantidad')
-                    if ingrediente_id and cantidad:
-                        try:
-                            ingrediente = Ingrediente.objects.get(id=ingrediente_id)
-                            Receta.objects.create(
-                                plato=self.instance,
-                                ingrediente=ingrediente,
-                                cantidad=cantidad
-                            )
-                        except Ingrediente.DoesNotExist:
-                            continue
+                PlatoService().guardar_recetas(self.instance, self.data.get('recetas', []))
             
             return self.instance
         else:
@@ -112,81 +277,59 @@ class PlatoSerializer:
             )
             
             recetas_data = self.data.get('recetas', [])
-            for receta_data in recetas_data:
-                ingrediente_id = receta_data.get('ingrediente_id')
-                cantidad = receta_data.get('cantidad')
-                if ingrediente_id and cantidad:
-                    try:
-                        ingrediente = Ingrediente.objects.get(id=ingrediente_id)
-                        Receta.objects.create(
-                            plato=plato,
-                            ingrediente=ingrediente,
-                            cantidad=cantidad
-                        )
-                    except Ingrediente.DoesNotExist:
-                        continue
+            if recetas_data:
+                PlatoService().guardar_recetas(plato, recetas_data)
             return plato
 
 class IngredienteSerializer:
-    def to_representation(self, instance):
-        return {
+    def to_representation(self, instance, fields=None):
+        return proyectar({
             'id': instance.id,
             'nombre': instance.nombre,
             'unidad_medida': instance.unidad_medida,
-            'stock_minimo': instance.stock_minimo
-        }
+            'stock_minimo': instance.stock_minimo,
+            'costo_unitario': str(instance.costo_unitario) if instance.costo_unitario is not None else None
+        }, fields)
 
 
 class StockSerializer:
-    def to_representation(self, instance):
-        return {
+    def to_representation(self, instance, fields=None):
+        return proyectar({
             'id': instance.id,
+            'sucursal_id': instance.sucursal_id,
             'ingrediente': instance.ingrediente.nombre,
             'cantidad_disponible': str(instance.cantidad_disponible)
-        }
+        }, fields)
 
-# SERVICIO DE STOCK
-class StockService:
-    
-    @transaction.atomic
-    def validar_y_reservar_stock(self, plato_id, cantidad, pedido_id):
-        try:
-            plato = Plato.objects.get(id=plato_id, activo=True)
-            
-            # Verificar stock para cada ingrediente
-            for receta in plato.recetas.all():
-                stock = Stock.objects.get(ingrediente=receta.ingrediente)
-                cantidad_necesaria = receta.cantidad * cantidad
-                
-                if stock.cantidad_disponible < cantidad_necesaria:
-                    raise ValidationError(
-                        f"Stock insuficiente de {receta.ingrediente.nombre}. "
-                        f"Necesario: {cantidad_necesaria}, Disponible: {stock.cantidad_disponible}"
-                    )
-            
-            # Crear reserva
-            reserva = ReservaStock.objects.create(
-                plato=plato,
-                cantidad=cantidad,
-                pedido_id=pedido_id,
-                estado='reservado'
-            )
-            
-            # Bloquear stock reservado
-            for receta in plato.recetas.all():
-                stock = Stock.objects.get(ingrediente=receta.ingrediente)
-                cantidad_necesaria = receta.cantidad * cantidad
-                stock.cantidad_disponible -= cantidad_necesaria
-                stock.save()
-            
-            return reserva
-            
-        except Plato.DoesNotExist:
-            raise ValidationError("Plato no encontrado o inactivo")
-        except Stock.DoesNotExist:
-            raise ValidationError("Error en configuración de stock")
+
+class ReservaSerializer:
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'sucursal_id': instance.sucursal_id,
+            'plato_id': instance.plato_id,
+            'cantidad': instance.cantidad,
+            'estado': instance.estado,
+            'pedido_id': instance.pedido_id,
+            'fecha_creacion': instance.fecha_creacion.isoformat()
+        }
 
 # VIEWSETS
+def platos_con_recetas():
+    """
+    Platos activos con su categoría, recetas e ingredientes precargados:
+    serializar cualquier cantidad de platos cuesta siempre 2 consultas.
+    """
+    return Plato.objects.filter(activo=True).select_related('categoria').prefetch_related(
+        Prefetch('recetas', queryset=Receta.objects.select_related('ingrediente'))
+    )
+
+
+def construir_menu():
+    serializer = PlatoSerializer()
+    return [serializer.to_representation(plato) for plato in platos_con_recetas()]
+
+
 class PlatoViewSet(viewsets.ViewSet):
 
     # ... tus métodos existentes (list, retrieve, create, destroy) ...
@@ -205,7 +348,10 @@ class PlatoViewSet(viewsets.ViewSet):
         
         serializer = PlatoSerializer(instance=plato, data=request.data)
         if serializer.is_valid():
-            plato_actualizado = serializer.save()
+            try:
+                plato_actualizado = serializer.save()
+            except ValidationError as e:
+                return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
             return Response({
                 'id': plato_actualizado.id,
                 'message': 'Plato actualizado exitosamente',
@@ -232,7 +378,10 @@ class PlatoViewSet(viewsets.ViewSet):
         # Para PATCH, permitimos actualización parcial
         serializer = PlatoSerializer(instance=plato, data=request.data, partial=True)
         if serializer.is_valid():
-            plato_actualizado = serializer.save()
+            try:
+                plato_actualizado = serializer.save()
+            except ValidationError as e:
+                return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
             return Response({
                 'id': plato_actualizado.id,
                 'message': 'Plato actualizado parcialmente',
@@ -245,14 +394,54 @@ class PlatoViewSet(viewsets.ViewSet):
         )
 
     def list(self, request):
-        platos = Plato.objects.filter(activo=True).select_related('categoria')
+        """
+        GET /api/platos/ - Menú activo, servido desde el snapshot en cache.
+        Soporta If-None-Match: si el ETag coincide responde 304 sin cuerpo.
+        Con parámetros (categoria, activo, nombre, fields, limit, cursor) se
+        consulta la base con paginación por cursor.
+        """
+        if request.query_params:
+            return self._listar_filtrado(request)
+
+        etag, data = snapshot_menu(construir_menu)
+        if etag_coincide(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    def _listar_filtrado(self, request):
+        fields = campos_solicitados(request)
+        activo = request.query_params.get('activo')
+        platos = Plato.objects.filter(activo=parametro_bool(activo) if activo is not None else True)
+
+        categoria = request.query_params.get('categoria')
+        if categoria:
+            if not categoria.isdigit():
+                return Response({'error': 'categoria debe ser un número válido'}, status=status.HTTP_400_BAD_REQUEST)
+            platos = platos.filter(categoria_id=categoria)
+        nombre = request.query_params.get('nombre')
+        if nombre:
+            platos = platos.filter(nombre__istartswith=nombre)
+
+        # Sólo se cargan las relaciones que la proyección necesita
+        if fields is None or 'categoria' in fields:
+            platos = platos.select_related('categoria')
+        if fields is None or 'recetas' in fields:
+            platos = platos.prefetch_related(
+                Prefetch('recetas', queryset=Receta.objects.select_related('ingrediente'))
+            )
+
+        try:
+            platos, headers = paginar_por_cursor(request, platos)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = PlatoSerializer()
-        data = [serializer.to_representation(plato) for plato in platos]
-        return Response(data)
+        data = [serializer.to_representation(plato, fields) for plato in platos]
+        return Response(data, headers=headers)
     
     def retrieve(self, request, pk=None):
         try:
-            plato = Plato.objects.get(pk=pk, activo=True)
+            plato = platos_con_recetas().get(pk=pk)
             serializer = PlatoSerializer()
             return Response(serializer.to_representation(plato))
         except Plato.DoesNotExist:
@@ -264,7 +453,10 @@ class PlatoViewSet(viewsets.ViewSet):
     def create(self, request):
         serializer = PlatoSerializer(data=request.data)
         if serializer.is_valid():
-            plato = serializer.save()
+            try:
+                plato = serializer.save()
+            except ValidationError as e:
+                return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
             return Response(
                 {'id': plato.id, 'message': 'Plato creado exitosamente'},
                 status=status.HTTP_201_CREATED
@@ -274,6 +466,51 @@ class PlatoViewSet(viewsets.ViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        POST /api/platos/bulk/ - Crear/actualizar muchos platos con sus recetas
+        [{"nombre": ..., "precio": ..., "categoria": ..., "recetas": [...]},
+         {"id": 3, "precio": ..., "recetas": [...]}, ...]
+        Los ítems con "id" se actualizan, el resto se crea.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Se espera una lista de platos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        resultados = PlatoService().guardar_platos(items)
+        errores = sum(1 for resultado in resultados if not resultado['success'])
+        return Response({
+            'success': errores == 0,
+            'procesados': len(resultados) - errores,
+            'errores': errores,
+            'resultados': resultados
+        }, status=status.HTTP_200_OK if errores == 0 else status.HTTP_207_MULTI_STATUS)
+
+    @action(detail=False, methods=['get'])
+    def disponibilidad(self, request):
+        """
+        GET /api/platos/disponibilidad/?sucursal=N - Porciones que se pueden
+        preparar de cada plato activo con el stock actual de la sucursal (sin
+        reservar nada)
+        """
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(DisponibilidadService().disponibilidad(sucursal_id))
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, ExportacionRenderer])
+    def exportar(self, request):
+        """
+        GET /api/platos/exportar/?formato=csv|jsonl - Platos con sus recetas
+        """
+        columnas, filas = Exportador().platos()
+        return respuesta_exportacion(request, 'platos', columnas, filas)
+
     def destroy(self, request, pk=None):
         try:
             plato = Plato.objects.get(pk=pk)
@@ -289,53 +526,429 @@ class PlatoViewSet(viewsets.ViewSet):
 class IngredienteViewSet(viewsets.ViewSet):
     
     def list(self, request):
+        """
+        GET /api/ingredientes/ - Filtros: nombre (prefijo), unidad_medida,
+        bajo_stock (en la sucursal indicada con ?sucursal=N). Paginado por
+        cursor (limit, cursor) y proyección con fields.
+        """
         ingredientes = Ingrediente.objects.all()
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        nombre = request.query_params.get('nombre')
+        if nombre:
+            ingredientes = ingredientes.filter(nombre__istartswith=nombre)
+        unidad_medida = request.query_params.get('unidad_medida')
+        if unidad_medida:
+            ingredientes = ingredientes.filter(unidad_medida=unidad_medida)
+        if parametro_bool(request.query_params.get('bajo_stock')):
+            ingredientes = ingredientes.filter(
+                stocks__sucursal_id=sucursal_id or settings.SUCURSAL_PREDETERMINADA,
+                stocks__bajo_minimo=True
+            )
+
+        try:
+            ingredientes, headers = paginar_por_cursor(request, ingredientes)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = campos_solicitados(request)
         serializer = IngredienteSerializer()
-        data = [serializer.to_representation(ing) for ing in ingredientes]
+        data = [serializer.to_representation(ing, fields) for ing in ingredientes]
+        return Response(data, headers=headers)
+
+    @action(detail=False, methods=['get'])
+    def bajo_stock(self, request):
+        """
+        GET /api/ingredientes/bajo_stock/?sucursal=N - Ingredientes bajo su
+        stock mínimo en la sucursal
+        """
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        data = [
+            {
+                'ingrediente_id': stock.ingrediente_id,
+                'ingrediente': stock.ingrediente.nombre,
+                'unidad_medida': stock.ingrediente.unidad_medida,
+                'cantidad_disponible': str(stock.cantidad_disponible),
+                'stock_minimo': stock.ingrediente.stock_minimo
+            } for stock in AlertaStockService().bajo_minimo(sucursal_id)
+        ]
         return Response(data)
 
+    @action(detail=False, methods=['get'])
+    def consumo(self, request):
+        """
+        GET /api/ingredientes/consumo/?desde=...&hasta=...&por=dia|hora - Consumo
+        de ingredientes de la sucursal (?sucursal=N) según las reservas ya
+        resumidas por actualizar_pronostico
+        """
+        por = request.query_params.get('por', 'dia')
+        if por not in ('dia', 'hora'):
+            return Response({'error': 'por debe ser dia u hora'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+            desde = parsear_fecha(request.query_params.get('desde'))
+            hasta = parsear_fecha(request.query_params.get('hasta'), fin=True)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        if desde is None or hasta is None:
+            return Response({'error': 'desde y hasta son requeridos'}, status=status.HTTP_400_BAD_REQUEST)
+        # Un año por día o un mes por hora acotan el tamaño de la respuesta
+        if hasta - desde > timedelta(days=366 if por == 'dia' else 31):
+            return Response({'error': 'rango de fechas demasiado grande'}, status=status.HTTP_400_BAD_REQUEST)
+
+        consumo = PronosticoService().consumo(desde, hasta, sucursal_id, por)
+        data = [
+            {
+                'periodo': fila.periodo.isoformat(),
+                'ingrediente_id': int(fila.ingrediente_id),
+                'cantidad': f"{fila.cantidad:.3f}",
+            } for fila in consumo.itertuples()
+        ]
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def reposicion(self, request):
+        """
+        GET /api/ingredientes/reposicion/?sucursal=N&dias=28&cobertura=7 -
+        Cuánto pedir de cada ingrediente para cubrir `cobertura` días según el
+        consumo de los últimos `dias` días
+        """
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+            dias = int(request.query_params.get('dias', 28))
+            cobertura = int(request.query_params.get('cobertura', 7))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'dias y cobertura deben ser números válidos'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < dias <= 366 or not 0 < cobertura <= 90:
+            return Response(
+                {'error': 'dias debe estar entre 1 y 366 y cobertura entre 1 y 90'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        resultado = PronosticoService().sugerencias(sucursal_id, dias=dias, cobertura_dias=cobertura)
+        return Response({
+            **resultado,
+            'sugerencias': [
+                {
+                    **fila,
+                    'disponible': str(fila['disponible']),
+                    'consumo_diario': str(fila['consumo_diario']),
+                    'punto_pedido': str(fila['punto_pedido']),
+                    'sugerido': str(fila['sugerido']),
+                } for fila in resultado['sugerencias']
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def alertas(self, request):
+        """
+        GET /api/ingredientes/alertas/?desde_id=N - Cruces del stock mínimo
+        registrados después de la alerta N (para consumirlos incrementalmente).
+        Con ?sucursal=N sólo los de esa sucursal.
+        """
+        try:
+            desde_id = int(request.query_params.get('desde_id', 0))
+        except ValueError:
+            return Response(
+                {'error': 'desde_id debe ser un número válido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        alertas = AlertaStock.objects.filter(pk__gt=desde_id).select_related('ingrediente')
+        if sucursal_id:
+            alertas = alertas.filter(sucursal_id=sucursal_id)
+        try:
+            alertas, headers = paginar_por_cursor(request, alertas)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = [
+            {
+                'id': alerta.id,
+                'sucursal_id': alerta.sucursal_id,
+                'ingrediente_id': alerta.ingrediente_id,
+                'ingrediente': alerta.ingrediente.nombre,
+                'tipo': alerta.tipo,
+                'cantidad_disponible': str(alerta.cantidad_disponible),
+                'stock_minimo': alerta.stock_minimo,
+                'fecha_creacion': alerta.fecha_creacion.isoformat()
+            } for alerta in alertas
+        ]
+        return Response(data, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def movimientos(self, request, pk=None):
+        """
+        GET /api/ingredientes/{id}/movimientos/?desde=...&hasta=... - Libro de
+        movimientos del ingrediente, paginado por cursor. Con ?sucursal=N
+        sólo los de esa sucursal.
+        """
+        try:
+            desde = parsear_fecha(request.query_params.get('desde'))
+            hasta = parsear_fecha(request.query_params.get('hasta'), fin=True)
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        movimientos = MovimientoStock.objects.filter(ingrediente_id=pk)
+        if sucursal_id:
+            movimientos = movimientos.filter(sucursal_id=sucursal_id)
+        if desde:
+            movimientos = movimientos.filter(fecha__gte=desde)
+        if hasta:
+            movimientos = movimientos.filter(fecha__lt=hasta)
+        try:
+            movimientos, headers = paginar_por_cursor(request, movimientos)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = [
+            {
+                'id': movimiento.id,
+                'sucursal_id': movimiento.sucursal_id,
+                'tipo': movimiento.tipo,
+                'cantidad': str(movimiento.cantidad),
+                'referencia': movimiento.referencia,
+                'fecha': movimiento.fecha.isoformat()
+            } for movimiento in movimientos
+        ]
+        return Response(data, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def stock_en(self, request, pk=None):
+        """
+        GET /api/ingredientes/{id}/stock_en/?momento=...&sucursal=N - Stock
+        del ingrediente en la sucursal en un momento dado (snapshot +
+        movimientos)
+        """
+        if not Ingrediente.objects.filter(pk=pk).exists():
+            return Response(
+                {'error': 'Ingrediente no encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        try:
+            momento = parsear_fecha(request.query_params.get('momento')) or timezone.now()
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        cantidad = MovimientoService().stock_en(pk, momento, sucursal_id)
+        return Response({
+            'ingrediente_id': int(pk),
+            'momento': momento.isoformat(),
+            'cantidad': str(cantidad)
+        })
+
+def reservar_stock(datos):
+    """
+    Valida y reserva un plato ({plato_id, cantidad, pedido_id, sucursal_id}).
+    Devuelve (respuesta, status); la usan la vista sync y la async.
+    """
+    plato_id = datos.get('plato_id')
+    cantidad = datos.get('cantidad')
+    pedido_id = datos.get('pedido_id')
+
+    # Validaciones básicas
+    if not plato_id or not cantidad or not pedido_id:
+        return {'error': 'plato_id, cantidad y pedido_id son requeridos'}, status.HTTP_400_BAD_REQUEST
+
+    try:
+        plato_id = int(plato_id)
+    except (TypeError, ValueError):
+        return {'error': 'plato_id debe ser un número válido'}, status.HTTP_400_BAD_REQUEST
+    try:
+        cantidad = int(cantidad)
+        if cantidad <= 0:
+            return {'error': 'cantidad debe ser mayor a 0'}, status.HTTP_400_BAD_REQUEST
+    except (TypeError, ValueError):
+        return {'error': 'cantidad debe ser un número válido'}, status.HTTP_400_BAD_REQUEST
+    try:
+        sucursal_id = sucursal_solicitada(datos.get('sucursal_id')) or settings.SUCURSAL_PREDETERMINADA
+    except ValidationError as e:
+        return {'error': e.message}, status.HTTP_400_BAD_REQUEST
+
+    # Un reintento reciente del mismo pedido se contesta desde el cache; la
+    # clave usa los valores normalizados ("5" y 5, sin sucursal y la
+    # predeterminada son el mismo pedido)
+    lineas = [(plato_id, cantidad)]
+    respuesta = respuesta_reserva('stock', sucursal_id, pedido_id, lineas)
+    if respuesta is not None:
+        return respuesta, status.HTTP_200_OK
+
+    try:
+        stock_service = StockService()
+        reserva = stock_service.validar_y_reservar_stock(plato_id, cantidad, pedido_id, sucursal_id)
+    except ReservaDuplicada as e:
+        return {'success': False, 'message': e.message}, status.HTTP_409_CONFLICT
+    except ValidationError as e:
+        return {'success': False, 'message': str(e)}, status.HTTP_400_BAD_REQUEST
+
+    respuesta = {
+        'success': True,
+        'reserva_id': reserva.id,
+        'message': 'Stock reservado exitosamente'
+    }
+    guardar_respuesta_reserva(
+        'stock', sucursal_id, pedido_id, lineas, respuesta, settings.RESERVA_IDEMPOTENCIA_SEGUNDOS
+    )
+    return respuesta, status.HTTP_200_OK
+
+
 class StockViewSet(viewsets.ViewSet):
     
     def list(self, request):
-        stocks = Stock.objects.all()
+        """
+        GET /api/stock/ - Stock de una sucursal (?sucursal=N, por defecto la
+        predeterminada). Filtros: nombre (prefijo del ingrediente), bajo_stock.
+        Paginado por cursor (limit, cursor) y proyección con fields.
+        """
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        stocks = Stock.objects.filter(
+            sucursal_id=sucursal_id or settings.SUCURSAL_PREDETERMINADA
+        ).select_related('ingrediente')
+
+        nombre = request.query_params.get('nombre')
+        if nombre:
+            stocks = stocks.filter(ingrediente__nombre__istartswith=nombre)
+        if parametro_bool(request.query_params.get('bajo_stock')):
+            stocks = stocks.filter(bajo_minimo=True)
+
+        try:
+            stocks, headers = paginar_por_cursor(request, stocks)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = campos_solicitados(request)
         serializer = StockSerializer()
-        data = [serializer.to_representation(stock) for stock in stocks]
-        return Response(data)
+        data = [serializer.to_representation(stock, fields) for stock in stocks]
+        return Response(data, headers=headers)
     
     @action(detail=False, methods=['post'])
     def validar_reservar(self, request):
-        plato_id = request.data.get('plato_id')
-        cantidad = request.data.get('cantidad')
-        pedido_id = request.data.get('pedido_id')
-        
-        # Validaciones básicas
-        if not plato_id or not cantidad or not pedido_id:
-            return Response(
-                {'error': 'plato_id, cantidad y pedido_id son requeridos'},
-                status=status.HTTP_400_BAD_REQUEST
+        respuesta, estado = reservar_stock(request.data)
+        return Response(respuesta, status=estado)
+
+    @action(detail=False, methods=['get'])
+    def consolidado(self, request):
+        """
+        GET /api/stock/consolidado/ - Stock total de cada ingrediente sumando
+        todas las sucursales, en una sola consulta agrupada. Filtro: nombre.
+        """
+        stocks = Stock.objects.all()
+        nombre = request.query_params.get('nombre')
+        if nombre:
+            stocks = stocks.filter(ingrediente__nombre__istartswith=nombre)
+        filas = (
+            stocks.values('ingrediente_id', 'ingrediente__nombre', 'ingrediente__unidad_medida')
+            .annotate(
+                total=Sum('cantidad_disponible'),
+                sucursales=Count('pk'),
+                sucursales_bajo_minimo=Count('pk', filter=Q(bajo_minimo=True)),
             )
-        
+            .order_by('ingrediente__nombre', 'ingrediente_id')
+        )
+        data = [
+            {
+                'ingrediente_id': fila['ingrediente_id'],
+                'ingrediente': fila['ingrediente__nombre'],
+                'unidad_medida': fila['ingrediente__unidad_medida'],
+                # Mismo formato que /api/stock/ (SQLite no redondea la suma)
+                'cantidad_disponible': f"{fila['total']:.3f}",
+                'sucursales': fila['sucursales'],
+                'sucursales_bajo_minimo': fila['sucursales_bajo_minimo'],
+            } for fila in filas
+        ]
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def demanda(self, request):
+        """
+        POST /api/stock/demanda/ - Ingredientes que necesitan muchos pedidos
+        juntos contra el stock de la sucursal, sin reservar nada
+        {"sucursal_id": 1, "lineas": [{"plato_id": 1, "cantidad": 2}, ...]}
+        """
+        lineas_data = request.data.get('lineas')
+        if not lineas_data or not isinstance(lineas_data, list):
+            return Response({'error': 'lineas es requerido'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            cantidad = int(cantidad)
-            if cantidad <= 0:
-                return Response(
-                    {'error': 'cantidad debe ser mayor a 0'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except (TypeError, ValueError):
+            sucursal_id = sucursal_solicitada(request.data.get('sucursal_id'))
+            lineas = lineas_solicitadas(lineas_data)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = [
+            {
+                **fila,
+                'necesario': str(fila['necesario']),
+                'disponible': str(fila['disponible']),
+                'faltante': str(fila['faltante']),
+            } for fila in DemandaService().cobertura(lineas, sucursal_id)
+        ]
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def validar_reservar_pedido(self, request):
+        """
+        POST /api/stock/validar_reservar_pedido/ - Reservar un pedido completo
+        {"pedido_id": "...", "sucursal_id": 1, "lineas": [{"plato_id": 1, "cantidad": 2}, ...]}
+        """
+        pedido_id = request.data.get('pedido_id')
+        lineas_data = request.data.get('lineas')
+
+        if not pedido_id or not lineas_data or not isinstance(lineas_data, list):
             return Response(
-                {'error': 'cantidad debe ser un número válido'},
+                {'error': 'pedido_id y lineas son requeridos'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+        try:
+            sucursal_id = sucursal_solicitada(request.data.get('sucursal_id')) or settings.SUCURSAL_PREDETERMINADA
+            lineas = lineas_solicitadas(lineas_data)
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        respuesta = respuesta_reserva('pedido', sucursal_id, pedido_id, lineas)
+        if respuesta is not None:
+            return Response(respuesta)
+
         try:
             stock_service = StockService()
-            reserva = stock_service.validar_y_reservar_stock(plato_id, cantidad, pedido_id)
-            return Response({
+            reservas = stock_service.validar_y_reservar_pedido(lineas, pedido_id, sucursal_id)
+            respuesta = {
                 'success': True,
-                'reserva_id': reserva.id,
-                'message': 'Stock reservado exitosamente'
-            })
+                'pedido_id': pedido_id,
+                'lineas': [
+                    {
+                        'plato_id': reserva.plato_id,
+                        'cantidad': reserva.cantidad,
+                        'reserva_id': reserva.id
+                    } for reserva in reservas
+                ],
+                'message': 'Pedido reservado exitosamente'
+            }
+            guardar_respuesta_reserva(
+                'pedido', sucursal_id, pedido_id, lineas, respuesta, settings.RESERVA_IDEMPOTENCIA_SEGUNDOS
+            )
+            return Response(respuesta)
+        except ReservaDuplicada as e:
+            return Response({
+                'success': False,
+                'message': e.message
+            }, status=status.HTTP_409_CONFLICT)
         except ValidationError as e:
             return Response({
                 'success': False,
@@ -343,6 +956,175 @@ class StockViewSet(viewsets.ViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, ExportacionRenderer])
+    def exportar(self, request):
+        """
+        GET /api/stock/exportar/?formato=csv|jsonl&sucursal=N - Stock de todos
+        los ingredientes (de todas las sucursales si no se indica una)
+        """
+        try:
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        columnas, filas = Exportador().stock(sucursal_id)
+        return respuesta_exportacion(request, 'stock', columnas, filas)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def importar(self, request):
+        """
+        POST /api/stock/importar/ - Importar ingredientes y stock (multipart)
+        Campos: archivo (CSV o JSON-lines), formato (opcional), batch_size
+        (opcional), sucursal (opcional, la sucursal del conteo)
+        """
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            return Response(
+                {'error': 'archivo es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        formato = request.data.get('formato') or (
+            'jsonl' if archivo.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+        )
+        try:
+            batch_size = int(request.data.get('batch_size') or 1000)
+        except ValueError:
+            return Response(
+                {'error': 'batch_size debe ser un número válido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            sucursal_id = sucursal_solicitada(request.data.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        # El upload se recorre línea por línea, sin leerlo completo
+        lineas = codecs.iterdecode(archivo, 'utf-8-sig')
+        try:
+            resumen = ImportadorStock(batch_size=max(1, batch_size), sucursal_id=sucursal_id).importar(
+                lineas, formato
+            )
+        except (ValidationError, UnicodeDecodeError) as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'success': True, **resumen})
+
+
+class ReservaViewSet(viewsets.ViewSet):
+
+    def retrieve(self, request, pk=None):
+        try:
+            reserva = ReservaStock.objects.get(pk=pk)
+        except ReservaStock.DoesNotExist:
+            return Response(
+                {'error': 'Reserva no encontrada'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(ReservaSerializer().to_representation(reserva))
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, ExportacionRenderer])
+    def exportar(self, request):
+        """
+        GET /api/reservas/exportar/?formato=csv|jsonl&desde=...&hasta=...&sucursal=N
+        Historial de reservas filtrado por fecha_creacion
+        """
+        try:
+            desde = parsear_fecha(request.query_params.get('desde'))
+            hasta = parsear_fecha(request.query_params.get('hasta'), fin=True)
+            sucursal_id = sucursal_solicitada(request.query_params.get('sucursal'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        columnas, filas = Exportador().reservas(desde, hasta, sucursal_id)
+        return respuesta_exportacion(request, 'reservas', columnas, filas)
+
+    def _cambiar_estado(self, reservas, operacion):
+        stock_service = StockService()
+        if operacion == 'confirmar':
+            return stock_service.confirmar_reservas(reservas)
+        return stock_service.liberar_reservas(reservas)
+
+    def _transicion(self, pk, operacion, mensaje):
+        if not ReservaStock.objects.filter(pk=pk).exists():
+            return Response(
+                {'error': 'Reserva no encontrada'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        reservas = ReservaStock.objects.filter(pk=pk)
+        if not self._cambiar_estado(reservas, operacion):
+            return Response(
+                {'success': False, 'message': 'La reserva no está en estado reservado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'success': True, 'reserva_id': int(pk), 'message': mensaje})
+
+    def _transicion_pedido(self, request, operacion, mensaje):
+        pedido_id = request.data.get('pedido_id')
+        if not pedido_id:
+            return Response(
+                {'error': 'pedido_id es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            sucursal_id = sucursal_solicitada(request.data.get('sucursal_id'))
+        except ValidationError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        # El pedido_id es único dentro de cada sucursal
+        reservas = ReservaStock.objects.filter(
+            sucursal_id=sucursal_id or settings.SUCURSAL_PREDETERMINADA, pedido_id=pedido_id
+        )
+        cantidad = self._cambiar_estado(reservas, operacion)
+        return Response({
+            'success': True,
+            'pedido_id': pedido_id,
+            'reservas': cantidad,
+            'message': mensaje
+        })
+
+    @action(detail=True, methods=['post'])
+    def confirmar(self, request, pk=None):
+        """
+        POST /api/reservas/{id}/confirmar/ - Confirmar una reserva pendiente
+        """
+        return self._transicion(pk, 'confirmar', 'Reserva confirmada')
+
+    @action(detail=True, methods=['post'])
+    def liberar(self, request, pk=None):
+        """
+        POST /api/reservas/{id}/liberar/ - Liberar una reserva y devolver su stock
+        """
+        return self._transicion(pk, 'liberar', 'Reserva liberada')
+
+    @action(detail=False, methods=['post'])
+    def confirmar_pedido(self, request):
+        """
+        POST /api/reservas/confirmar_pedido/ - Confirmar todas las reservas de un pedido
+        """
+        return self._transicion_pedido(request, 'confirmar', 'Pedido confirmado')
+
+    @action(detail=False, methods=['post'])
+    def liberar_pedido(self, request):
+        """
+        POST /api/reservas/liberar_pedido/ - Liberar todas las reservas de un pedido
+        """
+        return self._transicion_pedido(request, 'liberar', 'Pedido liberado')
+
+
+class SucursalViewSet(viewsets.ViewSet):
+
+    def list(self, request):
+        """
+        GET /api/sucursales/ - Sucursales, las activas primero
+        """
+        data = [
+            {'id': sucursal.id, 'nombre': sucursal.nombre, 'activa': sucursal.activa}
+            for sucursal in Sucursal.objects.order_by('-activa', 'nombre')
+        ]
+        return Response(data)
+
+
 # -------------------- VISTAS WEB (interfaz tradicional) --------------------
 def plato_list(request):
     platos = Plato.objects.filter(activo=True).select_related('categoria')
@@ -397,8 +1179,29 @@ def plato_delete(request, pk):
 
 
 def stock_list(request):
-    stocks = Stock.objects.select_related('ingrediente').all()
-    return render(request, 'mainApp/stock_list.html', {'stocks': stocks})
+    sucursales = Sucursal.objects.filter(activa=True).order_by('nombre')
+    stocks = Stock.objects.select_related('ingrediente', 'sucursal')
+    sucursal = request.GET.get('sucursal')
+    if sucursal and sucursal.isdigit():
+        stocks = stocks.filter(sucursal_id=sucursal)
+    return render(request, 'mainApp/stock_list.html', {
+        'stocks': stocks.order_by('sucursal__nombre', 'ingrediente__nombre'),
+        'sucursales': sucursales,
+        'sucursal': sucursal,
+    })
+
+
+def stock_bajo_minimo(request):
+    try:
+        sucursal_id = sucursal_solicitada(request.GET.get('sucursal'))
+    except ValidationError as e:
+        messages.error(request, e.message)
+        sucursal_id = None
+    return render(request, 'mainApp/stock_bajo_minimo.html', {
+        'stocks': AlertaStockService().bajo_minimo(sucursal_id),
+        'sucursales': Sucursal.objects.filter(activa=True).order_by('nombre'),
+        'sucursal': sucursal_id or settings.SUCURSAL_PREDETERMINADA,
+    })
 
 
 def stock_update(request, pk):
@@ -428,20 +1231,27 @@ def stock_create(request):
 
 def simular_pedido(request):
     mensaje = None
+    sucursal_id = None
     if request.method == 'POST':
         plato_id = request.POST.get('plato_id')
         cantidad = request.POST.get('cantidad')
         pedido_id = request.POST.get('pedido_id')
         try:
             cantidad = int(cantidad)
+            sucursal_id = sucursal_solicitada(request.POST.get('sucursal_id'))
             stock_service = StockService()
-            reserva = stock_service.validar_y_reservar_stock(plato_id, cantidad, pedido_id)
+            reserva = stock_service.validar_y_reservar_stock(plato_id, cantidad, pedido_id, sucursal_id)
             mensaje = f"Reserva creada: {reserva.id}"
         except Exception as e:
             mensaje = str(e)
 
     platos = Plato.objects.filter(activo=True)
-    return render(request, 'mainApp/simular_pedido.html', {'platos': platos, 'mensaje': mensaje})
+    return render(request, 'mainApp/simular_pedido.html', {
+        'platos': platos,
+        'mensaje': mensaje,
+        'sucursales': Sucursal.objects.filter(activa=True).order_by('nombre'),
+        'sucursal': sucursal_id or settings.SUCURSAL_PREDETERMINADA,
+    })
 
 
 # -------------------- VISTAS CATEGORÍAS --------------------
@@ -517,3 +1327,151 @@ def ingrediente_delete(request, pk):
     ingrediente.delete()
     messages.success(request, 'Ingrediente eliminado')
     return redirect('ingrediente_list')
+
+
+# -------------------- VISTAS ASYNC (ASGI) --------------------
+# Versiones async del menú, la disponibilidad y la reserva para servir bajo
+# uvicorn (SERVIDOR=asgi en start.sh). DRF no tiene vistas async, así que son
+# vistas de Django que devuelven el mismo JSON que los endpoints sync. El
+# trabajo con el ORM (transacciones y bloqueos) sigue siendo sync y corre con
+# sync_to_async: bajo ASGI cada request usa su propio hilo y el worker queda
+# libre para atender otros requests mientras espera a la base.
+@require_GET
+async def menu_async(request):
+    etag, data = await sync_to_async(snapshot_menu)(construir_menu)
+    if etag_coincide(request, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = JsonResponse(data, safe=False)
+    response['ETag'] = etag
+    return response
+
+
+@require_GET
+async def disponibilidad_async(request):
+    try:
+        sucursal_id = sucursal_solicitada(request.GET.get('sucursal'))
+    except ValidationError as e:
+        return JsonResponse({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+    data = await sync_to_async(DisponibilidadService().disponibilidad)(sucursal_id)
+    return JsonResponse(data, safe=False)
+
+
+@csrf_exempt
+@require_POST
+async def validar_reservar_async(request):
+    try:
+        datos = json.loads(request.body)
+    except ValueError:
+        datos = None
+    if not isinstance(datos, dict):
+        return JsonResponse({'error': 'JSON inválido'}, status=status.HTTP_400_BAD_REQUEST)
+
+    respuesta, estado = await sync_to_async(reservar_stock)(datos)
+    return JsonResponse(respuesta, status=estado)
+
+
+# EVENTOS (SSE Y LONG-POLL)
+# Novedades de stock y disponibilidad para pantallas de cocina y carteles.
+# Esperar novedades sin ocupar un worker necesita ASGI. Bajo WSGI cada
+# conexión SSE ocupa un worker mientras dure, y el long-poll responde sin
+# esperar (el cliente queda haciendo polling común).
+def _evento_sse(evento_id, tipo, datos):
+    return f'id: {evento_id}\nevent: {tipo}\ndata: {json.dumps(datos)}\n\n'
+
+
+def _de_sucursal(nuevos, sucursal_id):
+    # Sin sucursal pedida, o en eventos sin sucursal, pasa todo
+    if sucursal_id is None:
+        return nuevos
+    return [evento for evento in nuevos if evento[2].get('sucursal_id', sucursal_id) == sucursal_id]
+
+
+async def _flujo_eventos(desde, sucursal_id=None):
+    canal = eventos.broker()
+    loop = asyncio.get_running_loop()
+    yield 'retry: 3000\n\n'
+    limite = loop.time() + settings.EVENTOS_CONEXION_SEGUNDOS
+    while (restante := limite - loop.time()) > 0:
+        ultimo, nuevos = await canal.esperar(desde, min(settings.EVENTOS_HEARTBEAT_SEGUNDOS, restante))
+        if nuevos is None:
+            yield _evento_sse(ultimo, 'reset', {})
+            desde = ultimo
+        elif nuevos:
+            enviar = await sync_to_async(NovedadesService().expandir)(_de_sucursal(nuevos, sucursal_id))
+            for evento_id, tipo, datos in enviar:
+                yield _evento_sse(evento_id, tipo, datos)
+            desde = nuevos[-1][0]
+        else:
+            # Comentario SSE: mantiene viva la conexión a través de proxies
+            yield ': ping\n\n'
+
+
+def _id_evento(valor):
+    try:
+        return max(int(valor), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+@require_GET
+async def eventos_stream(request):
+    """
+    GET /api/eventos/ - Stream SSE con eventos 'stock', 'menu' y 'reset'.
+    Retoma desde el header Last-Event-ID (o ?ultimo_id=); sin él, empieza
+    por los eventos nuevos. Con ?sucursal=N sólo envía los de esa sucursal.
+    """
+    try:
+        sucursal_id = sucursal_solicitada(request.GET.get('sucursal'))
+    except ValidationError as e:
+        return JsonResponse({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+    desde = _id_evento(request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id'))
+    if desde is None:
+        desde = await sync_to_async(eventos.broker().ultimo)()
+    response = StreamingHttpResponse(_flujo_eventos(desde, sucursal_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def eventos_poll(request):
+    """
+    GET /api/eventos/poll/?desde=N&espera=S - Long-poll: devuelve los eventos
+    posteriores a N, esperando hasta S segundos (máximo 30) si no hay.
+    Bajo WSGI no espera. Con ?sucursal=N sólo devuelve los de esa sucursal.
+    """
+    try:
+        sucursal_id = sucursal_solicitada(request.GET.get('sucursal'))
+    except ValidationError as e:
+        return JsonResponse({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+    canal = eventos.broker()
+    desde = _id_evento(request.GET.get('desde'))
+    if desde is None:
+        ultimo = await sync_to_async(canal.ultimo)()
+        return JsonResponse({'ultimo_id': ultimo, 'reset': False, 'eventos': []})
+    try:
+        espera = min(max(float(request.GET.get('espera', 25)), 0), 30)
+    except ValueError:
+        return JsonResponse({'error': 'espera debe ser un número'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI la espera bloquearía el worker que atiende el request
+        espera = 0
+
+    ultimo, nuevos = await canal.esperar(desde, espera)
+    if nuevos is None:
+        return JsonResponse({'ultimo_id': ultimo, 'reset': True, 'eventos': []})
+    enviar = await sync_to_async(NovedadesService().expandir)(_de_sucursal(nuevos, sucursal_id))
+    return JsonResponse({
+        'ultimo_id': nuevos[-1][0] if nuevos else desde,
+        'reset': False,
+        'eventos': [
+            {'id': evento_id, 'tipo': tipo, 'datos': datos}
+            for evento_id, tipo, datos in enviar
+        ],
+    })
+
+
+# MÉTRICAS
+def metricas(request):
+    return HttpResponse(exportar_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
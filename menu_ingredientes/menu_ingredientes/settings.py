@@ -45,8 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainApp.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'mainApp.middleware.ArchivosEstaticosMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -129,6 +130,69 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache (locmem por defecto; CACHE_BACKEND/CACHE_LOCATION permiten usar un
+# backend compartido entre workers, p. ej. FileBasedCache o Redis)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'menu-ingredientes'),
+    }
+}
+
+# Sucursal que se usa cuando un request o un servicio no indica otra (la
+# crea la migración 0007 con los datos que había antes de las sucursales).
+SUCURSAL_PREDETERMINADA = int(os.environ.get('SUCURSAL_PREDETERMINADA', '1'))
+
+# Minutos que una reserva puede quedar en estado 'reservado' antes de que
+# el comando expirar_reservas la libere.
+RESERVA_TTL_MINUTOS = int(os.environ.get('RESERVA_TTL_MINUTOS', '30'))
+
+# Segundos que se recuerda en cache la respuesta de una reserva para contestar
+# los reintentos del mismo pedido_id sin pasar por la base (0 = sin cache).
+RESERVA_IDEMPOTENCIA_SEGUNDOS = int(os.environ.get('RESERVA_IDEMPOTENCIA_SEGUNDOS', '60'))
+
+# RESERVA_MODO 'cola' junta las reservas de cada proceso en lotes de hasta
+# RESERVA_COLA_LOTE solicitudes o RESERVA_COLA_VENTANA_MS milisegundos y
+# confirma cada lote en una sola transacción ('directo' = una por reserva).
+# Necesita workers con hilos o ASGI: con workers sync de gunicorn los lotes
+# son de una reserva y cada una espera la ventana en vano (ver
+# cola_reservas.py).
+# RESERVA_COLA_POLITICA: 'fifo' o 'pedidos_chicos' (ver cola_reservas.py).
+RESERVA_MODO = os.environ.get('RESERVA_MODO', 'directo')
+RESERVA_COLA_VENTANA_MS = int(os.environ.get('RESERVA_COLA_VENTANA_MS', '20'))
+RESERVA_COLA_LOTE = int(os.environ.get('RESERVA_COLA_LOTE', '200'))
+RESERVA_COLA_POLITICA = os.environ.get('RESERVA_COLA_POLITICA', 'fifo')
+RESERVA_COLA_TIMEOUT = int(os.environ.get('RESERVA_COLA_TIMEOUT', '10'))
+
+# Horas de historial de reservas que el pronóstico deja sin procesar: tiene
+# que superar RESERVA_TTL_MINUTOS para que las reservas ya estén confirmadas o
+# liberadas cuando se resumen (ver pronostico.py).
+PRONOSTICO_MARGEN_HORAS = int(os.environ.get('PRONOSTICO_MARGEN_HORAS', '2'))
+
+# Segundos que se cachea /api/platos/disponibilidad/ (0 = sin cache). El
+# cache además se invalida con cada cambio de stock o del menú.
+DISPONIBILIDAD_CACHE_SEGUNDOS = int(os.environ.get('DISPONIBILIDAD_CACHE_SEGUNDOS', '60'))
+
+# Fracción de requests medidos por MetricasMiddleware (0 = apagado, 1 = todos)
+# y cantidad de repeticiones de una misma consulta que se reporta como N+1.
+METRICAS_MUESTREO = float(os.environ.get('METRICAS_MUESTREO', '1'))
+METRICAS_UMBRAL_REPETIDAS = int(os.environ.get('METRICAS_UMBRAL_REPETIDAS', '10'))
+
+# Canal de novedades de stock y menú (/api/eventos/). EVENTOS_BROKER es
+# 'memoria' (por proceso) o 'cache' (compartido entre workers a través del
+# cache de Django); EVENTOS_RETENCION es cuántos eventos se guardan para
+# retomar con Last-Event-ID. Una conexión SSE se cierra a los
+# EVENTOS_CONEXION_SEGUNDOS y el cliente se reconecta.
+EVENTOS_HABILITADOS = os.environ.get('EVENTOS_HABILITADOS', 'True') == 'True'
+EVENTOS_BROKER = os.environ.get('EVENTOS_BROKER', 'memoria')
+EVENTOS_RETENCION = int(os.environ.get('EVENTOS_RETENCION', '1000'))
+EVENTOS_HEARTBEAT_SEGUNDOS = int(os.environ.get('EVENTOS_HEARTBEAT_SEGUNDOS', '15'))
+EVENTOS_CONEXION_SEGUNDOS = int(os.environ.get('EVENTOS_CONEXION_SEGUNDOS', '300'))
+
+# Paginación por cursor de los listados de la API (?limit=N)
+API_PAGINA_TAMANIO = 100
+API_PAGINA_MAXIMA = 1000
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
@@ -2,4 +2,9 @@
 set -e
 python manage.py collectstatic --noinput
 python manage.py migrate --noinput
-gunicorn menu_ingredientes.wsgi --log-file -
+# SERVIDOR=asgi sirve con workers de uvicorn (vistas async en /api/async/)
+if [ "$SERVIDOR" = "asgi" ]; then
+    gunicorn menu_ingredientes.asgi:application -k uvicorn_worker.UvicornWorker --log-file -
+else
+    gunicorn menu_ingredientes.wsgi --log-file -
+fi